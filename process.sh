@@ -11,41 +11,63 @@ export ARPA_URL=${ARPA_URL:-http://demo.seco.tkk.fi/arpa}
 export BASE_URI="http://ldf.fi/"
 export LOG_LEVEL="DEBUG"
 
+# Cache SPARQL and ARPA responses if HTTP_CACHE is set to an SQLite file. HTTP_CACHE_MODE=replay runs offline
+# against previously recorded responses.
+if [ "$HTTP_CACHE" ]
+then
+    HTTP_CACHE_ARGS="--http_cache $HTTP_CACHE --http_cache_mode ${HTTP_CACHE_MODE:-record}"
+fi
+
+# Reference graphs (ranks, municipalities) are fetched from the endpoint once and shared by the stages
+REFERENCE_GRAPH_ARGS="--reference_graphs output/reference_graphs"
+
+# Stages are skipped if their inputs, code and arguments have not changed. Remove output/*.fingerprint files to
+# force a full run, e.g. when the WarSampo endpoint data has changed.
+
 ./convert.sh $1
 
-python src/process.py output/_casualties_initial.ttl output/_casualties_processed.ttl --arpa_pnr $ARPA_URL/pnr_municipality
-cat input/cas_additions.ttl >> output/_casualties_processed.ttl
+python src/process.py output/_casualties_initial.nt output/_casualties_processed_base.ttl --stream --incremental \
+    --arpa_pnr $ARPA_URL/pnr_municipality
+cat output/_casualties_processed_base.ttl input/cas_additions.ttl > output/_casualties_processed.ttl
 
 echo "Linking ranks"
 python src/linker.py ranks output/_casualties_processed.ttl output/_rank_links.ttl --endpoint $WARSA_ENDPOINT_URL/sparql \
-    --logfile output/logs/linker.log --loglevel $LOG_LEVEL
+    --logfile output/logs/linker.log --loglevel $LOG_LEVEL --incremental --snapshot $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
 
 echo "Linking units"
 python src/linker.py units output/_casualties_processed.ttl output/_unit_links.ttl --endpoint $WARSA_ENDPOINT_URL/sparql \
-    --arpa $ARPA_URL/warsa_casualties_actor_units --logfile output/logs/linker.log --loglevel $LOG_LEVEL
+    --arpa $ARPA_URL/warsa_casualties_actor_units --logfile output/logs/linker.log --loglevel $LOG_LEVEL --incremental --snapshot $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
 
 echo "Linking occupations"
 python src/linker.py occupations output/_casualties_processed.ttl output/_occupation_links.ttl --endpoint $WARSA_ENDPOINT_URL/sparql \
-    --logfile output/logs/linker.log --loglevel $LOG_LEVEL
+    --logfile output/logs/linker.log --loglevel $LOG_LEVEL --incremental --snapshot $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
 
 echo "Linking municipalities"
 python src/linker.py municipalities input/old_municipalities.ttl output/_munics.ttl --endpoint $WARSA_ENDPOINT_URL/sparql \
-    --arpa $ARPA_URL/pnr_municipality --logfile output/logs/linker.log --loglevel $LOG_LEVEL
+    --arpa $ARPA_URL/pnr_municipality --munic_index output/municipality_index.json \
+    --logfile output/logs/linker.log --loglevel $LOG_LEVEL --incremental $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
 
 rapper -i turtle output/_munics.ttl -o turtle > output/municipalities.ttl
 
+echo "Compiling reference data"
+python src/reference_data.py output/reference.json --cemeteries data/cemeteries.ttl \
+    --municipalities output/municipalities.ttl --endpoint $WARSA_ENDPOINT_URL/sparql \
+    --logfile output/logs/linker.log --loglevel $LOG_LEVEL $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
+
 echo "Linking persons"
 cat output/_rank_links.ttl output/_occupation_links.ttl output/_unit_links.ttl output/_casualties_processed.ttl > output/_casualties_with_links.ttl
 python src/linker.py persons output/_casualties_with_links.ttl output/_documents_links.ttl --endpoint $WARSA_ENDPOINT_URL/sparql \
-    --munics output/municipalities.ttl --logfile output/logs/linker.log --loglevel $LOG_LEVEL
+    --reference output/reference.json --linkage_model output/person_linkage_model.pickle \
+    --link_decisions output/person_link_decisions.json \
+    --logfile output/logs/linker.log --loglevel $LOG_LEVEL --incremental --snapshot $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
 
 cat output/_documents_links.ttl output/_casualties_with_links.ttl | rapper - $BASE_URI -i turtle -o turtle > output/_casualties_linked.ttl
 
 echo "Generating persons"
 python src/person_generator.py output/_casualties_linked.ttl output/municipalities.ttl $WARSA_ENDPOINT_URL output/cas_person_ \
-    --logfile output/logs/person_generator.log --loglevel $LOG_LEVEL
+    --reference output/reference.json --logfile output/logs/person_generator.log --loglevel $LOG_LEVEL --incremental --snapshot $HTTP_CACHE_ARGS $REFERENCE_GRAPH_ARGS
 
-mv output/cas_person_documents_links.ttl output/_generated_documents_links.ttl
+cp output/cas_person_documents_links.ttl output/_generated_documents_links.ttl
 
 cat output/_generated_documents_links.ttl output/_casualties_linked.ttl | rapper - $BASE_URI -i turtle -o turtle > output/casualties.ttl
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Benchmark person record linkage scoring with different numbers of cores.
+
+Uses a linkage model saved by the persons linking task (linker.py persons --linkage_model) and links the casualty
+records against themselves, which blocks and scores a similar number of record pairs as linking to Warsa persons.
+"""
+
+import argparse
+import logging
+import random
+import time
+
+import numpy as np
+
+from linkage_model import LinkageModel
+from linker import _generate_casualties_dict
+from reference_data import ReferenceData
+from snapshot import load_graph
+
+log = logging.getLogger(__name__)
+
+
+def benchmark(linkage_model, records, cores, threshold):
+    """
+    Time linking the records against themselves with each number of cores
+
+    :return: list of (cores, seconds, links) tuples
+    """
+    records_2 = {'warsa_{id}'.format(id=key): value for (key, value) in records.items()}
+    results = []
+
+    for num in cores:
+        random.seed(42)
+        np.random.seed(42)
+
+        linker = linkage_model.static_linker(num_cores=num)
+        start = time.time()
+        links = linker.match(records, records_2, threshold=threshold)
+        seconds = time.time() - start
+
+        log.info('Linked {num} records with {cores} cores in {sec:.1f}s'.format(num=len(records), cores=num,
+                                                                             sec=seconds))
+        results.append((num, seconds, sorted((tuple(pair), float(score)) for (pair, score) in links)))
+
+    return results
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Benchmark person linkage scoring with different numbers of cores",
+                                        fromfile_prefix_chars='@')
+
+    argparser.add_argument("input", help="Casualty RDF file with rank, unit and municipality links")
+    argparser.add_argument("reference", help="Compiled reference data bundle")
+    argparser.add_argument("linkage_model", help="Linkage model settings file")
+    argparser.add_argument("--cores", default=[1, 2, 4, 8], type=int, nargs='+', help="Numbers of cores to test")
+    argparser.add_argument("--limit", type=int, help="Use only the first LIMIT casualty records")
+    argparser.add_argument("--threshold", type=float, help="Match threshold, default is the saved threshold")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(filename=args.logfile,
+                        filemode='a',
+                        level=getattr(logging, args.loglevel),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    linkage_model = LinkageModel(args.linkage_model, None, [])
+    if not linkage_model.load(check_key=False):
+        exit('Could not load linkage model {file}'.format(file=args.linkage_model))
+    threshold = args.threshold if args.threshold is not None else linkage_model.threshold or 0.5
+
+    records = _generate_casualties_dict(load_graph(args.input, snapshot=True),
+                                        reference=ReferenceData.load(args.reference))
+    if args.limit:
+        records = {key: records[key] for key in sorted(records)[:args.limit]}
+
+    results = benchmark(linkage_model, records, args.cores, threshold)
+
+    baseline = results[0][1]
+    print('{:>6} {:>10} {:>14} {:>8} {:>6}'.format('cores', 'seconds', 'records/s', 'speedup', 'same'))
+    for (num, seconds, links) in results:
+        print('{:>6} {:>10.2f} {:>14.1f} {:>8.2f} {:>6}'.format(num, seconds, len(records) / seconds,
+                                                               baseline / seconds, str(links == results[0][2])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Single-pass extraction of casualty records for person record linkage.
+
+The values of each predicate are read from the graph in one pass, instead of looking them up separately for each
+death record, and joined with the municipality crosswalk and rank levels of the reference data.
+"""
+
+import logging
+from collections import defaultdict
+from collections.abc import MutableMapping
+
+from rdflib import Graph, RDF
+from rdflib.exceptions import UniquenessError
+from warsa_linkers.person_record_linkage import get_date_value
+
+from names import strip_previous_name_markup
+from namespaces import SCHEMA_CAS, SCHEMA_WARSA
+from reference_data import ReferenceData
+
+log = logging.getLogger(__name__)
+
+
+class CasualtyRecord(MutableMapping):
+    """
+    Linkage record of a casualty. Behaves like a dict of the record fields, with the values stored in slots.
+
+    >>> record = CasualtyRecord(given='Eino', family='Heino')
+    >>> record['given'], record.get('unit'), len(record)
+    ('Eino', None, 12)
+    """
+    __slots__ = ('person', 'rank', 'rank_level', 'given', 'family', 'birth_place', 'birth_begin', 'birth_end',
+                 'death_begin', 'death_end', 'activity_end', 'unit')
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __delitem__(self, field):
+        try:
+            delattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __iter__(self):
+        return (field for field in self.__slots__ if hasattr(self, field))
+
+    def __len__(self):
+        return sum(1 for field in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        for (field, value) in state.items():
+            setattr(self, field, value)
+
+
+def _predicate_values(graph: Graph, predicate):
+    """
+    :return: dict of subject -> list of objects of a predicate
+    """
+    values = defaultdict(list)
+    for (subject, obj) in graph.subject_objects(predicate):
+        values[subject].append(obj)
+    return values
+
+
+def _single(values, subject):
+    """
+    Single value of a subject, like Graph.value(subject, predicate, any=False)
+    """
+    objects = values.get(subject)
+    if not objects:
+        return None
+    if len(objects) > 1:
+        raise UniquenessError(objects)
+    return objects[0]
+
+
+def extract_casualties(graph: Graph, reference: ReferenceData):
+    """
+    Generate linkage records of the death records of a graph
+
+    :return: dict of death record URI -> CasualtyRecord
+    """
+    ranks = _predicate_values(graph, SCHEMA_CAS.rank)
+    given_names = _predicate_values(graph, SCHEMA_WARSA.given_names)
+    family_names = _predicate_values(graph, SCHEMA_WARSA.family_name)
+    birth_municipalities = _predicate_values(graph, SCHEMA_CAS.municipality_of_birth)
+    units = _predicate_values(graph, SCHEMA_CAS.unit)
+    dates_of_birth = _predicate_values(graph, SCHEMA_WARSA.date_of_birth)
+    dates_of_death = _predicate_values(graph, SCHEMA_WARSA.date_of_death)
+
+    dates = {}
+    birth_places = {}
+
+    def date(value):
+        if value not in dates:
+            dates[value] = get_date_value(value)
+        return dates[value]
+
+    def birth_place(munic):
+        if munic is None:
+            # The municipality of a missing birth place is 'None', as Graph.value(None, ...) returns None
+            return ['None']
+        if munic not in birth_places:
+            munics = reference.municipalities.get(str(munic)) or [None, None, None]
+            birth_places[munic] = {munics[0] or None, munics[1] or None} - {None}
+        return list(birth_places[munic])
+
+    casualties = {}
+    for person in graph.subjects(RDF.type, SCHEMA_WARSA.DeathRecord):
+        person_ranks = ranks.get(person)
+        rank_uri = person_ranks[0] if person_ranks else None
+        person_units = units.get(person)
+        births = dates_of_birth.get(person)
+        deaths = dates_of_death.get(person)
+
+        datebirth = date(births[0] if births else '')
+        datedeath = date(deaths[0] if deaths else '')
+
+        casualties[str(person)] = CasualtyRecord(
+            rank=[str(rank_uri)] if rank_uri else None,
+            rank_level=reference.rank_level(rank_uri) if rank_uri else None,
+            given=str(_single(given_names, person)),
+            family=strip_previous_name_markup(str(_single(family_names, person))),
+            birth_place=birth_place(_single(birth_municipalities, person)),
+            birth_begin=datebirth,
+            birth_end=datebirth,
+            death_begin=datedeath,
+            death_end=datedeath,
+            activity_end=datedeath,
+            unit=sorted(str(unit) for unit in person_units) if person_units else None,
+        )
+
+    log.info('Got {} casualty persons'.format(len(casualties)))
+
+    return casualties
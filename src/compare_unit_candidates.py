@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Compare unit links made with ARPA unit candidates and with the local unit label index.
+
+Links the units of the casualties with both candidate sources (linker.py units --unit_candidates arpa|local), and
+writes the death records whose unit links differ to a CSV file.
+"""
+
+import argparse
+import csv
+import logging
+import time
+
+from rdflib import Graph, RDF
+
+import http_cache
+import reference_graphs
+from linker import link_units
+from namespaces import SCHEMA_CAS, SCHEMA_WARSA
+from snapshot import load_graph
+
+log = logging.getLogger(__name__)
+
+SOURCES = ['arpa', 'local']
+
+
+def compare(graph: Graph, endpoint, arpa_url, arpa_workers=1):
+    """
+    Link units with both candidate sources
+
+    :return: dict of candidate source -> seconds, and list of (death record, unit literal, ARPA units, local units)
+        of the death records whose links differ
+    """
+    seconds = {}
+    links = {}
+    for source in SOURCES:
+        start = time.time()
+        links[source] = link_units(graph, endpoint, arpa_url, arpa_workers, unit_candidates=source)
+        seconds[source] = time.time() - start
+        log.info('Linked units with {source} candidates in {sec:.1f}s'.format(source=source, sec=seconds[source]))
+
+    differences = []
+    for person in sorted(graph.subjects(RDF.type, SCHEMA_WARSA.DeathRecord)):
+        units = [sorted(str(unit) for unit in links[source].objects(person, SCHEMA_CAS.unit)) for source in SOURCES]
+        if units[0] != units[1]:
+            differences.append((str(person), str(graph.value(person, SCHEMA_CAS.unit_literal)), units[0], units[1]))
+
+    return seconds, differences
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Compare unit links of ARPA and local unit candidates",
+                                        fromfile_prefix_chars='@')
+
+    argparser.add_argument("input", help="Casualty RDF file")
+    argparser.add_argument("output", help="CSV file of the death records whose unit links differ")
+    argparser.add_argument("--endpoint", default='http://ldf.fi/warsa/sparql', help="SPARQL Endpoint")
+    argparser.add_argument("--arpa", default='http://demo.seco.tkk.fi/arpa/warsa_casualties_actor_units',
+                           help="ARPA unit candidate service URL")
+    argparser.add_argument("--arpa_workers", default=4, type=int, help="Number of concurrent ARPA queries")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+    http_cache.add_arguments(argparser)
+    reference_graphs.add_arguments(argparser)
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(filename=args.logfile,
+                        filemode='a',
+                        level=getattr(logging, args.loglevel),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    http_cache.install_from_args(args)
+    reference_graphs.install_from_args(args)
+
+    graph = load_graph(args.input, snapshot=True)
+    seconds, differences = compare(graph, args.endpoint, args.arpa, args.arpa_workers)
+
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['death_record', 'unit_literal', 'arpa_units', 'local_units'])
+        for (person, unit_literal, arpa_units, local_units) in differences:
+            writer.writerow([person, unit_literal, ' '.join(arpa_units), ' '.join(local_units)])
+
+    records = len(list(graph.subjects(RDF.type, SCHEMA_WARSA.DeathRecord)))
+    missing = sum(1 for (person, literal, arpa_units, local_units) in differences if not local_units)
+    extra = sum(1 for (person, literal, arpa_units, local_units) in differences if not arpa_units)
+
+    print('{:>8} {:>10}'.format('source', 'seconds'))
+    for source in SOURCES:
+        print('{:>8} {:>10.2f}'.format(source, seconds[source]))
+    print('Death records: {num}'.format(num=records))
+    print('Same unit links: {num}'.format(num=records - len(differences)))
+    print('Linked only with ARPA candidates: {num}'.format(num=missing))
+    print('Linked only with local candidates: {num}'.format(num=extra))
+    print('Linked to different units: {num}'.format(num=len(differences) - missing - extra))
+
+    http_cache.uninstall()
+
+
+if __name__ == '__main__':
+    main()
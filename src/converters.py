@@ -6,11 +6,13 @@ Converters for CSV cell data
 
 import datetime
 import logging
-import re
+from collections import OrderedDict
 
+import pandas as pd
 from rdflib import Graph, Literal
 from slugify import slugify
 
+from names import split_raw_name, unify_raw_previous_name
 from namespaces import *
 
 
@@ -18,6 +20,14 @@ log = logging.getLogger(__name__)
 
 DISALLOWED_ADDITIONAL_INFORMATION = ['kuolemanrangaistus', 'teloitettu', 'ammuttu']
 
+DATE_CORRECTIONS = [
+    ('26.02.0194', '26.02.1944'),
+    ('03.07.0194', '03.07.1944'),
+    ('13.09.0194', '13.09.1943'),
+    ('18.09.0041', '18.09.1941'),
+    ('16.12.0199', '16.12.1939'),
+]
+
 
 def convert_dates(raw_date: str):
     """
@@ -35,11 +45,8 @@ def convert_dates(raw_date: str):
 
     # Corrections based on manual inspection of erroneous dates
     datestr = str(raw_date).strip().replace('O', '0').replace(',', '.')
-    datestr = datestr.replace('26.02.0194', '26.02.1944')
-    datestr = datestr.replace('03.07.0194', '03.07.1944')
-    datestr = datestr.replace('13.09.0194', '13.09.1943')
-    datestr = datestr.replace('18.09.0041', '18.09.1941')
-    datestr = datestr.replace('16.12.0199', '16.12.1939')
+    for (faulty, corrected) in DATE_CORRECTIONS:
+        datestr = datestr.replace(faulty, corrected)
 
     try:
         date = datetime.datetime.strptime(datestr, '%d.%m.%Y').date()
@@ -58,6 +65,121 @@ def convert_dates(raw_date: str):
     return date
 
 
+def convert_dates_column(raw_dates):
+    """
+    Convert a column of date strings to iso8601 dates, giving the same results as applying convert_dates to
+    each value.
+
+    Well-formed dates (dd.mm.yyyy after corrections) are parsed with pandas in one go, everything else is
+    handed over to convert_dates.
+
+    :param raw_dates: sequence of raw date strings from the CSV
+    :return: list of converted values
+    """
+    raw_dates = pd.Series(raw_dates, dtype=object)
+
+    datestrs = raw_dates.str.strip().str.replace('O', '0', regex=False).str.replace(',', '.', regex=False)
+    for (faulty, corrected) in DATE_CORRECTIONS:
+        datestrs = datestrs.str.replace(faulty, corrected, regex=False)
+
+    parsed = pd.to_datetime(datestrs.where(datestrs.str.match(r'^\d{2}\.\d{2}\.\d{4}$')),
+                            format='%d.%m.%Y', errors='coerce')
+
+    return [date.date() if not pd.isnull(date) else convert_dates(raw_date)
+            for (raw_date, date) in zip(raw_dates, parsed)]
+
+
+def convert_column(raw_values, converter):
+    """
+    Apply a cell converter to a column of raw values.
+
+    :param raw_values: sequence of raw values
+    :param converter: cell converter (from the mapping)
+    :return: list of converted values
+    """
+    if converter is convert_dates:
+        return convert_dates_column(raw_values)
+
+    return [converter(value) for value in raw_values]
+
+
+class MemoizedConverter:
+    """
+    Bounded LRU memoization of a cell conversion function, keyed by the raw cell value.
+    Keeps count of cache hits and misses.
+    """
+
+    def __init__(self, function, cache_size=0):
+        """
+        :param function: conversion function taking the raw value as the only argument
+        :param cache_size: maximum number of cached values, 0 disables caching
+        """
+        self.function = function
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, raw_value):
+        if not self.cache_size:
+            return self.function(raw_value)
+
+        try:
+            result = self.cache[raw_value]
+            self.cache.move_to_end(raw_value)
+            self.hits += 1
+            return result
+        except KeyError:
+            self.misses += 1
+
+        result = self.function(raw_value)
+        self.cache[raw_value] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return result
+
+    def convert_distinct(self, raw_values, counts, convert_values=None):
+        """
+        Convert the distinct raw values of a column, using the cache. Each value counts as a lookup for every cell
+        it occurs in, so the hits and misses are the same as when converting the cells one by one.
+
+        :param raw_values: distinct raw values
+        :param counts: number of cells with each raw value
+        :param convert_values: function converting a list of raw values at once, used for the values not in the
+                               cache instead of calling the conversion function for each value
+        :return: list of converted values
+        """
+        results = [None] * len(raw_values)
+        missing = []
+        for (i, raw_value) in enumerate(raw_values):
+            if self.cache_size and raw_value in self.cache:
+                results[i] = self.cache[raw_value]
+                self.cache.move_to_end(raw_value)
+                self.hits += counts[i]
+            else:
+                missing.append(i)
+
+        missing_values = [raw_values[i] for i in missing]
+        if convert_values:
+            converted = convert_values(missing_values)
+        else:
+            converted = [self.function(raw_value) for raw_value in missing_values]
+
+        for (i, result) in zip(missing, converted):
+            results[i] = result
+            if not self.cache_size:
+                continue
+
+            self.misses += 1
+            self.hits += counts[i] - 1
+            self.cache[raw_values[i]] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return results
+
+
 def convert_person_name(raw_name: str):
     """
     Unify name syntax and split into first names and last name
@@ -65,17 +187,12 @@ def convert_person_name(raw_name: str):
     :param raw_name: Original name string
     :return: tuple containing first names, last name and full name
     """
-    re_name_split = \
-        r'([A-ZÅÄÖÜÉÓÁ/\-]+(?:\s+\(?E(?:NT)?[\.\s]+[A-ZÅÄÖÜÉÓÁ/\-]+)?\)?)\s*(?:(VON))?,?\s*([A-ZÅÄÖÜÉÓÁ/\- \(\)0-9,.]*)'
-
     fullname = raw_name.upper()
 
-    namematch = re.search(re_name_split, fullname)
-    (lastname, extra, firstnames) = namematch.groups() if namematch else (fullname, None, '')
+    (lastname, extra, firstnames) = split_raw_name(fullname)
 
     # Unify syntax for previous names
-    prev_name_regex = r'([A-ZÅÄÖÜÉÓÁ/\-]{2}) +\(?(E(?:NT)?[\.\s]+)([A-ZÅÄÖÜÉÓÁ/\-]+)\)?'
-    lastname = re.sub(prev_name_regex, r'\1 (ent. \3)', str(lastname))
+    lastname = unify_raw_previous_name(str(lastname))
 
     lastname = lastname.title().replace('(Ent. ', '(ent. ')
     firstnames = firstnames.title()
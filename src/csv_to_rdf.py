@@ -2,13 +2,193 @@
 #  -*- coding: UTF-8 -*-
 
 import argparse
+import csv
 import datetime
 import logging
+import multiprocessing
+import os
+import re
+import sys
+from functools import partial
+from io import StringIO
+from itertools import islice
+
+import numpy as np
+import openpyxl
 import pandas as pd
 
 from rdflib import URIRef, Graph, Literal, RDF, XSD
+from converters import convert_column, MemoizedConverter
+from error_report import ErrorReport
+from incremental import Stage
 from mapping import CASUALTY_MAPPING, GRAVEYARD_MAPPING
 from namespaces import DCT, SKOS, SCHEMA_CAS, SCHEMA_WARSA, bind_namespaces, CEMETERIES, DATA_CAS
+from ntriples import NTriplesWriter
+from reference_data import ReferenceData
+
+# Mapper used by the worker processes of RDFMapper.process_parallel, inherited by forking as the mapping
+# contains lambdas and can't be pickled
+_worker_mapper = None
+
+
+def _map_chunk(chunk):
+    """
+    Map a chunk of rows in a worker process.
+
+    :param chunk: tuple of (start, stop, batch)
+    :return: triples of each row of the chunk, and errors
+    """
+    (start, stop, batch) = chunk
+    mapper = _worker_mapper
+    mapper.errors = []
+    for cell_converter in mapper.cell_converters.values():
+        cell_converter.hits = cell_converter.misses = 0
+
+    if batch:
+        rows = mapper.map_table_to_rdf(mapper.table.iloc[start:stop])
+    else:
+        rows = mapper.map_rows(mapper.table.index[start:stop])
+    rows = [list(row_triples) for row_triples in rows]
+
+    cache_stats = {column_name: (cell_converter.hits, cell_converter.misses)
+                   for (column_name, cell_converter) in mapper.cell_converters.items()}
+
+    return rows, mapper.errors, cache_stats
+
+
+# Excel number format tokens of dates and times, quoted text, escaped characters and [...] sections
+RE_DATE_TOKEN = re.compile(r'yyyy|yy|mmmm|mmm|mm|m|dddd|ddd|dd|d|hh|h|ss|s|"[^"]*"|\\.|\[[^\]]*\]|.', re.IGNORECASE)
+
+# Number formats of zero-padded integers and fixed decimals, e.g. 0000 and 0.00
+RE_FIXED_NUMBER_FORMAT = re.compile(r'(0+)(?:\.(0+))?')
+
+# Formats shown in the short date format of the locale, which is Finnish for the casualty data
+DEFAULT_DATE_FORMATS = ['General', 'mm-dd-yy']
+
+
+def format_xlsx_date(value, number_format):
+    """
+    Format a date cell value as shown with its number format
+
+    >>> format_xlsx_date(datetime.datetime(1906, 12, 3), 'd.m.yyyy')
+    '3.12.1906'
+    >>> format_xlsx_date(datetime.datetime(1906, 12, 3, 14, 5), 'yyyy-mm-dd hh:mm')
+    '1906-12-03 14:05'
+    >>> format_xlsx_date(datetime.datetime(1906, 12, 3), 'mm-dd-yy')
+    '03.12.1906'
+    """
+    if number_format in DEFAULT_DATE_FORMATS:
+        return value.strftime('%d.%m.%Y')
+
+    tokens = RE_DATE_TOKEN.findall(number_format.split(';')[0])
+    parts = []
+    for (i, token) in enumerate(tokens):
+        lower = token.lower()
+        if lower in ('m', 'mm'):
+            # Minutes if following hours or followed by seconds, otherwise month
+            previous = [t.lower() for t in tokens[:i] if t.lower() in ('h', 'hh', 'd', 'dd', 'yy', 'yyyy', 's', 'ss')]
+            following = [t.lower() for t in tokens[i + 1:] if t.lower() in ('d', 'dd', 'yy', 'yyyy', 's', 'ss')]
+            minutes = (previous and previous[-1] in ('h', 'hh')) or (following and following[0] in ('s', 'ss'))
+            number = value.minute if minutes else value.month
+            parts.append('{:02d}'.format(number) if lower == 'mm' else str(number))
+        elif lower in ('d', 'dd', 'h', 'hh', 's', 'ss'):
+            number = {'d': value.day, 'h': value.hour, 's': value.second}[lower[0]]
+            parts.append('{:02d}'.format(number) if len(lower) == 2 else str(number))
+        elif lower == 'yyyy':
+            parts.append('{:04d}'.format(value.year))
+        elif lower == 'yy':
+            parts.append('{:02d}'.format(value.year % 100))
+        elif lower in ('mmm', 'mmmm', 'ddd', 'dddd'):
+            parts.append(value.strftime({'mmm': '%b', 'mmmm': '%B', 'ddd': '%a', 'dddd': '%A'}[lower]))
+        elif token.startswith('"'):
+            parts.append(token[1:-1])
+        elif token.startswith('\\'):
+            parts.append(token[1:])
+        elif not token.startswith('['):
+            parts.append(token)
+
+    return ''.join(parts)
+
+
+def format_xlsx_number(value, number_format):
+    """
+    Format a numeric cell value as shown with its number format
+
+    >>> format_xlsx_number(4, '0000'), format_xlsx_number(2.5, '0.00'), format_xlsx_number(1903.0, 'General')
+    ('0004', '2.50', '1903')
+    """
+    match = RE_FIXED_NUMBER_FORMAT.fullmatch(number_format)
+    if match:
+        decimals = len(match.group(2) or '')
+        width = len(match.group(1)) + (decimals + 1 if decimals else 0)
+        return '{value:0{width}.{decimals}f}'.format(value=value, width=width, decimals=decimals)
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def format_xlsx_cell(cell):
+    """
+    Format a cell like in a CSV export of the sheet with the cell values as shown
+    """
+    value = cell.value
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return format_xlsx_date(value, cell.number_format)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return format_xlsx_number(value, cell.number_format)
+    return str(value)
+
+
+class CSVRowStream:
+    """
+    Read-only text stream of rows formatted as CSV while the stream is read, so that rows can be read in
+    with pandas.read_csv without writing all of them into a buffer first
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ''
+
+    def _next_row(self):
+        row = next(self.rows, None)
+        if row is None:
+            return ''
+
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.writer.writerow(row)
+        return self.buffer.getvalue()
+
+    def read(self, size=-1):
+        chunks = [self.pending]
+        length = len(self.pending)
+        while size is None or size < 0 or length < size:
+            text = self._next_row()
+            if not text:
+                break
+            chunks.append(text)
+            length += len(text)
+
+        data = ''.join(chunks)
+        if size is None or size < 0:
+            self.pending = ''
+            return data
+
+        self.pending = data[size:]
+        return data[:size]
+
+    def readline(self):
+        line = self.pending or self._next_row()
+        self.pending = ''
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, '')
 
 
 class RDFMapper:
@@ -16,15 +196,18 @@ class RDFMapper:
     Map tabular data (currently pandas DataFrame) to RDF. Create a class instance of each row.
     """
 
-    def __init__(self, mapping, instance_class, cemeteries=(), loglevel='WARNING'):
+    def __init__(self, mapping, instance_class, cemeteries=(), loglevel='WARNING', errors='output/errors.csv'):
         self.mapping = mapping
         self.instance_class = instance_class
         self.table = None
         self.data = Graph()
+        self.data_stream = None
         self.schema = Graph()
-        # self.errors = pd.DataFrame(columns=['nro', 'sarake', 'virhe', 'arvo'])
-        self.errors = []
-        self.cemeteries = cemeteries
+        self.errors = ErrorReport(errors)
+        self.cemeteries = set(cemeteries)
+        self.cell_converters = {column_name: MemoizedConverter(partial(self.convert_cell, column_mapping),
+                                                               column_mapping.get('cache_size', 0))
+                                for (column_name, column_mapping) in mapping.items()}
 
         logging.basicConfig(filename='casualties.log',
                             filemode='a',
@@ -44,6 +227,7 @@ class RDFMapper:
         """
         row_rdf = Graph()
         row_errors = []
+        name = ' '.join(row[1:3])
 
         # Loop through the mapping dict and convert data to RDF
         for column_name in self.mapping:
@@ -51,31 +235,13 @@ class RDFMapper:
             mapping = self.mapping[column_name]
             value = row[column_name]
 
-            value = str(value).strip()
-            conv_error = None
-            original_value = value
-
-            converter = mapping.get('converter')
-            validator = mapping.get('validator')
-            value = converter(value) if converter else value
-            conv_error = validator(value, original_value) if validator else None
-
-            name = ' '.join(row[1:3])
+            original_value = str(value).strip()
+            rdf_value, conv_error = self.cell_converters[column_name](original_value)
 
             if conv_error:
                 row_errors.append([person_id, name, column_name, conv_error, original_value])
 
-            if value not in [None, '']:
-                if type(value) == datetime.date:
-                    rdf_value = Literal(value, datatype=XSD.date)
-                elif type(value) == URIRef:
-                    rdf_value = value
-                else:
-                    rdf_value = Literal(value)
-
-                if mapping.get('value_uri_base'):
-                    rdf_value = URIRef(mapping['value_uri_base'] + value)
-
+            if rdf_value is not None:
                 row_rdf.add((entity_uri, mapping['uri'], rdf_value))
 
         if row_rdf:
@@ -91,26 +257,96 @@ class RDFMapper:
 
         return row_rdf
 
-    def convert_graveyards(self, uri, graph: Graph):
+    @classmethod
+    def convert_cell(cls, mapping, original_value):
         """
-        Convert graveyard information into URIs. Check if the created URI exists in cemeteries ontology.
+        Convert and validate a single cell value.
+
+        :param mapping: mapping of the column
+        :param original_value: stripped cell value
+        :return: tuple of RDF term (or None if there is no value) and conversion error
+        """
+        converter = mapping.get('converter')
+        validator = mapping.get('validator')
+        value = converter(original_value) if converter else original_value
+        conv_error = validator(value, original_value) if validator else None
+
+        return cls.convert_to_rdf_value(value, mapping), conv_error
+
+    @classmethod
+    def convert_cells(cls, mapping, original_values):
+        """
+        Convert and validate a list of cell values of a column, giving the same results as convert_cell for
+        each value.
+
+        :param mapping: mapping of the column
+        :param original_values: stripped cell values
+        :return: list of tuples of RDF term (or None if there is no value) and conversion error
+        """
+        converter = mapping.get('converter')
+        validator = mapping.get('validator')
+        values = convert_column(original_values, converter) if converter else list(original_values)
+        conv_errors = [validator(value, original_value) for (value, original_value) in
+                       zip(values, original_values)] if validator else [None] * len(values)
+
+        return [(cls.convert_to_rdf_value(value, mapping), conv_error)
+                for (value, conv_error) in zip(values, conv_errors)]
+
+    @staticmethod
+    def convert_to_rdf_value(value, mapping):
+        """
+        Convert a converted cell value into an RDF term.
+
+        :param value: converted cell value
+        :param mapping: mapping of the column
+        :return: RDF term, or None if there is no value
+        """
+        if value in [None, '']:
+            return None
+
+        if type(value) == datetime.date:
+            rdf_value = Literal(value, datatype=XSD.date)
+        elif type(value) == URIRef:
+            rdf_value = value
+        else:
+            rdf_value = Literal(value)
+
+        if mapping.get('value_uri_base'):
+            rdf_value = URIRef(mapping['value_uri_base'] + value)
+
+        return rdf_value
+
+    def resolve_graveyard(self, uri, mun, gy):
+        """
+        Resolve the cemetery of a person from burial municipality and graveyard number.
+
+        :return: cemetery URI, or None if the cemetery was not found
         """
-        mun = graph.value(uri, SCHEMA_CAS.municipality_of_burial)
         if not mun or str(mun) == 'X':
-            return graph
+            return None
 
-        gy = graph.value(uri, SCHEMA_CAS.graveyard_number)
         gy_uri = '{base}h{mun}'.format(base=CEMETERIES, mun=str(mun).split('/k')[-1])
         # mun_uri = '{base}k{mun}'.format(base=KUNNAT, mun=mun)
         if gy:
             gy_uri += '_{gy}'.format(gy=gy)
         else:
-            return graph
+            return None
 
         gy_uri = URIRef(GRAVEYARD_MAPPING.get(gy_uri, gy_uri))
 
         if gy_uri not in self.cemeteries:
             logging.info('Cemetery {gy} not found for person {p}'.format(gy=gy_uri, p=uri))
+            return None
+
+        return gy_uri
+
+    def convert_graveyards(self, uri, graph: Graph):
+        """
+        Convert graveyard information into URIs. Check if the created URI exists in cemeteries ontology.
+        """
+        gy = graph.value(uri, SCHEMA_CAS.graveyard_number)
+        gy_uri = self.resolve_graveyard(uri, graph.value(uri, SCHEMA_CAS.municipality_of_burial), gy)
+        if not gy_uri:
             return graph
 
         if str(gy).isnumeric():
@@ -120,11 +356,73 @@ class RDFMapper:
 
         return graph
 
-    def read_csv(self, csv_input):
+    def map_table_to_rdf(self, table):
+        """
+        Map a whole table to RDF column by column. Each mapping column is converted, validated and turned into
+        RDF terms once per distinct value, and triples are materialized only after all columns are done.
+
+        Produces the same triples and errors as calling map_row_to_rdf for each row.
+
+        :param table: tabular data, person index numbers in the first column
+        :return: generator of a list of triples for each row
+        """
+        person_ids = list(table.iloc[:, 0])
+        names = list(table.iloc[:, 2].astype(str) + ' ' + table.iloc[:, 3].astype(str))
+
+        columns = []
+        for column_name in self.mapping:
+            mapping = self.mapping[column_name]
+
+            codes, original_values = pd.factorize(table[column_name].astype(str).str.strip().values)
+            original_values = list(original_values)
+
+            converted = self.cell_converters[column_name].convert_distinct(
+                original_values, np.bincount(codes, minlength=len(original_values)),
+                partial(self.convert_cells, mapping))
+
+            columns.append((column_name, mapping['uri'], codes, original_values,
+                            [rdf_value for (rdf_value, conv_error) in converted],
+                            [conv_error for (rdf_value, conv_error) in converted]))
+
+        self.log.info('Converted {num} columns, materializing triples'.format(num=len(columns)))
+
+        for (index, person_id) in enumerate(person_ids):
+            entity_uri = DATA_CAS['p' + str(person_id)]
+            row_triples = []
+            row_values = {}
+
+            for (column_name, prop, codes, original_values, rdf_values, conv_errors) in columns:
+                code = codes[index]
+                if conv_errors[code]:
+                    self.errors.append([person_id, names[index], column_name, conv_errors[code],
+                                        original_values[code]])
+
+                if rdf_values[code] is not None:
+                    row_triples.append((entity_uri, prop, rdf_values[code]))
+                    row_values[prop] = rdf_values[code]
+
+            if row_triples:
+                row_triples.append((entity_uri, RDF.type, self.instance_class))
+
+                gy = row_values.get(SCHEMA_CAS.graveyard_number)
+                gy_uri = self.resolve_graveyard(entity_uri, row_values.get(SCHEMA_CAS.municipality_of_burial), gy)
+                if gy_uri:
+                    if str(gy).isnumeric():
+                        row_triples.append((entity_uri, SCHEMA_WARSA.buried_in, gy_uri))
+                    row_triples.remove((entity_uri, SCHEMA_CAS.graveyard_number, gy))
+            else:
+                # Don't create class instance if there is no data about it
+                logging.debug('No data found for {uri}'.format(uri=entity_uri))
+                self.errors.append([person_id, names[index], '', 'Ei tietoa henkilöstä', ''])
+
+            yield row_triples
+
+    def read_csv(self, csv_input, limit=None):
         """
         Read in a CSV files using pandas.read_csv
 
         :param csv_input: CSV input (filename or buffer)
+        :param limit: maximum number of rows to read
         """
         def strip_upper(value):
             return value.strip().upper() if value else None
@@ -137,7 +435,7 @@ class RDFMapper:
 
         csv_data = pd.read_csv(csv_input, encoding='UTF-8', index_col=False, sep=',', quotechar='"',
                                # parse_dates=[1], infer_datetime_format=True, dayfirst=True,
-                               na_values=[' '],
+                               na_values=[' '], nrows=limit,
                                converters={
                                    'AMMATTI': lambda x: x.lower().strip(),
                                    'ASKUNTA': x_stripper,
@@ -161,35 +459,137 @@ class RDFMapper:
         logging.info('Read {num} rows from CSV'.format(num=len(self.table)))
         self.log.info('Data read from CSV %s' % csv_input)
 
+    def read_xlsx(self, xlsx_input, limit=None):
+        """
+        Read in the first sheet of an XLSX file. Rows are streamed from a read-only workbook and stop being read
+        when the limit is reached. Cells are formatted as shown, like in a CSV export of the sheet, and read in
+        with read_csv as they are formatted, so that the same column converters apply.
+
+        :param xlsx_input: XLSX input (filename or buffer)
+        :param limit: maximum number of rows to read
+        """
+        workbook = openpyxl.load_workbook(xlsx_input, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows()
+        if limit is not None:
+            rows = islice(rows, limit + 1)  # Header row and data rows
+
+        self.read_csv(CSVRowStream([format_xlsx_cell(cell) for cell in row] for row in rows))
+        workbook.close()
+
+        self.log.info('Data read from XLSX %s' % xlsx_input)
+
+    def stream_data(self, destination):
+        """
+        Write data triples to an N-Triples file while rows are processed, instead of collecting them into
+        self.data. The file is gzipped if the filename ends with .gz
+
+        :param destination: N-Triples file name
+        """
+        self.data_stream = NTriplesWriter(destination)
+
+    def add_row(self, row_triples):
+        """
+        Add triples of a single row to the data graph or the data stream
+        """
+        if self.data_stream:
+            self.data_stream.write(row_triples)
+        else:
+            for triple in row_triples:
+                self.data.add(triple)
+
     def serialize(self, destination_data, destination_schema):
         """
-        Serialize RDF graphs
+        Serialize RDF graphs. If the data has been streamed, only the schema is serialized.
 
         :param destination_data: serialization destination for data
         :param destination_schema: serialization destination for schema
         :return: output from rdflib.Graph.serialize
         """
-        bind_namespaces(self.data)
         bind_namespaces(self.schema)
 
-        data = self.data.serialize(format="turtle", destination=destination_data)
+        if self.data_stream:
+            self.data_stream.close()
+            data = None
+        else:
+            bind_namespaces(self.data)
+            data = self.data.serialize(format="turtle", destination=destination_data)
+            self.log.info('Data serialized to %s' % destination_data)
+
         schema = self.schema.serialize(format="turtle", destination=destination_schema)
-        self.log.info('Data serialized to %s' % destination_data)
         self.log.info('Schema serialized to %s' % destination_schema)
 
         return data, schema  # Return for testing purposes
 
-    def process_rows(self):
+    def map_rows(self, index):
         """
-        Loop through CSV rows and convert them to RDF
+        Map rows of the table to RDF one by one
+
+        :param index: index labels of the rows
+        :return: generator of row graphs
         """
-        for index in self.table.index:
-            person_id = self.table.ix[index][0]
+        for label in index:
+            person_id = self.table.ix[label][0]
             person_uri = DATA_CAS['p' + str(person_id)]
-            row_rdf = self.map_row_to_rdf(person_uri, self.table.ix[index][1:], person_id=person_id)
+            row_rdf = self.map_row_to_rdf(person_uri, self.table.ix[label][1:], person_id=person_id)
             if row_rdf:
-                self.data += row_rdf
+                yield row_rdf
+
+    def process_rows(self):
+        """
+        Loop through CSV rows and convert them to RDF
+        """
+        for row_rdf in self.map_rows(self.table.index):
+            self.add_row(row_rdf)
 
+        self.finalize()
+
+    def process_columns(self):
+        """
+        Convert the CSV to RDF column by column (batch mode)
+        """
+        for row_triples in self.map_table_to_rdf(self.table):
+            self.add_row(row_triples)
+
+        self.finalize()
+
+    def process_parallel(self, workers, batch=False, chunk_size=1000):
+        """
+        Convert the CSV to RDF in chunks of rows using a pool of worker processes. Triples and errors are merged
+        in the original row order, so the output is identical to a serial run. Each worker has its own conversion
+        caches, so there are fewer cache hits than in a serial run.
+
+        :param workers: number of worker processes, 0 for one per CPU core
+        :param batch: convert the chunks column by column instead of row by row
+        :param chunk_size: number of rows in a chunk
+        """
+        global _worker_mapper
+
+        workers = workers or os.cpu_count()
+        chunks = [(start, min(start + chunk_size, len(self.table)), batch)
+                  for start in range(0, len(self.table), chunk_size)]
+
+        self.log.info('Converting {num} chunks of rows with {workers} worker processes'.
+                      format(num=len(chunks), workers=workers))
+
+        _worker_mapper = self
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for (rows, errors, cache_stats) in pool.imap(_map_chunk, chunks):
+                    for row_triples in rows:
+                        self.add_row(row_triples)
+                    self.errors.extend(errors)
+                    for (column_name, (hits, misses)) in cache_stats.items():
+                        self.cell_converters[column_name].hits += hits
+                        self.cell_converters[column_name].misses += misses
+        finally:
+            _worker_mapper = None
+
+        self.finalize()
+
+    def finalize(self):
+        """
+        Create the schema and write conversion errors
+        """
         for prop in self.mapping.values():
             self.schema.add((prop['uri'], RDF.type, RDF.Property))
             if 'name_fi' in prop:
@@ -199,28 +599,89 @@ class RDFMapper:
             if 'description_fi' in prop:
                 self.schema.add((prop['uri'], DCT.description, Literal(prop['description_fi'], lang='fi')))
 
-        error_df = pd.DataFrame(columns=['nro', 'nimi', 'sarake', 'virhe', 'arvo'], data=self.errors)
-        error_df.to_csv('output/errors.csv', ',', index=False)
+        self.errors.close()
+        self.log.info('Wrote {num} conversion errors'.format(num=len(self.errors)))
+
+        self.log_cache_statistics()
+
+    def log_cache_statistics(self):
+        """
+        Log hits and misses of the cell conversion caches
+        """
+        for (column_name, cell_converter) in self.cell_converters.items():
+            lookups = cell_converter.hits + cell_converter.misses
+            if not lookups:
+                continue
+
+            self.log.info('Conversion cache of column {col}: {hits} hits, {misses} misses ({ratio:.1%} hit rate)'.
+                          format(col=column_name, hits=cell_converter.hits, misses=cell_converter.misses,
+                                 ratio=cell_converter.hits / lookups))
 
 
 if __name__ == "__main__":
 
     argparser = argparse.ArgumentParser(description="Process casualties CSV", fromfile_prefix_chars='@')
 
-    argparser.add_argument("input", help="Input CSV file")
-    argparser.add_argument("cemeteries", help="Input cemeteries turtle file")
+    argparser.add_argument("input", help="Input CSV or XLSX file")
+    argparser.add_argument("cemeteries", help="Input cemeteries turtle file, or compiled reference data (.json)")
     argparser.add_argument("--outdata", help="Output file to serialize RDF dataset to (.ttl)", default=None)
     argparser.add_argument("--outschema", help="Output file to serialize RDF schema to (.ttl)", default=None)
+    argparser.add_argument("--batch", action='store_true',
+                           help="Convert column by column instead of row by row. Produces identical output.")
+    argparser.add_argument("--stream", action='store_true',
+                           help="Write data as N-Triples to --outdata while rows are processed, instead of "
+                                "serializing one big graph at the end. Output is gzipped if --outdata ends with .gz")
+    argparser.add_argument("--workers", default=1, type=int,
+                           help="Number of worker processes to convert with, 0 uses all CPU cores. Default is 1.")
+    argparser.add_argument("--limit", default=None, type=int, help="Convert only the topmost LIMIT rows")
+    argparser.add_argument("--errors", default='output/errors.csv',
+                           help="Output CSV file for conversion errors. Error counts are written next to it "
+                                "with a _summary suffix. Default is output/errors.csv")
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--incremental", action='store_true',
+                           help="Skip conversion if inputs, code and arguments have not changed since the last run")
 
     args = argparser.parse_args()
 
-    cemetery_uris = list(Graph().parse(args.cemeteries, format='turtle').subjects())
+    if args.stream and not args.outdata:
+        argparser.error('--stream requires --outdata')
+    if args.incremental and not args.outdata:
+        argparser.error('--incremental requires --outdata')
+
+    logging.basicConfig(filename='casualties.log',
+                        filemode='a',
+                        level=getattr(logging, args.loglevel.upper()),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    stage = Stage(args.outdata, [args.input, args.cemeteries],
+                  [args.outdata, args.outschema, args.errors, ErrorReport(args.errors).summary_destination], args)
+    if args.incremental and stage.up_to_date():
+        logging.info('Conversion is up to date, skipping')
+        sys.exit()
+
+    if args.cemeteries.endswith('.json'):
+        cemetery_uris = ReferenceData.load(args.cemeteries).cemeteries
+    else:
+        cemetery_uris = list(Graph().parse(args.cemeteries, format='turtle').subjects())
     mapper = RDFMapper(CASUALTY_MAPPING, SCHEMA_WARSA.DeathRecord, cemeteries=cemetery_uris,
-                       loglevel=args.loglevel.upper())
-    mapper.read_csv(args.input)
-
-    mapper.process_rows()
+                       loglevel=args.loglevel.upper(), errors=args.errors)
+    if args.input.endswith('.xlsx'):
+        mapper.read_xlsx(args.input, limit=args.limit)
+    else:
+        mapper.read_csv(args.input, limit=args.limit)
+
+    if args.stream:
+        mapper.stream_data(args.outdata)
+
+    if args.workers != 1:
+        mapper.process_parallel(args.workers, batch=args.batch)
+    elif args.batch:
+        mapper.process_columns()
+    else:
+        mapper.process_rows()
 
     mapper.serialize(args.outdata, args.outschema)
+
+    if args.incremental:
+        stage.record()
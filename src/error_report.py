@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Conversion error report
+"""
+
+import csv
+import logging
+import re
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+RE_ERROR_VALUE = re.compile(r'\[.*?\]')
+
+
+def error_type(error: str):
+    """
+    Get the type of an error message by removing the values quoted in it
+
+    >>> error_type('Tulkittu nimi [Heino, Eino] poikkeaa alkuperäisestä')
+    'Tulkittu nimi [] poikkeaa alkuperäisestä'
+    """
+    return RE_ERROR_VALUE.sub('[]', error)
+
+
+class ErrorReport:
+    """
+    Sink for conversion errors. Errors are written to a CSV file as they come in, and counted per column and
+    error type for a summary written when the report is closed.
+    """
+
+    COLUMNS = ['nro', 'nimi', 'sarake', 'virhe', 'arvo']
+    SUMMARY_COLUMNS = ['sarake', 'virhe', 'lkm']
+    FLUSH_INTERVAL = 1000
+
+    def __init__(self, destination, summary_destination=None):
+        """
+        :param destination: CSV file name or file object for error rows
+        :param summary_destination: CSV file name or file object for error counts, by default the destination
+                                    file name with a _summary suffix
+        """
+        if summary_destination is None and isinstance(destination, str):
+            summary_destination = re.sub(r'(\.csv)?$', r'_summary\1', destination, count=1)
+
+        self.destination = destination
+        self.summary_destination = summary_destination
+        self.file = None
+        self.writer = None
+        self.counts = Counter()
+        self.count = 0
+
+    def _open(self):
+        if isinstance(self.destination, str):
+            self.file = open(self.destination, 'w', encoding='UTF-8', newline='')
+        else:
+            self.file = self.destination
+
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.writer.writerow(self.COLUMNS)
+
+    def append(self, error):
+        """
+        Write a single error row: person index number, name, column, error message, original value
+        """
+        if not self.writer:
+            self._open()
+
+        self.writer.writerow(error)
+        self.counts[(error[2], error_type(error[3]))] += 1
+        self.count += 1
+
+        if not self.count % self.FLUSH_INTERVAL:
+            self.file.flush()
+
+    def extend(self, errors):
+        for error in errors:
+            self.append(error)
+
+    def __len__(self):
+        return self.count
+
+    def summary(self):
+        """
+        Get error counts per column and error type, most common first
+
+        :return: list of [column, error type, count]
+        """
+        return [[column, error, count] for ((column, error), count) in
+                sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))]
+
+    def close(self):
+        """
+        Finish the error file and write the summary
+        """
+        if not self.writer:
+            self._open()
+
+        if isinstance(self.destination, str):
+            self.file.close()
+        else:
+            self.file.flush()
+
+        summary = self.summary()
+        for (column, error, count) in summary:
+            log.info('{count} errors in column "{col}": {error}'.format(count=count, col=column, error=error))
+
+        if self.summary_destination is None:
+            return
+
+        if isinstance(self.summary_destination, str):
+            with open(self.summary_destination, 'w', encoding='UTF-8', newline='') as summary_file:
+                self._write_summary(summary_file, summary)
+        else:
+            self._write_summary(self.summary_destination, summary)
+
+    def _write_summary(self, summary_file, summary):
+        writer = csv.writer(summary_file, lineterminator='\n')
+        writer.writerow(self.SUMMARY_COLUMNS)
+        writer.writerows(summary)
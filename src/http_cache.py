@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Persistent cache for HTTP calls to SPARQL endpoints and ARPA services.
+
+Responses of requests made with the requests library (including ARPA queries) are stored in an SQLite database,
+keyed by method, URL and normalized query. Graphs read with read_graph_from_sparql are cached in the same database.
+
+Modes:
+    record: use cached responses, and make and store the requests that are not cached
+    replay: use only cached responses, raising CacheMissError for requests that are not cached (offline runs)
+    bypass: do not use the cache
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+from rdf_dm import read_graph_from_sparql as read_graph
+from rdflib import Graph
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+
+MODES = ['record', 'replay', 'bypass']
+
+# Whitespace outside of quoted SPARQL literals, which are matched as such to leave them unchanged
+RE_QUERY_WHITESPACE = re.compile(r'"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\'|'
+                                 r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|\s+')
+
+# Parameters that are SPARQL queries or updates, other parameter values are only stripped
+QUERY_PARAMETERS = ['query', 'update']
+
+# Response content is stored decoded
+DROPPED_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding']
+
+_cache = None
+_original_request = requests.Session.request
+
+
+class CacheMissError(Exception):
+    """
+    Request is not in the cache in replay mode
+    """
+
+
+def normalize_query(query):
+    """
+    Collapse whitespace in a SPARQL query, except inside quoted literals
+
+    >>> normalize_query(' SELECT * {\\n  ?s ?p "JR  8" } ')
+    'SELECT * { ?s ?p "JR  8" }'
+    """
+    return RE_QUERY_WHITESPACE.sub(lambda m: ' ' if m.group(0)[0].isspace() else m.group(0), query).strip()
+
+
+def normalize_body(data):
+    """
+    Normalize a request body so that queries differing only in whitespace outside literals or in parameter order
+    share a cache entry
+
+    >>> normalize_body({'query': 'SELECT *\\n   WHERE { ?s ?p ?o }'})
+    'query=SELECT+%2A+WHERE+%7B+%3Fs+%3Fp+%3Fo+%7D'
+    """
+    if data is None:
+        return ''
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+    if isinstance(data, dict):
+        return urlencode(sorted((key, normalize_query(str(value)) if key in QUERY_PARAMETERS else str(value).strip())
+                                for (key, value) in data.items()))
+    if isinstance(data, (list, tuple)):
+        return normalize_body(dict(data))
+
+    return normalize_query(str(data))
+
+
+def cache_key(method, url, params=None, data=None):
+    key = '\n'.join([method.upper(), url, normalize_body(params), normalize_body(data)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite backed response store with age and size based eviction. Safe to use from multiple threads.
+    """
+
+    def __init__(self, filename, mode='record', max_age=None, max_size=None):
+        """
+        :param filename: SQLite database file
+        :param mode: record, replay or bypass
+        :param max_age: maximum age of a cached response in seconds, older responses are discarded
+        :param max_size: maximum total size of cached responses in bytes, least recently used are evicted
+        """
+        if mode not in MODES:
+            raise ValueError('Unknown cache mode: {mode}'.format(mode=mode))
+
+        self.filename = filename
+        self.mode = mode
+        self.max_age = max_age
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, status INTEGER, '
+                        'headers TEXT, content BLOB, size INTEGER, created REAL, used REAL)')
+        self.db.commit()
+
+    def get(self, key):
+        """
+        :return: tuple of status, headers and content, or None if not cached
+        """
+        with self.lock:
+            row = self.db.execute('SELECT status, headers, content, created FROM responses WHERE key = ?',
+                                  (key,)).fetchone()
+            if row and self.max_age is not None and time.time() - row[3] > self.max_age:
+                self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.db.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.db.execute('UPDATE responses SET used = ? WHERE key = ?', (time.time(), key))
+            self.db.commit()
+            return row[0], json.loads(row[1]), row[2]
+
+    def put(self, key, url, status, headers, content):
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (key, url, status, json.dumps(dict(headers)), content, len(content), now, now))
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        if self.max_age is not None:
+            self.db.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.max_age,))
+
+        if self.max_size is None:
+            return
+
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        for (key, size) in self.db.execute('SELECT key, size FROM responses ORDER BY used').fetchall():
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def close(self):
+        log.info('HTTP cache {file}: {hits} hits, {misses} misses'.
+                 format(file=self.filename, hits=self.hits, misses=self.misses))
+        with self.lock:
+            self.db.close()
+
+
+def _build_response(url, status, headers, content):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = content
+    response.url = url
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def _cached_request(session, method, url, params=None, data=None, **kwargs):
+    if _cache is None or _cache.mode == 'bypass' or method.upper() not in ['GET', 'POST']:
+        return _original_request(session, method, url, params=params, data=data, **kwargs)
+
+    key = cache_key(method, url, params, data if data is not None else kwargs.get('json'))
+    cached = _cache.get(key)
+    if cached:
+        return _build_response(url, *cached)
+
+    if _cache.mode == 'replay':
+        raise CacheMissError('No cached response for {method} {url}'.format(method=method, url=url))
+
+    response = _original_request(session, method, url, params=params, data=data, **kwargs)
+    if response.status_code == 200:
+        headers = {name: value for (name, value) in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        _cache.put(key, url, response.status_code, headers, response.content)
+
+    return response
+
+
+def is_replaying():
+    """
+    Check whether requests are answered only from the cache
+    """
+    return _cache is not None and _cache.mode == 'replay'
+
+
+def install(filename, mode='record', max_age=None, max_size=None):
+    """
+    Start caching responses of the requests library
+    """
+    global _cache
+
+    uninstall()
+    _cache = ResponseCache(filename, mode=mode, max_age=max_age, max_size=max_size)
+    requests.Session.request = _cached_request
+    log.info('Using HTTP cache {file} in {mode} mode'.format(file=filename, mode=mode))
+    return _cache
+
+
+def uninstall():
+    global _cache
+
+    requests.Session.request = _original_request
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def read_graph_from_sparql(endpoint, graph_name=None):
+    """
+    Read a named graph from a SPARQL endpoint, using the cache if it is installed
+    """
+    if _cache is None or _cache.mode == 'bypass':
+        return read_graph(endpoint, graph_name=graph_name)
+
+    key = cache_key('GRAPH', endpoint, data=graph_name)
+    cached = _cache.get(key)
+    if cached:
+        return Graph().parse(data=cached[2].decode('utf-8'), format='nt')
+
+    if _cache.mode == 'replay':
+        raise CacheMissError('No cached graph {graph} from {endpoint}'.format(graph=graph_name, endpoint=endpoint))
+
+    graph = read_graph(endpoint, graph_name=graph_name)
+    content = graph.serialize(format='nt')
+    _cache.put(key, endpoint, 200, {}, content if isinstance(content, bytes) else content.encode('utf-8'))
+    return graph
+
+
+def add_arguments(argparser):
+    """
+    Add HTTP cache options to an argument parser
+    """
+    argparser.add_argument("--http_cache", help="SQLite file to cache SPARQL and ARPA responses in")
+    argparser.add_argument("--http_cache_mode", default='record', choices=MODES,
+                           help="record: use and add to the cache, replay: only use cached responses, "
+                                "bypass: do not use the cache. Default is record.")
+    argparser.add_argument("--http_cache_max_age", type=float, help="Maximum age of cached responses in seconds")
+    argparser.add_argument("--http_cache_max_size", type=int,
+                           help="Maximum total size of cached responses in bytes")
+
+
+def install_from_args(args):
+    if args.http_cache:
+        return install(args.http_cache, mode=args.http_cache_mode, max_age=args.http_cache_max_age,
+                       max_size=args.http_cache_max_size)
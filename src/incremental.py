@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Content-hash based skipping of pipeline stages.
+
+A stage records a fingerprint of its input files, the code of the local modules it uses and its arguments next to
+its output. When the stage is run again with the same fingerprint and the outputs have not been changed since,
+it can be skipped.
+
+Data read from SPARQL endpoints or ARPA services is not part of the fingerprint. Remove the fingerprint file to
+force a stage to run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+
+log = logging.getLogger(__name__)
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Arguments that do not affect the output
+IGNORED_ARGS = ['loglevel', 'logfile', 'incremental', 'http_cache', 'http_cache_mode', 'http_cache_max_age',
+                'http_cache_max_size', 'linkage_model', 'cores', 'munic_index', 'link_decisions', 'reference_graphs',
+                'reference_graphs_max_age']
+
+
+def file_hash(filename, block_size=1024 * 1024):
+    """
+    SHA-256 hash of a file, or None if the file does not exist
+    """
+    if not os.path.exists(filename):
+        return None
+
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def code_hashes():
+    """
+    Hashes of the local modules (in the same directory as this module) that have been imported
+    """
+    hashes = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if filename and os.path.dirname(os.path.abspath(filename)) == SRC_DIR and filename.endswith('.py'):
+            hashes[os.path.basename(filename)] = file_hash(filename)
+
+    return hashes
+
+
+class Stage:
+    """
+    Fingerprint of a pipeline stage. The fingerprint is stored as JSON in <fingerprint_file>.fingerprint
+    """
+
+    def __init__(self, fingerprint_file, inputs, outputs, args=None):
+        """
+        :param fingerprint_file: file name to store the fingerprint next to, usually the main output
+        :param inputs: input file names
+        :param outputs: output file names
+        :param args: argparse arguments of the stage
+        """
+        self.filename = '{file}.fingerprint'.format(file=fingerprint_file)
+        self.inputs = [str(input_file) for input_file in inputs if input_file]
+        self.outputs = [str(output) for output in outputs if output]
+        args = vars(args) if args else {}
+        self.args = {key: value for (key, value) in sorted(args.items()) if key not in IGNORED_ARGS}
+
+    def fingerprint(self):
+        return {
+            'inputs': {input_file: file_hash(input_file) for input_file in self.inputs},
+            'code': code_hashes(),
+            'args': json.loads(json.dumps(self.args, default=str)),
+        }
+
+    def _read(self):
+        try:
+            with open(self.filename, encoding='UTF-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def up_to_date(self):
+        """
+        Check whether the stage has already been run with the same inputs, code and arguments, and the outputs
+        are unchanged.
+        """
+        recorded = self._read()
+        if not recorded:
+            log.info('No fingerprint found in {file}'.format(file=self.filename))
+            return False
+
+        fingerprint = self.fingerprint()
+        for key in ['inputs', 'code', 'args']:
+            if recorded.get(key) != fingerprint[key]:
+                log.info('Stage {key} have changed since {file}'.format(key=key, file=self.filename))
+                return False
+
+        outputs = recorded.get('outputs', {})
+        for output in self.outputs:
+            if outputs.get(output) is None or outputs.get(output) != file_hash(output):
+                log.info('Output {output} is missing or has changed'.format(output=output))
+                return False
+
+        log.info('Outputs are up to date with {file}, skipping stage'.format(file=self.filename))
+        return True
+
+    def record(self):
+        """
+        Record the fingerprint after the stage has written its outputs
+        """
+        fingerprint = self.fingerprint()
+        fingerprint['outputs'] = {output: file_hash(output) for output in self.outputs}
+
+        with open(self.filename, 'w', encoding='UTF-8') as f:
+            json.dump(fingerprint, f, indent=2, sort_keys=True)
+
+        log.info('Recorded fingerprint to {file}'.format(file=self.filename))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Store of previous person link decisions for incremental person linking.
+
+The store keeps a fingerprint of the linkage features of every record of both linked datasets (casualties and Warsa
+persons), and the scored record pairs above the threshold. On the next run the records are blocked against all Warsa
+persons as in a full run, and only the blocked pairs with a new or changed record are scored. The scores of pairs of
+unchanged records are reused, and the links are chosen from all scored pairs as dedupe does.
+
+Blocking with index predicates (e.g. TF-IDF canopies of string fields) depends on all indexed Warsa persons, so if
+the linkage model uses index predicates and any Warsa person has changed, all pairs are scored again. This way the
+links are always the same as when scoring all records.
+
+The store is used by link_persons of warsa_linkers through dedupe.RecordLink, whose match method is replaced
+while the store is in use.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+
+import dedupe
+from dedupe.core import BlockingError, scoreDuplicates
+
+log = logging.getLogger(__name__)
+
+_original_match = dedupe.RecordLink.match
+
+
+def _normalize(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sorted(_normalize(item) for item in value)
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return str(value)
+
+
+def record_fingerprint(record):
+    """
+    Fingerprint of the linkage features of a record
+
+    >>> record_fingerprint({'given': 'Eino', 'unit': ['b', 'a']}) == record_fingerprint({'unit': ('a', 'b'),
+    ...                                                                                   'given': 'Eino'})
+    True
+    """
+    content = json.dumps({field: _normalize(value) for (field, value) in dict(record).items()}, sort_keys=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def uses_index_predicates(linker):
+    """
+    Check whether the blocking of a linker depends on an index of all the records it is linked to
+    """
+    return bool(getattr(linker.blocker, 'index_fields', True))
+
+
+def score_pairs(linker, data_1, data_2, threshold, select=None):
+    """
+    Score the blocked record pairs of two datasets. The blocking indexes all records of data_2.
+
+    :param select: function (id_1, id_2) -> bool choosing the blocked pairs to score, by default all are scored
+    :return: list of ((id_1, id_2), score) of the pairs scoring at least threshold
+    """
+    if not data_1 or not data_2:
+        return []
+
+    linker.blocker.resetIndices()
+    candidates = itertools.chain.from_iterable(linker._blockedPairs(linker._blockData(data_1, data_2)))
+    if select:
+        candidates = (pair for pair in candidates if select(pair[0][0], pair[1][0]))
+
+    try:
+        scored = scoreDuplicates(candidates, linker.data_model, linker.classifier, linker.num_cores)
+    except BlockingError:
+        return []
+
+    return [((id_1, id_2), float(score)) for ((id_1, id_2), score) in scored if score >= threshold]
+
+
+def greedy_links(scored_pairs):
+    """
+    Choose the links from scored pairs like dedupe record linkage: best scoring pairs first, each record in at most
+    one link
+
+    >>> greedy_links([(('a', 'x'), 0.9), (('b', 'x'), 0.95), (('a', 'y'), 0.7)])
+    [(('b', 'x'), 0.95), (('a', 'y'), 0.7)]
+    """
+    linked_1 = set()
+    linked_2 = set()
+    links = []
+    for ((id_1, id_2), score) in sorted(scored_pairs, key=lambda pair: (pair[1], str(pair[0][0]), str(pair[0][1])),
+                                        reverse=True):
+        if id_1 not in linked_1 and id_2 not in linked_2:
+            linked_1.add(id_1)
+            linked_2.add(id_2)
+            links.append(((id_1, id_2), score))
+
+    return links
+
+
+class LinkDecisionStore:
+    """
+    Previous link decisions stored as JSON. Use as a context manager around link_persons.
+    """
+
+    def __init__(self, filename, key):
+        """
+        :param filename: JSON file of previous decisions
+        :param key: key of the linkage model and fields, decisions made with a different key are not reused
+        """
+        self.filename = filename
+        self.key = key
+        self.rescored = None
+
+    def _read(self):
+        try:
+            with open(self.filename, encoding='UTF-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, fingerprints_1, fingerprints_2, pairs):
+        with open(self.filename, 'w', encoding='UTF-8') as f:
+            json.dump({'key': key,
+                       'records_1': fingerprints_1,
+                       'records_2': fingerprints_2,
+                       'pairs': [[str(id_1), str(id_2), score] for ((id_1, id_2), score) in pairs]},
+                      f)
+
+        log.info('Saved {num} scored pairs to {file}'.format(num=len(pairs), file=self.filename))
+
+    def match(self, linker, data_1, data_2, threshold=0.5, generator=False):
+        """
+        Link the records of data_1 and data_2, reusing the scores of unchanged record pairs
+        """
+        key = '{key}:{threshold}'.format(key=self.key, threshold=float(threshold))
+        fingerprints_1 = {str(id_1): record_fingerprint(record) for (id_1, record) in data_1.items()}
+        fingerprints_2 = {str(id_2): record_fingerprint(record) for (id_2, record) in data_2.items()}
+
+        previous = self._read()
+        if not previous or previous.get('key') != key:
+            log.info('No reusable link decisions in {file}, scoring all records'.format(file=self.filename))
+            previous = None
+        elif previous['records_2'] != fingerprints_2 and uses_index_predicates(linker):
+            log.info('Warsa persons have changed and blocking uses index predicates, scoring all records')
+            previous = None
+
+        if previous is None:
+            pairs = score_pairs(linker, data_1, data_2, threshold)
+            self.rescored = (len(data_1), len(data_2))
+        else:
+            changed_1 = {id_1 for (id_1, fp) in fingerprints_1.items() if previous['records_1'].get(id_1) != fp}
+            changed_2 = {id_2 for (id_2, fp) in fingerprints_2.items() if previous['records_2'].get(id_2) != fp}
+
+            ids_1 = {str(id_1): id_1 for id_1 in data_1}
+            ids_2 = {str(id_2): id_2 for id_2 in data_2}
+            reused = [((ids_1[id_1], ids_2[id_2]), score) for (id_1, id_2, score) in previous['pairs']
+                      if id_1 in ids_1 and id_2 in ids_2 and id_1 not in changed_1 and id_2 not in changed_2]
+
+            log.info('Reusing {num} scored pairs, scoring the pairs of {c1} changed records and {c2} changed Warsa '
+                     'persons'.format(num=len(reused), c1=len(changed_1), c2=len(changed_2)))
+
+            if changed_1 or changed_2:
+                pairs = reused + score_pairs(linker, data_1, data_2, threshold,
+                                             select=lambda id_1, id_2: str(id_1) in changed_1 or str(id_2) in changed_2)
+            else:
+                pairs = reused
+            self.rescored = (len(changed_1), len(changed_2))
+
+        self._write(key, fingerprints_1, fingerprints_2, pairs)
+        links = greedy_links(pairs)
+
+        return iter(links) if generator else links
+
+    def __enter__(self):
+        store = self
+
+        def match(linker, data_1, data_2, threshold=0.5, generator=False):
+            return store.match(linker, data_1, data_2, threshold=threshold, generator=generator)
+
+        dedupe.RecordLink.match = match
+        return self
+
+    def __exit__(self, *exc):
+        dedupe.RecordLink.match = _original_match
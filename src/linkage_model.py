@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Persistence of the learned person record linkage model.
+
+Sampling and training the dedupe model dominates the person linking task. The learned data model, classifier,
+blocking predicates and threshold are saved to a settings file, keyed by a hash of the training links and the field
+definitions. When the key matches on a later run, the saved model is used and only the scoring runs.
+
+The model is used by link_persons of warsa_linkers through dedupe.RecordLink, whose training methods are replaced
+while the model is in use.
+"""
+
+import hashlib
+import json
+import logging
+import pickle
+from contextlib import contextmanager
+
+import dedupe
+from dedupe import blocking
+
+log = logging.getLogger(__name__)
+
+_original_methods = {name: getattr(dedupe.RecordLink, name) for name in ['sample', 'markPairs', 'train', 'threshold']}
+_original_init = dedupe.RecordLink.__init__
+
+
+def _field_value(value):
+    if callable(value):
+        return '{module}.{name}'.format(module=value.__module__, name=value.__qualname__)
+    return value
+
+
+def model_key(training_links, data_fields):
+    """
+    Hash of the training links and field definitions that the model is learned from
+
+    >>> key = model_key({'match': []}, [{'field': 'given', 'type': 'String'}])
+    >>> key == model_key({'match': []}, [{'type': 'String', 'field': 'given'}])
+    True
+    >>> key == model_key({'match': []}, [{'field': 'family', 'type': 'String'}])
+    False
+    """
+    fields = [{key: _field_value(value) for (key, value) in field.items()} for field in data_fields]
+    content = json.dumps([training_links, fields], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class LinkageModel:
+    """
+    Learned linkage model stored in a settings file. Use as a context manager around link_persons.
+    """
+
+    def __init__(self, filename, training_links, data_fields):
+        """
+        :param filename: settings file to load the model from and save it to
+        :param training_links: training links the model is learned from
+        :param data_fields: dedupe field definitions
+        """
+        self.filename = filename
+        self.key = model_key(training_links, data_fields)
+        self.data_model = None
+        self.classifier = None
+        self.predicates = None
+        self.threshold = None
+
+    def load(self, check_key=True):
+        """
+        Load the model if the settings file has been written with the same key
+
+        :param check_key: if False, load the model regardless of what it was learned from
+        :return: True if the model was loaded
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                header = pickle.load(f)
+                if check_key and header.get('key') != self.key:
+                    log.info('Linkage model in {file} was learned from different training data or fields'.
+                             format(file=self.filename))
+                    return False
+
+                self.data_model = pickle.load(f)
+                self.classifier = pickle.load(f)
+                self.predicates = pickle.load(f)
+                self.threshold = header.get('threshold')
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            log.info('Could not load linkage model from {file}: {err}'.format(file=self.filename, err=e))
+            return False
+
+        log.info('Loaded linkage model from {file} with threshold {threshold}'.
+                 format(file=self.filename, threshold=self.threshold))
+        return True
+
+    @property
+    def loaded(self):
+        return self.data_model is not None
+
+    def save(self, linker):
+        """
+        Save the learned model of a dedupe linker
+        """
+        with open(self.filename, 'wb') as f:
+            pickle.dump({'key': self.key, 'threshold': self.threshold}, f)
+            linker.writeSettings(f)
+
+        log.info('Saved linkage model to {file} with threshold {threshold}'.
+                 format(file=self.filename, threshold=self.threshold))
+
+    def static_linker(self, num_cores=None):
+        """
+        Create a dedupe linker of the saved model without the training methods, for scoring only
+        """
+        with open(self.filename, 'rb') as f:
+            pickle.load(f)
+            return dedupe.StaticRecordLink(f, num_cores=num_cores)
+
+    def _apply(self, linker):
+        if getattr(linker, 'blocker', None) is None:
+            linker.data_model = self.data_model
+            linker.classifier = self.classifier
+            linker.predicates = self.predicates
+            linker.blocker = blocking.Blocker(self.predicates)
+
+    def __enter__(self):
+        model = self
+        self.load()
+
+        def sample(linker, *args, **kwargs):
+            if not model.loaded:
+                return _original_methods['sample'](linker, *args, **kwargs)
+
+        def mark_pairs(linker, *args, **kwargs):
+            if not model.loaded:
+                return _original_methods['markPairs'](linker, *args, **kwargs)
+
+        def train(linker, *args, **kwargs):
+            if model.loaded:
+                model._apply(linker)
+                return
+
+            _original_methods['train'](linker, *args, **kwargs)
+            model.save(linker)
+
+        def threshold(linker, *args, **kwargs):
+            if model.loaded:
+                model._apply(linker)
+                if model.threshold is not None:
+                    return model.threshold
+
+            model.threshold = _original_methods['threshold'](linker, *args, **kwargs)
+            model.save(linker)
+            return model.threshold
+
+        dedupe.RecordLink.sample = sample
+        dedupe.RecordLink.markPairs = mark_pairs
+        dedupe.RecordLink.train = train
+        dedupe.RecordLink.threshold = threshold
+        return self
+
+    def __exit__(self, *exc):
+        for (name, method) in _original_methods.items():
+            setattr(dedupe.RecordLink, name, method)
+
+
+@contextmanager
+def scoring_cores(num_cores):
+    """
+    Score the record pairs of dedupe record linkage in a pool of num_cores processes.
+
+    The scores do not depend on the number of processes, and matching sorts the scored pairs, so the links are the
+    same with any number of cores.
+    """
+    def __init__(linker, *args, **kwargs):
+        _original_init(linker, *args, **kwargs)
+        linker.num_cores = num_cores
+
+    dedupe.RecordLink.__init__ = __init__
+    log.info('Scoring record pairs with {num} cores'.format(num=num_cores))
+    try:
+        yield
+    finally:
+        dedupe.RecordLink.__init__ = _original_init
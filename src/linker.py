@@ -5,24 +5,35 @@
 import argparse
 import json
 import logging
+import os
 import random
-import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 
 import numpy as np
-import rdf_dm as r
 import requests
 from arpa_linker.arpa import ArpaMimic, process_graph, Arpa, combine_values
 from fuzzywuzzy import fuzz
 from rdflib import Graph, URIRef, Literal, RDF
-from rdflib.exceptions import UniquenessError
 from rdflib.util import guess_format
 
+import http_cache
+import reference_graphs
+from casualty_records import extract_casualties
+from incremental import Stage
+from link_decisions import LinkDecisionStore
+from linkage_model import LinkageModel, model_key, scoring_cores
 from mapping import CASUALTY_MAPPING
-from namespaces import SKOS, BIOC, SCHEMA_CAS, SCHEMA_WARSA, bind_namespaces, SCHEMA_ACTORS, CRM
-from warsa_linkers.municipalities import link_to_pnr, link_warsa_municipality
+from municipality_index import MunicipalityIndex
+from pnr_gazetteer import PNRGazetteer
+from reference_data import ReferenceData
+from snapshot import load_graph
+from unit_index import UnitIndex
+from namespaces import SKOS, BIOC, SCHEMA_CAS, SCHEMA_WARSA, bind_namespaces, CRM
+from warsa_linkers.municipalities import link_to_pnr
 from warsa_linkers.occupations import link_occupations
-from warsa_linkers.person_record_linkage import link_persons, get_date_value, intersection_comparator, \
+from warsa_linkers.person_record_linkage import link_persons, intersection_comparator, \
     activity_comparator, read_person_links
 from warsa_linkers.ranks import link_ranks
 from warsa_linkers.units import preprocessor, Validator
@@ -31,77 +42,74 @@ from warsa_linkers.units import preprocessor, Validator
 
 log = logging.getLogger(__name__)
 
+# Local files read by the linking tasks in addition to the input file
+TASK_INPUTS = {
+    'persons': ['input/person_links.json'],
+    'units': ['SPARQL/units.sparql'],
+}
+
+WARSA_MUNICIPALITIES = 'http://ldf.fi/warsa/places/municipalities'
+
 
 def _preprocess(literal, prisoner, subgraph):
     """Default preprocess implementation for link function"""
     return str(literal).strip()
 
 
-def _generate_casualties_dict(graph: Graph, ranks: Graph, munics: Graph):
+def _generate_casualties_dict(graph: Graph, ranks: Graph = None, munics: Graph = None,
+                              reference: ReferenceData = None):
     """
     Generate a persons dict from death records
-    """
-    casualties = {}
-    for person in graph[:RDF.type:SCHEMA_WARSA.DeathRecord]:
-        rank_uri = graph.value(person, SCHEMA_CAS.rank)
-
-        given = str(graph.value(person, SCHEMA_WARSA.given_names, any=False))
-        family = str(graph.value(person, SCHEMA_WARSA.family_name, any=False))
-        rank = [str(rank_uri)] if rank_uri else None
-        birth_place_uri = graph.value(person, SCHEMA_CAS.municipality_of_birth, any=False)
-        units = sorted(str(unit) for unit in graph.objects(person, SCHEMA_CAS.unit)) or None
-
-        cur_mun = str(munics.value(birth_place_uri, SCHEMA_CAS.current_municipality, any=False, default='')) or None
 
-        war_mun = str(munics.value(birth_place_uri, SCHEMA_CAS.wartime_municipality, any=False, default='')) or None
-
-        datebirth = get_date_value(graph.value(person, SCHEMA_WARSA.date_of_birth, default=''))
-        datedeath = get_date_value(graph.value(person, SCHEMA_WARSA.date_of_death, default=''))
-
-        try:
-            rank_level = int(ranks.value(rank_uri, SCHEMA_ACTORS.level, any=False))
-        except (TypeError, UniquenessError):
-            rank_level = None
-
-        casualty = {'person': None,
-                    'rank': rank,
-                    'rank_level': rank_level,
-                    'given': given,
-                    'family': re.sub(r'\(ent\.\s*(.+)\)', r'\1', family),
-                    'birth_place': list({cur_mun, war_mun} - {None}),
-                    'birth_begin': datebirth,
-                    'birth_end': datebirth,
-                    'death_begin': datedeath,
-                    'death_end': datedeath,
-                    'activity_end': datedeath,
-                    'unit': units,
-                    }
-        casualties[str(person)] = casualty
-
-    log.info('Got {} casualty persons'.format(len(casualties)))
+    :param reference: compiled reference data, built from ranks and munics graphs if not given
+    :return: dict of death record URI -> CasualtyRecord
+    """
+    if reference is None:
+        reference = ReferenceData.from_graphs(ranks=ranks, municipalities=munics)
 
-    return casualties
+    return extract_casualties(graph, reference)
 
 
-def link_municipalities(municipalities: Graph, warsa_endpoint: str, arpa_endpoint: str):
+def link_municipalities(municipalities: Graph, warsa_endpoint: str, arpa_endpoint: str, munic_index: str = None,
+                        pnr_gazetteer: str = None):
     """
     Link to Warsa municipalities.
-    """
-    warsa_munics = r.helpers.read_graph_from_sparql(warsa_endpoint,
-                                                    graph_name='http://ldf.fi/warsa/places/municipalities')
 
-    log.info('Using Warsa municipalities with {n} triples'.format(n=len(warsa_munics)))
+    :param munic_index: JSON file of the Warsa municipality label index. The index is loaded from the file if it
+                        was built from the Warsa municipalities graph in the reference graph store, otherwise it is
+                        rebuilt and saved to the file. Without a reference graph store the index is always rebuilt.
+    :param pnr_gazetteer: PNR municipalities dump file, used for linking to PNR instead of ARPA if given
+    """
+    index = None
+    source = reference_graphs.graph_checksum(warsa_endpoint, WARSA_MUNICIPALITIES)
+    if munic_index and source and os.path.exists(munic_index):
+        index = MunicipalityIndex.load(munic_index)
+        if index.source != source:
+            log.info('Warsa municipalities have changed, rebuilding the municipality index')
+            index = None
+
+    if index is None:
+        warsa_munics = reference_graphs.read_graph(warsa_endpoint, WARSA_MUNICIPALITIES)
+        log.info('Using Warsa municipalities with {n} triples'.format(n=len(warsa_munics)))
+
+        source = reference_graphs.graph_checksum(warsa_endpoint, WARSA_MUNICIPALITIES)
+        index = MunicipalityIndex.from_graph(warsa_munics, source=source)
+        if munic_index and index.source:
+            index.save(munic_index)
 
     municipalities.remove((None, SCHEMA_CAS.current_municipality, None))
     municipalities.remove((None, SCHEMA_CAS.wartime_municipality, None))
 
-    pnr_arpa = Arpa(arpa_endpoint)
-    municipalities = link_to_pnr(municipalities, SCHEMA_CAS.current_municipality, None, pnr_arpa)['graph']
+    if pnr_gazetteer:
+        municipalities = PNRGazetteer.load(pnr_gazetteer).link(municipalities, SCHEMA_CAS.current_municipality)
+    else:
+        pnr_arpa = Arpa(arpa_endpoint)
+        municipalities = link_to_pnr(municipalities, SCHEMA_CAS.current_municipality, None, pnr_arpa)['graph']
 
     for casualty_munic in list(municipalities[:RDF.type:SCHEMA_CAS.Municipality]):
         labels = list(municipalities[casualty_munic:SKOS.prefLabel:])
 
-        warsa_match = link_warsa_municipality(warsa_munics, labels)
+        warsa_match = index.match(labels)
         if warsa_match:
             municipalities.add((casualty_munic, SCHEMA_CAS.wartime_municipality, warsa_match))
 
@@ -114,11 +122,32 @@ def link_municipalities(municipalities: Graph, warsa_endpoint: str, arpa_endpoin
     return municipalities
 
 
-def link_units(graph: Graph, endpoint: str, arpa_url: str):
+def _group_by_unit_literal(graph: Graph, persons):
+    """
+    Group death records by preprocessed unit literal and whether the person died in the Winter War
+
+    :return: dict of (preprocessed unit literal, Winter War) -> list of death records, in the order of the records
+    """
+    preprocessed = {}
+    groups = {}
+    for person in persons:
+        unit_literal = str(graph.value(person, SCHEMA_CAS.unit_literal))
+        if unit_literal not in preprocessed:
+            preprocessed[unit_literal] = preprocessor(unit_literal)
+
+        winter_war = str(graph.value(person, SCHEMA_WARSA.date_of_death)) < '1941-06-25'
+        groups.setdefault((preprocessed[unit_literal], winter_war), []).append(person)
+
+    return groups
+
+
+def link_units(graph: Graph, endpoint: str, arpa_url: str, arpa_workers: int = 1, unit_candidates: str = 'arpa'):
     """
     :param graph: Data graph object
     :param endpoint: SPARQL endpoint
     :param arpa_url: Arpa URL
+    :param arpa_workers: Number of concurrent ARPA candidate queries and cover number queries
+    :param unit_candidates: 'arpa' to get unit candidates from ARPA, 'local' from an in-process unit label index
     :return: Graph with links
     """
 
@@ -127,6 +156,7 @@ def link_units(graph: Graph, endpoint: str, arpa_url: str):
             return f.read()
 
     COVER_NUMBER_SCORE_LIMIT = 20
+    COVER_NUMBER_CHUNK_SIZE = 500
 
     query_template_unit_code = """
         PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
@@ -140,16 +170,53 @@ def link_units(graph: Graph, endpoint: str, arpa_url: str):
     temp_graph = Graph()
     unit_code_links = Graph()
 
-    ngram_arpa = Arpa(arpa_url, retries=10, wait_between_tries=6)
+    if unit_candidates == 'local':
+        candidate_source = UnitIndex.from_endpoint(endpoint)
+    else:
+        candidate_source = Arpa(arpa_url, retries=10, wait_between_tries=6)
 
-    unit_codes = graph.objects(None, SCHEMA_CAS.unit_code)
+    def query_cover_numbers(covers):
+        query = query_template_unit_code.format(cover='" "'.join(covers))
+        return requests.post(endpoint, {'query': query}).json()['results']['bindings']
 
-    results = requests.post(endpoint, {'query': query_template_unit_code.format(cover='" "'.join(unit_codes))}).json()
+    # QUERY UNITS OF DISTINCT COVER NUMBERS IN CHUNKS
 
-    units = defaultdict(list)
-    for unit in results['results']['bindings']:
-        units[unit['cover']['value']].append(unit)
+    unit_codes = sorted(set(str(code) for code in graph.objects(None, SCHEMA_CAS.unit_code)))
+    chunks = [unit_codes[i:i + COVER_NUMBER_CHUNK_SIZE] for i in range(0, len(unit_codes), COVER_NUMBER_CHUNK_SIZE)]
 
+    log.info('Querying units of {num} cover numbers in {chunks} chunks'.format(num=len(unit_codes),
+                                                                             chunks=len(chunks)))
+    units = defaultdict(list)
+    with ThreadPoolExecutor(max_workers=arpa_workers) as executor:
+        for results in executor.map(query_cover_numbers, chunks):
+            for unit in results:
+                units[unit['cover']['value']].append(unit)
+
+    def best_cover_number_unit(cover, person_unit):
+        """
+        Find the unit with the cover number whose labels best match the unit literal
+        """
+        best_score = -1
+        best_unit = None
+        best_labels = None
+
+        for result in units[cover]:
+            if 'sub' not in result:
+                # This can happen because of GROUP_CONCAT
+                log.warning('Unknown cover number {cover}.'.format(cover=cover))
+                continue
+            warsa_unit = result["sub"]["value"]
+            unit_labels = result["labels"]["value"].split(' || ')
+            score = max(fuzz.ratio(unit, person_unit) for unit in unit_labels)
+            if score > best_score:
+                best_score = score
+                best_labels = unit_labels
+                best_unit = warsa_unit
+
+        return best_score, best_unit, best_labels
+
+    best_units = {}
+    candidate_persons = []
     for person in graph[:RDF.type:SCHEMA_WARSA.DeathRecord]:
         cover = graph.value(person, SCHEMA_CAS.unit_code)
 
@@ -158,21 +225,11 @@ def link_units(graph: Graph, endpoint: str, arpa_url: str):
         if cover:
             cover = str(cover)
             person_unit = str(graph.value(person, SCHEMA_CAS.unit_literal))
-            best_unit = None
-            best_labels = None
-
-            for result in units[cover]:
-                if 'sub' not in result:
-                    # This can happen because of GROUP_CONCAT
-                    log.warning('Unknown cover number {cover}.'.format(cover=cover))
-                    continue
-                warsa_unit = result["sub"]["value"]
-                unit_labels = result["labels"]["value"].split(' || ')
-                score = max(fuzz.ratio(unit, person_unit) for unit in unit_labels)
-                if score > best_score:
-                    best_score = score
-                    best_labels = unit_labels
-                    best_unit = warsa_unit
+
+            # Many death records share the same cover number and unit literal
+            if (cover, person_unit) not in best_units:
+                best_units[(cover, person_unit)] = best_cover_number_unit(cover, person_unit)
+            best_score, best_unit, best_labels = best_units[(cover, person_unit)]
 
             if best_score >= COVER_NUMBER_SCORE_LIMIT and best_unit:
                 log.info('Found unit {unit} for {pers} by cover number with score {score}.'.
@@ -184,15 +241,30 @@ def link_units(graph: Graph, endpoint: str, arpa_url: str):
                             format(unit=person_unit, cover=cover, lbls=sorted(set(best_labels or [])),
                                    score=best_score))
 
-        # NO COVER NUMBER, ADD RELATED_PERIOD FOR LINKING WITH WARSA-LINKERS
+        # NO COVER NUMBER, LINK WITH WARSA-LINKERS
         if not cover or best_score < COVER_NUMBER_SCORE_LIMIT:
-            death_time = str(graph.value(person, SCHEMA_WARSA.date_of_death))
-            if death_time < '1941-06-25':
-                temp_graph.add((person, URIRef('http://ldf.fi/schema/warsa/events/related_period'),
-                                URIRef('http://ldf.fi/warsa/conflicts/WinterWar')))
-
-            unit = preprocessor(str(graph.value(person, SCHEMA_CAS.unit_literal)))
-            ngrams = ngram_arpa.get_candidates(unit)
+            candidate_persons.append(person)
+
+    # GROUP THE REMAINING DEATH RECORDS BY UNIT LITERAL AND PERIOD, AND LINK ONE RECORD OF EACH GROUP
+
+    unit_groups = _group_by_unit_literal(graph, candidate_persons)
+    candidate_units = []
+    for ((unit, winter_war), persons) in unit_groups.items():
+        if winter_war:
+            temp_graph.add((persons[0], URIRef('http://ldf.fi/schema/warsa/events/related_period'),
+                            URIRef('http://ldf.fi/warsa/conflicts/WinterWar')))
+        candidate_units.append((persons[0], unit))
+
+    # GET UNIT CANDIDATES CONCURRENTLY, KEEPING THE ORIGINAL ORDER
+
+    log.info('Getting unit candidates from {source} for {groups} distinct unit literals of {num} death records with '
+             '{workers} concurrent queries'.format(source=unit_candidates, groups=len(candidate_units),
+                                                   num=len(candidate_persons), workers=arpa_workers))
+    with ThreadPoolExecutor(max_workers=arpa_workers) as executor:
+        all_ngrams = executor.map(candidate_source.get_candidates, [unit for (person, unit) in candidate_units])
+        for ((person, unit), ngrams) in zip(candidate_units, all_ngrams):
+            if not ngrams['results']:
+                continue
             combined = combine_values(ngrams['results'])
             temp_graph.add((person, SCHEMA_CAS.candidate, Literal(combined)))
 
@@ -200,15 +272,32 @@ def link_units(graph: Graph, endpoint: str, arpa_url: str):
 
     log.info('Linking the found candidates')
     arpa = ArpaMimic(get_query_template(), endpoint, retries=10, wait_between_tries=6)
-    unit_links = process_graph(temp_graph, SCHEMA_CAS.unit, arpa,
-                               progress=True,
-                               validator=Validator(temp_graph),
-                               new_graph=True,
-                               source_prop=SCHEMA_CAS.candidate)['graph']
+    group_links = process_graph(temp_graph, SCHEMA_CAS.unit, arpa,
+                                progress=True,
+                                validator=Validator(temp_graph),
+                                new_graph=True,
+                                source_prop=SCHEMA_CAS.candidate)['graph']
+
+    # COPY THE LINKS OF EACH GROUP TO ALL DEATH RECORDS OF THE GROUP
+
+    group_persons = {persons[0]: persons for persons in unit_groups.values()}
+    unit_links = Graph()
+    for (sub, pred, obj) in group_links:
+        for person in group_persons.get(sub, [sub]):
+            unit_links.add((person, pred, obj))
+
     return unit_links + unit_code_links
 
 
-def link_casualties(input_graph, endpoint, munics):
+def link_casualties(input_graph, endpoint, munics, reference: ReferenceData = None, linkage_model: str = None,
+                    cores: int = None, link_decisions: str = None):
+    """
+    :param munics: municipalities graph or RDF file, not used if reference data is given
+    :param reference: compiled reference data
+    :param linkage_model: settings file to save the learned linkage model to, and to load it from on later runs
+    :param cores: number of processes to score record pairs in
+    :param link_decisions: JSON file of previous link decisions, only new and changed records are scored if given
+    """
     data_fields = [
         {'field': 'given', 'type': 'String'},
         {'field': 'family', 'type': 'String'},
@@ -224,21 +313,72 @@ def link_casualties(input_graph, endpoint, munics):
         {'field': 'unit', 'type': 'Custom', 'comparator': intersection_comparator, 'has missing': True},
     ]
 
-    ranks = r.read_graph_from_sparql(endpoint, "http://ldf.fi/warsa/ranks")
-    munics = Graph().parse(munics, format=guess_format(munics))
+    if reference is None:
+        ranks = reference_graphs.read_graph(endpoint, "http://ldf.fi/warsa/ranks")
+        if not isinstance(munics, Graph):
+            munics = Graph().parse(munics, format=guess_format(munics))
+        reference = ReferenceData.from_graphs(ranks=ranks, municipalities=munics)
 
     random.seed(42)  # Initialize randomization to create deterministic results
     np.random.seed(42)
 
     training_links = read_person_links('input/person_links.json')
 
-    person_links = link_persons(endpoint, _generate_casualties_dict(input_graph, ranks, munics),
-                                data_fields, training_links,
-                                sample_size=1500000, training_size=2500000, threshold_ratio=0.85)
+    casualties = _generate_casualties_dict(input_graph, reference=reference)
+
+    with ExitStack() as stack:
+        if linkage_model:
+            stack.enter_context(LinkageModel(linkage_model, training_links, data_fields))
+        if cores:
+            stack.enter_context(scoring_cores(cores))
+        if link_decisions:
+            stack.enter_context(LinkDecisionStore(link_decisions, model_key(training_links, data_fields)))
+
+        person_links = link_persons(endpoint, casualties, data_fields, training_links,
+                                    sample_size=1500000, training_size=2500000, threshold_ratio=0.85)
 
     return person_links
 
 
+def run_task(task: str, input_graph: Graph, endpoint: str, arpa: str = None, munics=None,
+             reference: ReferenceData = None, arpa_workers: int = 1, linkage_model: str = None, cores: int = None,
+             munic_index: str = None, link_decisions: str = None, unit_candidates: str = 'arpa',
+             pnr_gazetteer: str = None):
+    """
+    Run a linking task
+
+    :param task: one of ranks, persons, municipalities, units, occupations
+    :param input_graph: input graph, casualties or municipalities
+    :param munics: municipalities graph or RDF file for person linking, not used if reference data is given
+    :param arpa_workers: number of concurrent ARPA queries in unit linking
+    :param linkage_model: settings file of the learned person linkage model
+    :param cores: number of processes to score record pairs in person linking
+    :param munic_index: JSON file to cache the Warsa municipality label index in
+    :param link_decisions: JSON file of previous person link decisions
+    :param unit_candidates: source of unit candidates, 'arpa' or 'local'
+    :param pnr_gazetteer: PNR municipalities dump file to link municipalities to PNR without ARPA
+    :return: graph of links (or linked municipalities)
+    """
+    if task == 'ranks':
+        return link_ranks(input_graph, endpoint, CASUALTY_MAPPING['SOTARVO']['uri'], SCHEMA_CAS.rank,
+                          SCHEMA_WARSA.DeathRecord)
+
+    elif task == 'persons':
+        return link_casualties(input_graph, endpoint, munics, reference, linkage_model, cores, link_decisions)
+
+    elif task == 'municipalities':
+        return link_municipalities(input_graph, endpoint, arpa, munic_index, pnr_gazetteer)
+
+    elif task == 'units':
+        return link_units(input_graph, endpoint, arpa, arpa_workers, unit_candidates)
+
+    elif task == 'occupations':
+        return link_occupations(input_graph, endpoint, CASUALTY_MAPPING['AMMATTI']['uri'],
+                                BIOC.has_occupation, SCHEMA_WARSA.DeathRecord, score_threshold=0.88)
+
+    raise ValueError('Unknown linking task: {task}'.format(task=task))
+
+
 def main():
     argparser = argparse.ArgumentParser(description="Casualty linking tasks", fromfile_prefix_chars='@')
 
@@ -252,6 +392,31 @@ def main():
     argparser.add_argument("--endpoint", default='http://ldf.fi/warsa/sparql', help="SPARQL Endpoint")
     argparser.add_argument("--munics", default='output/municipalities.ttl', help="Municipalities RDF file")
     argparser.add_argument("--arpa", type=str, help="ARPA instance URL for linking")
+    argparser.add_argument("--arpa_workers", default=4, type=int,
+                           help="Number of concurrent ARPA queries in unit linking, default is 4")
+    argparser.add_argument("--unit_candidates", default='arpa', choices=['arpa', 'local'],
+                           help="Get unit candidates from ARPA or from a local index of Warsa unit labels, "
+                                "default is arpa")
+    argparser.add_argument("--reference", help="Compiled reference data bundle, used instead of --munics and "
+                                               "the ranks graph if given")
+    argparser.add_argument("--linkage_model", help="Settings file to save the learned person linkage model to. "
+                                                   "The model is loaded from it on later runs if the training "
+                                                   "links and fields have not changed.")
+    argparser.add_argument("--munic_index", help="JSON file to cache the Warsa municipality label index in. "
+                                                 "The index is rebuilt when the Warsa municipalities graph in "
+                                                 "--reference_graphs changes, and always without it.")
+    argparser.add_argument("--pnr_gazetteer", help="PNR municipalities dump file (SPARQL/pnr_municipalities.sparql) "
+                                                   "to link municipalities to PNR with instead of ARPA")
+    argparser.add_argument("--link_decisions", help="JSON file to store person link decisions in. Only new and "
+                                                    "changed records are scored on later runs.")
+    argparser.add_argument("--cores", type=int,
+                           help="Number of processes to score record pairs in person linking")
+    argparser.add_argument("--incremental", action='store_true',
+                           help="Skip the task if inputs, code and arguments have not changed since the last run")
+    argparser.add_argument("--snapshot", action='store_true',
+                           help="Load the input from its binary snapshot if it is up to date, otherwise write one")
+    http_cache.add_arguments(argparser)
+    reference_graphs.add_arguments(argparser)
 
     args = argparser.parse_args()
 
@@ -261,34 +426,29 @@ def main():
     log.addHandler(log_handler)
     log.setLevel(args.loglevel)
 
-    input_graph = Graph()
-    input_graph.parse(args.input, format=guess_format(args.input))
-
-    if args.task == 'ranks':
-        log.info('Linking ranks')
-        bind_namespaces(link_ranks(input_graph, args.endpoint, CASUALTY_MAPPING['SOTARVO']['uri'], SCHEMA_CAS.rank,
-                                   SCHEMA_WARSA.DeathRecord)).serialize(args.output, format=guess_format(args.output))
-
-    elif args.task == 'persons':
-        log.info('Linking persons')
-        bind_namespaces(link_casualties(input_graph, args.endpoint, args.munics)) \
-            .serialize(args.output, format=guess_format(args.output))
-
-    elif args.task == 'municipalities':
-        log.info('Linking municipalities')
-        bind_namespaces(link_municipalities(input_graph, args.endpoint, args.arpa)) \
-            .serialize(args.output, format=guess_format(args.output))
-
-    elif args.task == 'units':
-        log.info('Linking units')
-        bind_namespaces(link_units(input_graph, args.endpoint, args.arpa)) \
-            .serialize(args.output, format=guess_format(args.output))
-
-    elif args.task == 'occupations':
-        log.info('Linking occupations')
-        bind_namespaces(link_occupations(input_graph, args.endpoint, CASUALTY_MAPPING['AMMATTI']['uri'],
-                                         BIOC.has_occupation, SCHEMA_WARSA.DeathRecord, score_threshold=0.88)) \
-            .serialize(args.output, format=guess_format(args.output))
+    stage = Stage(args.output, [args.input] + TASK_INPUTS.get(args.task, []) +
+                  ([args.reference or args.munics] if args.task == 'persons' else []) +
+                  ([args.pnr_gazetteer] if args.task == 'municipalities' and args.pnr_gazetteer else []),
+                  [args.output], args)
+    if args.incremental and stage.up_to_date():
+        return
+
+    http_cache.install_from_args(args)
+    reference_graphs.install_from_args(args)
+
+    input_graph = load_graph(args.input, snapshot=args.snapshot)
+
+    log.info('Linking {task}'.format(task=args.task))
+    reference = ReferenceData.load(args.reference) if args.reference else None
+    bind_namespaces(run_task(args.task, input_graph, args.endpoint, args.arpa, args.munics, reference,
+                             args.arpa_workers, args.linkage_model, args.cores, args.munic_index,
+                             args.link_decisions, args.unit_candidates, args.pnr_gazetteer)) \
+        .serialize(args.output, format=guess_format(args.output))
+
+    http_cache.uninstall()
+
+    if args.incremental:
+        stage.record()
 
 
 if __name__ == '__main__':
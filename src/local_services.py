@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Local stand-in for the Warsa and PNR SPARQL endpoints and the ARPA services, serving fixture data.
+
+Makes it possible to run and benchmark the linking tasks without the Fuseki, LAS and ARPA containers.
+
+SPARQL queries to any path ending with /sparql are evaluated against an in-memory dataset of the fixture graphs.
+Jena full-text queries (?s text:query ?q) are rewritten to label filters, as the fixtures have no text index.
+
+ARPA services are served at /arpa/<service>, using the service configurations in arpa_services/. Candidate
+generation (cgen) returns the n-grams of the text without LAS base forms, and other queries run the service query
+with the n-grams against the dataset.
+
+An optional latency is added to every response to mimic remote services.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from rdflib import ConjunctiveGraph, Literal, URIRef, BNode
+from rdflib.util import guess_format
+
+log = logging.getLogger(__name__)
+
+ARPA_SERVICE_DIR = 'arpa_services'
+
+# ?s text:query ?qstring, ?s text:query (?qstring 200) or ?s text:query "string"
+RE_TEXT_QUERY = re.compile(r'(\?\w+)\s+text:query\s+(?:\(\s*)?(\?\w+|"[^"]*")(?:\s+\d+\s*\))?\s*\.?')
+
+TEXT_FILTER = '{subject} <http://www.w3.org/2004/02/skos/core#prefLabel>|' \
+              '<http://www.w3.org/2004/02/skos/core#altLabel>|' \
+              '<http://www.w3.org/2000/01/rdf-schema#label> ?_text_label{n} . ' \
+              'FILTER(CONTAINS(LCASE(STR(?_text_label{n})), ' \
+              'LCASE(REPLACE(REPLACE(STR({query}), "^\\"|\\"$", ""), "\\\\\\\\(.)", "$1")))) '
+
+
+def rewrite_text_queries(query):
+    """
+    Replace Jena full-text queries with case-insensitive label filters
+
+    >>> rewrite_text_queries('?id text:query ?qstring .').split('|')[0]
+    '?id <http://www.w3.org/2004/02/skos/core#prefLabel>'
+    >>> 'text:query' in rewrite_text_queries('?id text:query (?qstring 200) .')
+    False
+    """
+    counter = iter(range(1000))
+    return RE_TEXT_QUERY.sub(lambda m: TEXT_FILTER.format(subject=m.group(1), query=m.group(2), n=next(counter)),
+                             query)
+
+
+def ngrams(text, max_ngrams):
+    """
+    Word n-grams of a text, longest first
+
+    >>> ngrams('1./JR 8 Esikunta', 2)
+    ['1./JR 8', '8 Esikunta', '1./JR', '8', 'Esikunta']
+    """
+    words = text.split()
+    result = []
+    for length in range(min(max_ngrams, len(words)), 0, -1):
+        for start in range(len(words) - length + 1):
+            ngram = ' '.join(words[start:start + length])
+            if ngram not in result:
+                result.append(ngram)
+    return result
+
+
+def arpa_value(term):
+    """
+    Format an RDF term the way ARPA returns property values
+    """
+    if isinstance(term, Literal):
+        return '"{value}"'.format(value=term) + ('@{lang}'.format(lang=term.language) if term.language else '')
+    elif isinstance(term, (URIRef, BNode)):
+        return '<{value}>'.format(value=term)
+    return str(term)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LocalServices:
+    """
+    Local SPARQL endpoint and ARPA services running in a background thread
+    """
+
+    def __init__(self, graphs, arpa_services=ARPA_SERVICE_DIR, latency=0.0, host='localhost', port=0):
+        """
+        :param graphs: dict of named graph URI to RDF file or Graph
+        :param arpa_services: directory of ARPA service configurations
+        :param latency: seconds to wait before every response
+        :param host: host to listen on
+        :param port: port to listen on, 0 picks a free port
+        """
+        self.dataset = ConjunctiveGraph()
+        for (name, source) in graphs.items():
+            graph = self.dataset.get_context(URIRef(name))
+            if isinstance(source, str):
+                graph.parse(source, format=guess_format(source))
+            else:
+                graph += source
+            log.info('Loaded {num} triples to graph {name}'.format(num=len(graph), name=name))
+
+        self.services = {}
+        if arpa_services and os.path.isdir(arpa_services):
+            for name in os.listdir(arpa_services):
+                with open(os.path.join(arpa_services, name), encoding='UTF-8') as f:
+                    self.services[name] = json.load(f)
+
+        self.latency = latency
+        self.requests = Counter()
+        self.query_lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{host}:{port}'.format(host=self.server.server_address[0], port=self.server.server_address[1])
+
+    @property
+    def sparql_url(self):
+        return '{url}/warsa/sparql'.format(url=self.url)
+
+    @property
+    def arpa_url(self):
+        return '{url}/arpa'.format(url=self.url)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        log.info('Serving fixtures at {url} with latency {latency}s'.format(url=self.url, latency=self.latency))
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def query(self, query):
+        """
+        Evaluate a SPARQL query against the fixture dataset
+        """
+        with self.query_lock:
+            return self.dataset.query(rewrite_text_queries(query))
+
+    def sparql(self, params, accept):
+        """
+        :return: content type and body of the SPARQL query response
+        """
+        result = self.query(params['query'])
+
+        if result.type in ('CONSTRUCT', 'DESCRIBE'):
+            for (content_type, rdf_format) in [('text/turtle', 'turtle'), ('application/n-triples', 'nt')]:
+                if content_type in accept:
+                    break
+            else:
+                content_type, rdf_format = 'application/rdf+xml', 'xml'
+            return content_type, result.graph.serialize(format=rdf_format)
+
+        if 'xml' in accept and 'json' not in accept:
+            return 'application/sparql-results+xml', result.serialize(format='xml')
+        return 'application/sparql-results+json', result.serialize(format='json')
+
+    def arpa(self, service_name, params, cgen):
+        """
+        :return: ARPA response as a dict
+        """
+        service = self.services[service_name]
+        text = params.get('text', '')
+        candidates = ngrams(text, service.get('maxNGrams', 3))
+
+        if cgen:
+            return {'results': candidates}
+
+        if not candidates:
+            return {'results': []}
+
+        values = ' '.join(json.dumps(ngram, ensure_ascii=False) for ngram in candidates)
+        query = service['query'].replace('<VALUES>', values)
+
+        results = {}
+        for row in self.query(query):
+            row = row.asdict()
+            entity = results.setdefault(str(row['id']), {
+                'id': str(row['id']),
+                'label': str(row.get('label', '')),
+                'matches': [],
+                'properties': {},
+            })
+            if 'ngram' in row and str(row['ngram']) not in entity['matches']:
+                entity['matches'].append(str(row['ngram']))
+            for (var, value) in row.items():
+                values = entity['properties'].setdefault(var, [])
+                if arpa_value(value) not in values:
+                    values.append(arpa_value(value))
+
+        return {'results': list(results.values())}
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _params(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query, keep_blank_values=True)
+                if self.command == 'POST':
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                    if self.headers.get('Content-Type', '').startswith('application/sparql-query'):
+                        params['query'] = [body]
+                    else:
+                        params.update(parse_qs(body, keep_blank_values=True))
+                return url.path, {key: values[0] for (key, values) in params.items()}
+
+            def _respond(self, status, content_type, body):
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', '{type}; charset=utf-8'.format(type=content_type))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                path, params = self._params()
+                services.requests[path] += 1
+                if services.latency:
+                    time.sleep(services.latency)
+
+                try:
+                    if path.endswith('/sparql') and 'query' in params:
+                        self._respond(200, *services.sparql(params, self.headers.get('Accept', '')))
+                    elif path.startswith('/arpa/') and path.split('/')[2] in services.services:
+                        cgen = 'cgen' in params
+                        response = services.arpa(path.split('/')[2], params, cgen)
+                        self._respond(200, 'application/json', json.dumps(response, ensure_ascii=False))
+                    else:
+                        self._respond(404, 'text/plain', 'Not found: {path}'.format(path=path))
+                except Exception as e:
+                    log.exception('Error handling {path}'.format(path=path))
+                    self._respond(400, 'text/plain', str(e))
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        return Handler
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Serve fixture data as local SPARQL endpoint and ARPA services",
+                                        fromfile_prefix_chars='@')
+
+    argparser.add_argument("graphs", nargs='+', help="Fixture graphs as <graph URI>=<RDF file>")
+    argparser.add_argument("--arpa_services", default=ARPA_SERVICE_DIR, help="ARPA service configuration directory")
+    argparser.add_argument("--latency", default=0.0, type=float, help="Seconds to wait before every response")
+    argparser.add_argument("--host", default='localhost', help="Host to listen on")
+    argparser.add_argument("--port", default=3030, type=int, help="Port to listen on")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(filename=args.logfile,
+                        filemode='a',
+                        level=getattr(logging, args.loglevel),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    graphs = dict(graph.split('=', 1) for graph in args.graphs)
+    services = LocalServices(graphs, arpa_services=args.arpa_services, latency=args.latency, host=args.host,
+                             port=args.port)
+
+    print('SPARQL endpoint: {sparql}\nARPA services: {arpa}/<service>'.format(sparql=services.sparql_url,
+                                                                             arpa=services.arpa_url))
+    try:
+        services.server.serve_forever()
+    except KeyboardInterrupt:
+        services.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -93,6 +93,7 @@ PERISHING_CLASSES = {
     None: PERISHING_CLASSES.Tuntematon,
 }
 
+# Columns with 'cache_size' memoize converted values by the raw cell value, up to 'cache_size' distinct values.
 CASUALTY_MAPPING = {
     # 'ID':
     #     {
@@ -125,54 +126,62 @@ CASUALTY_MAPPING = {
             'name_en': 'Marital status',
             'description_fi': 'Siviilisääty',
             'description_en': 'Marital status',
-            'converter': partial(convert_from_dict, MARITAL_STATUSES)
+            'converter': partial(convert_from_dict, MARITAL_STATUSES),
+            'cache_size': 100,
         },
     'SPUOLI':
         {
             'uri': SCHEMA_WARSA.gender,
             'name_fi': 'Sukupuoli',
             'name_en': 'Gender',
-            'converter': partial(convert_from_dict, GENDERS)
+            'converter': partial(convert_from_dict, GENDERS),
+            'cache_size': 100,
         },
     'KANSALAISUUS':
         {
             'uri': SCHEMA_WARSA.citizenship,
             'name_fi': 'Kansalaisuus',
             'name_en': 'Citizenship',
-            'converter': partial(convert_from_dict, CITIZENSHIPS)
+            'converter': partial(convert_from_dict, CITIZENSHIPS),
+            'cache_size': 100,
         },
     'KANSALLISUUS':
         {
             'uri': SCHEMA_WARSA.nationality,
             'name_fi': 'Kansallisuus',
             'name_en': 'Nationality',
-            'converter': partial(convert_from_dict, NATIONALITIES)
+            'converter': partial(convert_from_dict, NATIONALITIES),
+            'cache_size': 100,
         },
     'AIDINKIELI':
         {
             'uri': SCHEMA_WARSA.mother_tongue,
             'name_fi': 'Äidinkieli',
             'name_en': 'Mother tongue',
-            'converter': partial(convert_from_dict, LANGUAGES)
+            'converter': partial(convert_from_dict, LANGUAGES),
+            'cache_size': 100,
         },
     'LASTENLKM':
         {
             'uri': SCHEMA_WARSA.number_of_children,
             'name_fi': 'Lasten lukumäärä',
             'name_en': 'Number of children',
-            'converter': lambda x: int(x) if x.isnumeric() else None
+            'converter': lambda x: int(x) if x.isnumeric() else None,
+            'cache_size': 100,
         },
     'AMMATTI':
         {
             'uri': SCHEMA_WARSA.occupation_literal,
             'name_fi': 'Ammatti',
             'name_en': 'Occupation',
+            'cache_size': 20000,
         },
     'SOTARVO':
         {
             'uri': SCHEMA_CAS.rank_literal,
             'name_fi': 'Sotilasarvo',
             'name_en': 'Military rank',
+            'cache_size': 1000,
         },
     'JOSKOODI':
         {
@@ -180,6 +189,7 @@ CASUALTY_MAPPING = {
             'name_fi': 'Joukko-osaston peiteluku',
             'name_en': 'Military unit identification code',
             'description_fi': 'Henkilön kuolinhetken joukko-osaston peiteluku',
+            'cache_size': 10000,
         },
     'JOSNIMI':
         {
@@ -195,6 +205,7 @@ CASUALTY_MAPPING = {
             'validator': partial(validate_dates, after=date(1860, 1, 1), before=date(1935, 1, 1)),
             'name_fi': 'Syntymäpäivä',
             'name_en': 'Date of birth',
+            'cache_size': 50000,
         },
     'SKUNTA':
         {
@@ -202,6 +213,7 @@ CASUALTY_MAPPING = {
             'name_fi': 'Synnyinkunta',
             'name_en': 'Municipality of birth',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'KIRJKUNTA':
         {
@@ -210,6 +222,7 @@ CASUALTY_MAPPING = {
             'name_en': 'Municipality of domicile',
             'description_fi': 'Henkilön kirjoillaolokunta',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'ASKUNTA':
         {
@@ -217,6 +230,7 @@ CASUALTY_MAPPING = {
             'name_fi': 'Asuinkunta',
             'name_en': 'Municipality of residence',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'HAAVAIKA':
         {
@@ -225,6 +239,7 @@ CASUALTY_MAPPING = {
             'validator': validate_dates,
             'name_fi': 'Haavoittumispäivä',
             'name_en': 'Date of wounding',
+            'cache_size': 5000,
         },
     'HAAVKUNTA':
         {
@@ -232,6 +247,7 @@ CASUALTY_MAPPING = {
             'name_fi': 'Haavoittumiskunta',
             'name_en': 'Municipality of wounding',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'HAAVPAIKKA':
         {
@@ -246,6 +262,7 @@ CASUALTY_MAPPING = {
             'validator': validate_dates,
             'name_en': 'Date of going missing in action',
             'name_fi': 'Katoamispäivä',
+            'cache_size': 5000,
         },
     'KATOKUNTA':
         {
@@ -253,6 +270,7 @@ CASUALTY_MAPPING = {
             'name_fi': 'Katoamiskunta',
             'name_en': 'Municipality of going missing in action',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'KATOPAIKKA':
         {
@@ -267,6 +285,7 @@ CASUALTY_MAPPING = {
             'validator': partial(validate_dates, after=date(1939, 11, 30), before=date.today()),
             'name_fi': 'Kuolinpäivä',
             'name_en': 'Date of death',
+            'cache_size': 5000,
         },
     'KUOLINKUNTA':
         {
@@ -274,6 +293,7 @@ CASUALTY_MAPPING = {
             'name_en': 'Municipality of death',
             'name_fi': 'Kuolinkunta',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'KUOLINPAIKKA':
         {
@@ -286,7 +306,8 @@ CASUALTY_MAPPING = {
             'uri': SCHEMA_CAS.perishing_category,
             'name_fi': 'Menehtymisluokka',
             'name_en': 'Perishing category',
-            'converter': partial(convert_from_dict, PERISHING_CLASSES)
+            'converter': partial(convert_from_dict, PERISHING_CLASSES),
+            'cache_size': 100,
         },
     'HKUNTA':
         {
@@ -294,12 +315,14 @@ CASUALTY_MAPPING = {
             'name_fi': 'Hautauskunta',
             'name_en': 'Municipality of burial',
             'converter': partial(urify, MUNICIPALITY_PREFIX),
+            'cache_size': 1000,
         },
     'HMAA':
         {
             'uri': SCHEMA_CAS.graveyard_number,
             'name_fi': 'Hautausmaan numero',
             'name_en': 'Burial graveyard number',
+            'cache_size': 1000,
         },
     'HPAIKKA':
         {
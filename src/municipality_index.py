@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Normalized label index of Warsa municipalities.
+
+The index maps normalized preferred and alternative labels to municipality URIs, so that casualty municipalities are
+matched by their labels with dictionary lookups. The index can be saved as JSON and reused between runs. It stores the
+checksum of the municipalities graph in the reference graph store, so that a saved index is rebuilt when the graph is
+fetched with different contents.
+"""
+
+import json
+import logging
+import unicodedata
+
+from rdflib import Graph, URIRef
+
+from namespaces import SKOS
+
+log = logging.getLogger(__name__)
+
+LABEL_PROPERTIES = [SKOS.prefLabel, SKOS.altLabel]
+
+
+def normalize_label(label):
+    """
+    Normalize a municipality label for matching
+
+    >>> normalize_label(' Pietarsaaren  mlk ')
+    'pietarsaaren mlk'
+    """
+    return ' '.join(unicodedata.normalize('NFC', str(label)).lower().split())
+
+
+class MunicipalityIndex:
+    """
+    Inverted index of normalized labels to municipality URIs
+    """
+
+    def __init__(self, labels=None, source=None):
+        """
+        :param labels: dict of normalized label -> list of municipality URIs
+        :param source: reference graph store checksum of the municipalities graph the index was built from
+        """
+        self.labels = labels or {}
+        self.source = source
+
+    @classmethod
+    def from_graph(cls, municipalities: Graph, source=None):
+        """
+        Build the index from the labels of a municipalities graph
+
+        :param source: checksum of the municipalities graph
+        """
+        labels = {}
+        for prop in LABEL_PROPERTIES:
+            for (munic, label) in municipalities.subject_objects(prop):
+                uris = labels.setdefault(normalize_label(label), [])
+                if str(munic) not in uris:
+                    uris.append(str(munic))
+
+        for uris in labels.values():
+            uris.sort()
+
+        log.info('Indexed {num} municipality labels'.format(num=len(labels)))
+        return cls(labels, source=source)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, encoding='UTF-8') as f:
+            data = json.load(f)
+            index = cls(data.get('labels'), source=data.get('source'))
+
+        log.info('Loaded {num} municipality labels from {file}'.format(num=len(index.labels), file=filename))
+        return index
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='UTF-8') as f:
+            json.dump({'source': self.source, 'labels': self.labels}, f, ensure_ascii=False, indent=0, sort_keys=True)
+
+        log.info('Saved {num} municipality labels to {file}'.format(num=len(self.labels), file=filename))
+
+    def match(self, labels):
+        """
+        Find the municipality with any of the labels
+
+        :param labels: labels of a municipality
+        :return: URIRef of the municipality, or None if no municipality or several municipalities match
+        """
+        matches = sorted(set(uri for label in labels for uri in self.labels.get(normalize_label(label), [])))
+
+        if not matches:
+            log.info("Couldn't find Warsa URI for municipality {lbl}".format(lbl=labels))
+            return None
+
+        if len(matches) > 1:
+            log.warning('Found multiple Warsa URIs for municipality {lbl}: {uris}'.format(lbl=labels, uris=matches))
+            return None
+
+        log.info('Found {lbl} municipality Warsa URI {uri}'.format(lbl=labels, uri=matches[0]))
+        return URIRef(matches[0])
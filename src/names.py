@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Person name normalization shared by conversion, processing and linking
+"""
+
+import logging
+import re
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+# Raw name from the CSV, e.g. "VIRTANEN E. NIEMI, EINO ILMARI"
+RE_NAME_SPLIT = re.compile(
+    r'([A-ZÅÄÖÜÉÓÁ/\-]+(?:\s+\(?E(?:NT)?[\.\s]+[A-ZÅÄÖÜÉÓÁ/\-]+)?\)?)\s*(?:(VON))?,?\s*([A-ZÅÄÖÜÉÓÁ/\- \(\)0-9,.]*)')
+RE_RAW_PREVIOUS_NAME = re.compile(r'([A-ZÅÄÖÜÉÓÁ/\-]{2}) +\(?(E(?:NT)?[\.\s]+)([A-ZÅÄÖÜÉÓÁ/\-]+)\)?')
+
+RE_ZERO_IN_NAME = re.compile(r'(\w)0(\w)')
+RE_WHITESPACE = re.compile(r'\s+')
+RE_PREVIOUS_NAME = re.compile(r'(\w\w\s+)(E(?:NT)?\.)\s?(\w+)')
+
+# Previous name in unified form: "Virtanen (ent. Niemi)"
+RE_PREVIOUS_NAME_MARKUP = re.compile(r'\(ent\.\s*(.+)\)')
+
+NormalizedName = namedtuple('NormalizedName', ['family', 'given'])
+
+
+def split_raw_name(raw_name: str):
+    """
+    Split a raw upper case name into last name, name particle (von) and first names.
+
+    :return: tuple of last name, particle and first names
+    """
+    namematch = RE_NAME_SPLIT.search(raw_name)
+    return namematch.groups() if namematch else (raw_name, None, '')
+
+
+def unify_raw_previous_name(lastname: str):
+    """
+    Unify the syntax of a previous name in a raw upper case last name
+
+    >>> unify_raw_previous_name('VIRTANEN E. NIEMI')
+    'VIRTANEN (ent. NIEMI)'
+    """
+    return RE_RAW_PREVIOUS_NAME.sub(r'\1 (ent. \3)', lastname)
+
+
+def normalize_family_name(family: str):
+    """
+    Unify and stylize a family name. Previous names are unified to same format as WARSA actors:
+    LASTNAME (ent. PREVIOUS)
+
+    >>> normalize_family_name('VIRTANEN E. NIEMI')
+    'Virtanen (ent. Niemi)'
+    >>> normalize_family_name('VON  K0RFF')
+    'von Korff'
+    """
+    new_fam = RE_ZERO_IN_NAME.sub(r'\1O\2', family)
+    new_fam = RE_WHITESPACE.sub(' ', new_fam)
+    new_fam = new_fam.replace('%', '/')  # Väinö Jaakkola%Jakkola
+    new_fam = RE_PREVIOUS_NAME.sub(r'\1(ent. \3)', new_fam)
+    new_fam = new_fam.title().replace('(Ent.', '(ent.').replace('Von', 'von')
+    log.debug('Unifying family name "%s" to "%s"', family, new_fam)
+    return new_fam
+
+
+def normalize_given_names(given: str):
+    """
+    Unify and stylize given names
+
+    >>> normalize_given_names('EINO%EINAR ILMARI')
+    'Eino/Einar Ilmari'
+    """
+    new_giv = str(given).title().replace('%', '/')
+    log.debug('Unifying given names "%s" to "%s"', given, new_giv)
+    return new_giv
+
+
+def strip_previous_name_markup(family: str):
+    """
+    Remove the previous name markup from a unified family name, keeping both names
+
+    >>> strip_previous_name_markup('Virtanen (ent. Niemi)')
+    'Virtanen Niemi'
+    """
+    return RE_PREVIOUS_NAME_MARKUP.sub(r'\1', family)
+
+
+def normalize_names(family_names, given_names):
+    """
+    Normalize a column of family names and given names. Each distinct name is normalized only once.
+
+    :param family_names: list of family names
+    :param given_names: list of given names, in the same order
+    :return: list of NormalizedName tuples
+    """
+    families = {}
+    givens = {}
+    names = []
+    for (family, given) in zip(family_names, given_names):
+        if family not in families:
+            families[family] = normalize_family_name(family)
+        if given not in givens:
+            givens[given] = normalize_given_names(given)
+
+        names.append(NormalizedName(families[family], givens[given]))
+
+    return names
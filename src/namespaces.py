@@ -29,6 +29,10 @@ CITIZENSHIPS = Namespace('http://ldf.fi/warsa/citizenships/')
 NATIONALITIES = Namespace('http://ldf.fi/warsa/nationalities/')
 MUNICIPALITIES = Namespace('http://ldf.fi/warsa/casualties/municipalities/')
 
+GEORSS = Namespace('http://www.georss.org/georss/')
+WGS84 = Namespace('http://www.w3.org/2003/01/geo/wgs84_pos#')
+SCHEMA_PNR = Namespace('http://ldf.fi/pnr-schema#')
+
 
 def bind_namespaces(graph: Graph):
     graph.bind("bioc", BIOC)
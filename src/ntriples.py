@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Streaming N-Triples output
+"""
+
+import gzip
+import logging
+
+from rdflib import Literal
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+
+log = logging.getLogger(__name__)
+
+
+def nt_term(term):
+    """
+    Format an RDF term for N-Triples. Literals are escaped here and always written on one line, as Literal.n3()
+    writes multi-line literals in Turtle long string syntax. Other terms and datatypes are formatted with n3().
+
+    >>> print(nt_term(Literal('JR 8\\n"Esikunta"', lang='fi')))
+    "JR 8\\n\\"Esikunta\\""@fi
+    """
+    if isinstance(term, Literal):
+        value = str(term).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+        if term.language:
+            return '"{value}"@{lang}'.format(value=value, lang=term.language)
+        if term.datatype:
+            return '"{value}"^^{datatype}'.format(value=value, datatype=term.datatype.n3())
+        return '"{value}"'.format(value=value)
+
+    return term.n3()
+
+
+def nt_row(triple):
+    """
+    Format a triple as an N-Triples line
+    """
+    return '{} {} {} .\n'.format(*(nt_term(term) for term in triple))
+
+
+def open_binary(filename, mode='rb'):
+    """
+    Open a file in binary mode, using gzip if the filename ends with .gz
+    """
+    if str(filename).endswith('.gz'):
+        return gzip.open(filename, mode)
+
+    return open(filename, mode)
+
+
+def is_ntriples(filename):
+    return str(filename).endswith(('.nt', '.nt.gz'))
+
+
+def parse_ntriples(source, sink):
+    """
+    Parse an N-Triples file line by line, without building a graph. The file is read with gzip if the filename
+    ends with .gz
+
+    :param source: N-Triples file name
+    :param sink: object whose triple(s, p, o) method is called for each triple
+    """
+    with open_binary(source, 'rb') as stream:
+        NTriplesParser(sink=sink).parse(stream)
+
+
+class NTriplesWriter:
+    """
+    Write triples to an N-Triples file as they are produced, instead of collecting them into a graph first.
+    The output is gzipped if the filename ends with .gz
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        self.stream = open_binary(destination, 'wb')
+        self.count = 0
+
+    def write(self, triples):
+        """
+        Write triples to the stream
+
+        :param triples: iterable of triples (e.g. an rdflib Graph)
+        """
+        rows = [nt_row(triple) for triple in triples]
+        self.stream.write(''.join(rows).encode('utf-8'))
+        self.count += len(rows)
+
+    def close(self):
+        self.stream.close()
+        log.info('Wrote {num} triples to {dest}'.format(num=self.count, dest=self.destination))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -4,22 +4,32 @@
 
 import argparse
 import logging
+import sys
 
-from rdf_dm import read_graph_from_sparql
 from rdflib import Graph, URIRef, Literal, RDF
 from rdflib.util import guess_format
 
+import http_cache
+import reference_graphs
+from incremental import Stage
 from namespaces import SKOS, CRM, SCHEMA_CAS, SCHEMA_WARSA, bind_namespaces, DCT, FOAF, BIOC
+from reference_data import ReferenceData
+from snapshot import load_graph
+
+log = logging.getLogger(__name__)
 
 NARC_SOURCE = URIRef('http://ldf.fi/warsa/sources/source9')
 
+OUTPUT_KEYS = ['persons', 'promotions', 'joinings', 'births', 'deaths', 'disappearances', 'woundings',
+               'documents_links']
+
 
 def get_local_id(casualty: URIRef):
     return str(casualty).split('/')[-1]
 
 
 def generate_event(graph: Graph, casualty: URIRef, person: URIRef, event_type: URIRef, event_prefix: str,
-                   date_prop: URIRef, place_prop: URIRef, relation_prop: URIRef, munics: Graph):
+                   date_prop: URIRef, place_prop: URIRef, relation_prop: URIRef, reference: ReferenceData):
     log.debug('Generating event {} {} {} {} {} {} {}'.format(casualty, person, event_type, event_prefix,
                                                              date_prop, place_prop, relation_prop))
     event = Graph()
@@ -34,7 +44,7 @@ def generate_event(graph: Graph, casualty: URIRef, person: URIRef, event_type: U
         place = graph.value(subject=casualty, predicate=place_prop)
 
         if place:
-            place_ws = munics.value(place, SCHEMA_CAS.preferred_municipality)
+            place_ws = reference.preferred_municipality(place)
             event.add((event_uri, CRM.P7_took_place_at, place_ws))
 
     if date_prop:
@@ -54,10 +64,10 @@ def generate_event(graph: Graph, casualty: URIRef, person: URIRef, event_type: U
     return event, event_uri
 
 
-def generate_birth(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, munics: Graph):
+def generate_birth(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, reference: ReferenceData):
     event, event_uri = generate_event(graph, casualty, person, SCHEMA_WARSA.Birth, 'birth_',
                                       SCHEMA_WARSA.date_of_birth, SCHEMA_CAS.municipality_of_birth,
-                                      CRM.P98_brought_into_life, munics)
+                                      CRM.P98_brought_into_life, reference)
 
     lbl_fi = Literal('{person} syntyi'.format(person=person_name), lang='fi')
     lbl_en = Literal('{person} was born'.format(person=person_name), lang='en')
@@ -68,10 +78,10 @@ def generate_birth(graph: Graph, casualty: URIRef, person: URIRef, person_name:
     return event
 
 
-def generate_death(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, munics: Graph):
+def generate_death(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, reference: ReferenceData):
     event, event_uri = generate_event(graph, casualty, person, SCHEMA_WARSA.Death, 'death_',
                                       SCHEMA_WARSA.date_of_death, SCHEMA_CAS.municipality_of_death,
-                                      CRM.P100_was_death_of, munics)
+                                      CRM.P100_was_death_of, reference)
 
     lbl_fi = Literal('{person} kuoli'.format(person=person_name), lang='fi')
     lbl_en = Literal('{person} died'.format(person=person_name), lang='en')
@@ -82,7 +92,7 @@ def generate_death(graph: Graph, casualty: URIRef, person: URIRef, person_name:
     return event
 
 
-def generate_disappearance(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, munics: Graph):
+def generate_disappearance(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, reference: ReferenceData):
     date = graph.value(casualty, SCHEMA_CAS.date_of_going_mia)
     mun = graph.value(casualty, SCHEMA_CAS.municipality_of_going_mia)
     place = graph.value(casualty, SCHEMA_CAS.place_of_going_mia_literal)
@@ -91,7 +101,7 @@ def generate_disappearance(graph: Graph, casualty: URIRef, person: URIRef, perso
 
     event, event_uri = generate_event(graph, casualty, person, SCHEMA_WARSA.Disappearing, 'disappear_cas_',
                                       SCHEMA_WARSA.date_of_going_mia, SCHEMA_CAS.municipality_of_going_mia,
-                                      CRM.P11_had_participant, munics)
+                                      CRM.P11_had_participant, reference)
 
     if place:
         event.add((event_uri, SCHEMA_WARSA.place_string, place))
@@ -105,7 +115,7 @@ def generate_disappearance(graph: Graph, casualty: URIRef, person: URIRef, perso
     return event
 
 
-def generate_wounding(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, munics: Graph):
+def generate_wounding(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, reference: ReferenceData):
     date = graph.value(casualty, SCHEMA_CAS.date_of_wounding)
     mun = graph.value(casualty, SCHEMA_CAS.municipality_of_wounding)
     place = graph.value(casualty, SCHEMA_CAS.place_of_wounding)
@@ -114,7 +124,7 @@ def generate_wounding(graph: Graph, casualty: URIRef, person: URIRef, person_nam
 
     event, event_uri = generate_event(graph, casualty, person, SCHEMA_WARSA.Wounding, 'wound_cas_',
                                       SCHEMA_WARSA.date_of_wounding, SCHEMA_CAS.municipality_of_wounding,
-                                      CRM.P11_had_participant, munics)
+                                      CRM.P11_had_participant, reference)
 
     if place:
         event.add((event_uri, SCHEMA_WARSA.place_string, place))
@@ -128,18 +138,18 @@ def generate_wounding(graph: Graph, casualty: URIRef, person: URIRef, person_nam
     return event
 
 
-def generate_promotion(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, munics: Graph, ranks: Graph):
+def generate_promotion(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, reference: ReferenceData):
     rank = graph.value(casualty, SCHEMA_CAS.rank)
     if not rank:
         return Graph()
 
     event, event_uri = generate_event(graph, casualty, person, SCHEMA_WARSA.Promotion, 'promotion_cas_',
-                                      None, None, CRM.P11_had_participant, munics)
+                                      None, None, CRM.P11_had_participant, reference)
 
     event.add((event_uri, URIRef('http://ldf.fi/schema/warsa/actors/hasRank'), rank))
 
     rank_literal = graph.value(casualty, SCHEMA_CAS.rank_literal)
-    rank_labels = list(ranks.objects(rank, SKOS.prefLabel))
+    rank_labels = reference.rank_labels(rank)
     rank_fi = next(iter(lit for lit in rank_labels if lit.language == 'fi'), rank_literal)
     rank_en = next(iter(lit for lit in rank_labels if lit.language == 'en'), rank_fi)
     lbl_fi = Literal('{person} ylennettiin sotilasarvoon {rank}'.format(person=person_name, rank=rank_fi.lower()), lang='fi')
@@ -151,7 +161,7 @@ def generate_promotion(graph: Graph, casualty: URIRef, person: URIRef, person_na
     return event
 
 
-def generate_join(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, munics: Graph):
+def generate_join(graph: Graph, casualty: URIRef, person: URIRef, person_name: str, reference: ReferenceData):
     units = list(graph.objects(casualty, SCHEMA_CAS.unit))
     if not units:
         return Graph()
@@ -159,7 +169,7 @@ def generate_join(graph: Graph, casualty: URIRef, person: URIRef, person_name: s
     events = Graph()
     for unit in units:
         event, event_uri = generate_event(graph, casualty, person, SCHEMA_WARSA.PersonJoining, 'joining_cas_',
-                                          None, None, CRM.P143_joined, munics)
+                                          None, None, CRM.P143_joined, reference)
 
         event.add((event_uri, CRM.P144_joined_with, unit))
 
@@ -200,7 +210,7 @@ def generate_person(graph: Graph, casualty: URIRef):
     return person, person_uri, lbl
 
 
-def generate_persons(graph: Graph, municipalities: Graph, ranks: Graph):
+def generate_persons(graph: Graph, reference: ReferenceData):
     persons = Graph()
     promotions = Graph()
     joinings = Graph()
@@ -220,12 +230,12 @@ def generate_persons(graph: Graph, municipalities: Graph, ranks: Graph):
 
         persons += person
 
-        births += generate_birth(graph, casualty, person_uri, person_name, municipalities)
-        deaths += generate_death(graph, casualty, person_uri, person_name, municipalities)
-        joinings += generate_join(graph, casualty, person_uri, person_name, municipalities)
-        promotions += generate_promotion(graph, casualty, person_uri, person_name, municipalities, ranks)
-        woundings += generate_wounding(graph, casualty, person_uri, person_name, municipalities)
-        disappearances += generate_disappearance(graph, casualty, person_uri, person_name, municipalities)
+        births += generate_birth(graph, casualty, person_uri, person_name, reference)
+        deaths += generate_death(graph, casualty, person_uri, person_name, reference)
+        joinings += generate_join(graph, casualty, person_uri, person_name, reference)
+        promotions += generate_promotion(graph, casualty, person_uri, person_name, reference)
+        woundings += generate_wounding(graph, casualty, person_uri, person_name, reference)
+        disappearances += generate_disappearance(graph, casualty, person_uri, person_name, reference)
 
         documents_links.add((casualty, CRM.P70_documents, person_uri))
 
@@ -251,6 +261,14 @@ if __name__ == '__main__':
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
     argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+    argparser.add_argument("--reference", help="Compiled reference data bundle, used instead of municipalities and "
+                                               "the ranks graph if given")
+    argparser.add_argument("--incremental", action='store_true',
+                           help="Skip generation if inputs, code and arguments have not changed since the last run")
+    argparser.add_argument("--snapshot", action='store_true',
+                           help="Load the input from its binary snapshot if it is up to date, otherwise write one")
+    http_cache.add_arguments(argparser)
+    reference_graphs.add_arguments(argparser)
 
     args = argparser.parse_args()
 
@@ -261,11 +279,25 @@ if __name__ == '__main__':
 
     log = logging.getLogger(__name__)
 
-    input_graph = Graph().parse(args.input, format=guess_format(args.input))
+    outputs = ['{prefix}{key}.ttl'.format(prefix=args.output, key=key) for key in OUTPUT_KEYS]
+    stage = Stage(args.output, [args.input, args.reference or args.municipalities], outputs, args)
+    if args.incremental and stage.up_to_date():
+        log.info('Generated persons are up to date, skipping')
+        sys.exit()
 
-    munics = Graph().parse(args.municipalities, format=guess_format(args.input))
+    input_graph = load_graph(args.input, snapshot=args.snapshot)
 
-    ranks = read_graph_from_sparql(args.endpoint, "http://ldf.fi/warsa/ranks")
+    if args.reference:
+        reference = ReferenceData.load(args.reference)
+    else:
+        munics = Graph().parse(args.municipalities, format=guess_format(args.input))
+        http_cache.install_from_args(args)
+        reference_graphs.install_from_args(args)
+        ranks = reference_graphs.read_graph(args.endpoint, "http://ldf.fi/warsa/ranks")
+        reference = ReferenceData.from_graphs(municipalities=munics, ranks=ranks)
 
-    for key, graph in generate_persons(input_graph, munics, ranks).items():
+    for key, graph in generate_persons(input_graph, reference).items():
         bind_namespaces(graph).serialize('{prefix}{key}.ttl'.format(prefix=args.output, key=key), format='turtle')
+
+    if args.incremental:
+        stage.record()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Run the whole casualty conversion and linking pipeline (the stages of convert.sh and process.sh) in one process.
+
+The casualty graph is built once and passed from stage to stage in memory. Only the final outputs are serialized,
+unless intermediates are requested for debugging.
+"""
+
+import argparse
+import logging
+import os
+
+from rdflib import Graph
+from rdflib.util import guess_format
+
+import http_cache
+import reference_graphs
+import linker
+from csv_to_rdf import RDFMapper
+from mapping import CASUALTY_MAPPING
+from namespaces import SCHEMA_WARSA, bind_namespaces
+from person_generator import generate_persons
+from process import fix_by_direct_uri_mappings, unify_names
+from reference_data import ReferenceData
+
+log = logging.getLogger(__name__)
+
+
+class Pipeline:
+    """
+    Casualty pipeline stages. Intermediate graphs are written to the output directory with the same names as
+    process.sh uses, if intermediates are enabled.
+    """
+
+    def __init__(self, output_dir='output', endpoint='http://localhost:3030/warsa/sparql',
+                 arpa='http://demo.seco.tkk.fi/arpa', arpa_workers=1, intermediates=False, linkage_model=None,
+                 cores=None, unit_candidates='arpa', pnr_gazetteer=None):
+        self.output_dir = output_dir
+        self.endpoint = endpoint
+        self.arpa = arpa
+        self.arpa_workers = arpa_workers
+        self.intermediates = intermediates
+        self.linkage_model = linkage_model
+        self.cores = cores
+        self.unit_candidates = unit_candidates
+        self.pnr_gazetteer = pnr_gazetteer
+
+    def output(self, filename):
+        return os.path.join(self.output_dir, filename)
+
+    def write(self, graph: Graph, filename):
+        destination = self.output(filename)
+        bind_namespaces(graph).serialize(destination, format=guess_format(destination))
+        log.info('Serialized {num} triples to {dest}'.format(num=len(graph), dest=destination))
+
+    def dump(self, graph: Graph, filename):
+        """
+        Serialize an intermediate graph if intermediates are enabled
+        """
+        if self.intermediates:
+            self.write(graph, filename)
+
+    def convert(self, casualties_file, cemeteries_file, schema_base_file, limit=None, workers=1):
+        """
+        Convert the casualty table to RDF
+
+        :return: casualty graph
+        """
+        log.info('Converting {file}'.format(file=casualties_file))
+
+        cemeteries = list(Graph().parse(cemeteries_file, format=guess_format(cemeteries_file)).subjects())
+        mapper = RDFMapper(CASUALTY_MAPPING, SCHEMA_WARSA.DeathRecord, cemeteries=cemeteries,
+                           errors=self.output('errors.csv'))
+        if casualties_file.endswith('.xlsx'):
+            mapper.read_xlsx(casualties_file, limit=limit)
+        else:
+            mapper.read_csv(casualties_file, limit=limit)
+
+        if workers != 1:
+            mapper.process_parallel(workers, batch=True)
+        else:
+            mapper.process_columns()
+
+        schema = Graph().parse(schema_base_file, format=guess_format(schema_base_file))
+        schema += mapper.schema
+        self.write(schema, 'casualties_schema.ttl')
+
+        self.dump(mapper.data, '_casualties_initial.ttl')
+        return mapper.data
+
+    def process(self, casualties: Graph, additions_file):
+        """
+        Fix known issues and unify names, and add manual additions
+        """
+        log.info('Processing death records')
+
+        casualties = unify_names(fix_by_direct_uri_mappings(casualties))
+        casualties.parse(additions_file, format=guess_format(additions_file))
+
+        self.dump(casualties, '_casualties_processed.ttl')
+        return casualties
+
+    def link(self, casualties: Graph, municipalities_file):
+        """
+        Link ranks, units, occupations, municipalities and persons. Links are added to the casualty graph.
+
+        :return: linked municipalities and compiled reference data
+        """
+        links = []
+        for (task, arpa, filename) in [('ranks', None, '_rank_links.ttl'),
+                                       ('units', self.arpa + '/warsa_casualties_actor_units', '_unit_links.ttl'),
+                                       ('occupations', None, '_occupation_links.ttl')]:
+            log.info('Linking {task}'.format(task=task))
+            task_links = linker.run_task(task, casualties, self.endpoint, arpa, arpa_workers=self.arpa_workers,
+                                         unit_candidates=self.unit_candidates)
+            self.dump(task_links, filename)
+            links.append(task_links)
+
+        log.info('Linking municipalities')
+        munics = Graph().parse(municipalities_file, format=guess_format(municipalities_file))
+        munics = linker.run_task('municipalities', munics, self.endpoint, self.arpa + '/pnr_municipality',
+                                 munic_index=self.output('municipality_index.json'),
+                                 pnr_gazetteer=self.pnr_gazetteer)
+        self.write(munics, 'municipalities.ttl')
+
+        ranks = reference_graphs.read_graph(self.endpoint, "http://ldf.fi/warsa/ranks")
+        reference = ReferenceData.from_graphs(municipalities=munics, ranks=ranks)
+
+        for task_links in links:
+            casualties += task_links
+        self.dump(casualties, '_casualties_with_links.ttl')
+
+        log.info('Linking persons')
+        documents_links = linker.run_task('persons', casualties, self.endpoint, reference=reference,
+                                           linkage_model=self.linkage_model, cores=self.cores)
+        self.dump(documents_links, '_documents_links.ttl')
+        casualties += documents_links
+        self.dump(casualties, '_casualties_linked.ttl')
+
+        return munics, reference
+
+    def generate_persons(self, casualties: Graph, reference: ReferenceData):
+        """
+        Generate person instances for unlinked casualties, and add the links to them to the casualty graph
+        """
+        log.info('Generating persons')
+
+        for key, graph in generate_persons(casualties, reference).items():
+            if key == 'documents_links':
+                self.dump(graph, '_generated_documents_links.ttl')
+                casualties += graph
+            else:
+                self.write(graph, 'cas_person_{key}.ttl'.format(key=key))
+
+        return casualties
+
+    def run(self, casualties_file, cemeteries_file, schema_base_file, additions_file, municipalities_file,
+            limit=None, workers=1):
+        casualties = self.convert(casualties_file, cemeteries_file, schema_base_file, limit=limit, workers=workers)
+        casualties = self.process(casualties, additions_file)
+        munics, reference = self.link(casualties, municipalities_file)
+        casualties = self.generate_persons(casualties, reference)
+
+        self.write(casualties, 'casualties.ttl')
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, fromfile_prefix_chars='@')
+
+    argparser.add_argument("--input", default='data/casualties.xlsx', help="Input casualties XLSX or CSV file")
+    argparser.add_argument("--cemeteries", default='data/cemeteries.ttl', help="Input cemeteries turtle file")
+    argparser.add_argument("--schema_base", default='input/schema_base.ttl', help="Base schema turtle file")
+    argparser.add_argument("--additions", default='input/cas_additions.ttl', help="Manual casualty additions")
+    argparser.add_argument("--municipalities", default='input/old_municipalities.ttl',
+                           help="Casualty municipalities RDF file")
+    argparser.add_argument("--output", default='output', help="Output directory")
+    argparser.add_argument("--endpoint", default='{}/sparql'.format(
+        os.environ.get('WARSA_ENDPOINT_URL', 'http://localhost:3030/warsa')), help="WarSampo SPARQL endpoint")
+    argparser.add_argument("--arpa", default=os.environ.get('ARPA_URL', 'http://demo.seco.tkk.fi/arpa'),
+                           help="ARPA base URL")
+    argparser.add_argument("--arpa_workers", default=4, type=int,
+                           help="Number of concurrent ARPA queries in unit linking, default is 4")
+    argparser.add_argument("--unit_candidates", default='arpa', choices=['arpa', 'local'],
+                           help="Get unit candidates from ARPA or from a local index of Warsa unit labels")
+    argparser.add_argument("--pnr_gazetteer", help="PNR municipalities dump file to link municipalities to PNR with "
+                                                   "instead of ARPA")
+    argparser.add_argument("--linkage_model", help="Settings file to save and reuse the learned person linkage model")
+    argparser.add_argument("--cores", type=int, help="Number of processes to score record pairs in person linking")
+    argparser.add_argument("--limit", default=None, type=int, help="Convert only the topmost LIMIT rows")
+    argparser.add_argument("--workers", default=0, type=int,
+                           help="Number of worker processes for the conversion, 0 uses all CPU cores. Default is 0.")
+    argparser.add_argument("--intermediates", action='store_true',
+                           help="Serialize the intermediate graphs to the output directory for debugging")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--logfile", default='output/logs/pipeline.log', help="Logfile")
+    http_cache.add_arguments(argparser)
+    reference_graphs.add_arguments(argparser)
+
+    args = argparser.parse_args()
+
+    os.makedirs(os.path.dirname(args.logfile) or '.', exist_ok=True)
+    os.makedirs(args.output, exist_ok=True)
+
+    logging.basicConfig(filename=args.logfile,
+                        filemode='a',
+                        level=getattr(logging, args.loglevel),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    http_cache.install_from_args(args)
+    reference_graphs.install_from_args(args)
+
+    pipeline = Pipeline(output_dir=args.output, endpoint=args.endpoint, arpa=args.arpa,
+                        arpa_workers=args.arpa_workers, intermediates=args.intermediates,
+                        linkage_model=args.linkage_model, cores=args.cores, unit_candidates=args.unit_candidates,
+                        pnr_gazetteer=args.pnr_gazetteer)
+    pipeline.run(args.input, args.cemeteries, args.schema_base, args.additions, args.municipalities,
+                 limit=args.limit, workers=args.workers)
+
+    http_cache.uninstall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Local gazetteer of municipality-level places of the Finnish place name register (PNR).
+
+Replaces linking municipalities to PNR through the pnr_municipality ARPA service. The places of types 540 and 550
+(municipalities) are read from a dump of the PNR graph (see SPARQL/pnr_municipalities.sparql) into an exact label
+index, matching labels case-insensitively like the ARPA service query, and a normalized label index ignoring
+punctuation and whitespace. If a label matches several places, the place nearest to the georss:point of the
+municipality is chosen.
+"""
+
+import logging
+import math
+import re
+import unicodedata
+
+from rdflib import Graph, RDF, URIRef
+
+from local_services import ngrams
+from namespaces import GEORSS, SKOS, SCHEMA_CAS, SCHEMA_PNR, WGS84
+from snapshot import load_graph
+
+log = logging.getLogger(__name__)
+
+PLACE_TYPES = [SCHEMA_PNR.place_type_540, SCHEMA_PNR.place_type_550]
+
+# Same as maxNGrams of the ARPA service
+MAX_NGRAMS = 3
+
+RE_IGNORED = re.compile(r'[\W_]+')
+
+
+def normalize_place_label(label):
+    """
+    Normalize a place label for matching
+
+    >>> normalize_place_label('Koski Tl.')
+    'koskitl'
+    """
+    return RE_IGNORED.sub('', unicodedata.normalize('NFC', str(label)).lower())
+
+
+def parse_point(value):
+    """
+    Parse a georss:point value
+
+    >>> parse_point('59.82361111111111 22.968055555555555')
+    (59.82361111111111, 22.968055555555555)
+    """
+    try:
+        (lat, lon) = str(value).split()
+        return float(lat), float(lon)
+    except ValueError:
+        return None
+
+
+def distance_km(point_1, point_2):
+    """
+    Great-circle distance between two (latitude, longitude) points
+
+    >>> round(distance_km((60.17, 24.94), (61.50, 23.76)))
+    161
+    """
+    (lat_1, lon_1) = map(math.radians, point_1)
+    (lat_2, lon_2) = map(math.radians, point_2)
+    a = math.sin((lat_2 - lat_1) / 2) ** 2 + math.cos(lat_1) * math.cos(lat_2) * math.sin((lon_2 - lon_1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(a))
+
+
+class PNRGazetteer:
+    """
+    Exact and normalized label indexes of PNR municipalities
+    """
+
+    def __init__(self, places):
+        """
+        :param places: dict of place URI -> (list of labels, (latitude, longitude) or None)
+        """
+        self.places = places
+        self.exact = {}
+        self.normalized = {}
+
+        for (uri, (labels, point)) in sorted(places.items()):
+            for label in labels:
+                for (index, key) in [(self.exact, str(label).lower()), (self.normalized, normalize_place_label(label))]:
+                    uris = index.setdefault(key, [])
+                    if uri not in uris:
+                        uris.append(uri)
+
+    @classmethod
+    def from_graph(cls, graph: Graph):
+        """
+        Read the municipality-level places of a PNR graph
+        """
+        places = {}
+        for place_type in PLACE_TYPES:
+            for place in graph.subjects(RDF.type, place_type):
+                point = graph.value(place, GEORSS.point)
+                if point is not None:
+                    point = parse_point(point)
+                else:
+                    lat = graph.value(place, WGS84.lat)
+                    lon = graph.value(place, WGS84.long)
+                    point = (float(lat), float(lon)) if lat is not None and lon is not None else None
+
+                places[str(place)] = ([str(label) for label in graph.objects(place, SKOS.prefLabel)], point)
+
+        log.info('Read {num} PNR municipalities'.format(num=len(places)))
+        return cls(places)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the gazetteer from a PNR dump file
+        """
+        return cls.from_graph(load_graph(filename, snapshot=True))
+
+    def candidates(self, label):
+        """
+        Find the places matching the longest n-gram of a label that matches any place, preferring exact matches
+
+        :return: list of place URIs
+        """
+        for ngram in ngrams(str(label), MAX_NGRAMS):
+            uris = self.exact.get(ngram.lower())
+            if uris:
+                return uris
+
+        for ngram in ngrams(str(label), MAX_NGRAMS):
+            uris = self.normalized.get(normalize_place_label(ngram))
+            if uris:
+                return uris
+
+        return []
+
+    def match(self, labels, point=None):
+        """
+        Find the places of a municipality
+
+        :param labels: labels of the municipality
+        :param point: (latitude, longitude) of the municipality, used to choose between several matching places
+        :return: list of place URIs
+        """
+        uris = sorted(set(uri for label in labels for uri in self.candidates(label)))
+
+        located = [uri for uri in uris if self.places[uri][1] is not None]
+        if len(uris) > 1 and point and located:
+            nearest = min(located, key=lambda uri: distance_km(point, self.places[uri][1]))
+            log.debug('Chose the nearest of {uris} for {lbl}: {uri}'.format(uris=uris, lbl=labels, uri=nearest))
+            return [nearest]
+
+        return uris
+
+    def link(self, municipalities: Graph, target_prop):
+        """
+        Link casualty municipalities to PNR places
+
+        :return: the municipalities graph with the links added
+        """
+        linked = 0
+        for munic in list(municipalities.subjects(RDF.type, SCHEMA_CAS.Municipality)):
+            point = municipalities.value(munic, GEORSS.point)
+            uris = self.match(list(municipalities.objects(munic, SKOS.prefLabel)),
+                              parse_point(point) if point is not None else None)
+
+            if len(uris) > 1:
+                log.warning('Found multiple PNR places for municipality {munic}: {uris}'.format(munic=munic,
+                                                                                               uris=uris))
+            for uri in uris:
+                municipalities.add((munic, target_prop, URIRef(uri)))
+            linked += bool(uris)
+
+        log.info('Linked {num} municipalities to PNR'.format(num=linked))
+        return municipalities
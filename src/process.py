@@ -11,14 +11,19 @@ Copyright (c) 2017 Mikko Koho
 
 import argparse
 import logging
-import re
 
 from rdflib import *
-import rdflib
+from rdflib.util import guess_format
 
+from incremental import Stage
+from names import normalize_names
+from ntriples import NTriplesWriter, is_ntriples, parse_ntriples
+from snapshot import load_graph
 from namespaces import SCHEMA_WARSA, MUNICIPALITIES, CEMETERIES, SCHEMA_CAS, SKOS, PERISHING_CLASSES, GENDERS, \
     CITIZENSHIPS, NATIONALITIES, MOTHER_TONGUES, MARITAL_STATUSES, bind_namespaces
 
+log = logging.getLogger(__name__)
+
 URI_MAPPINGS = {
     # MANUAL FIXES TO SOME URI'S USED AS TRIPLE OBJECTS
     Literal('Alipuseeri'): Literal('Aliupseeri'),
@@ -79,30 +84,21 @@ def unify_names(casualties: Graph):
     """
     Unify and stylize name representations
     """
-    def unify_family_name(family: str):
-        new_fam = re.sub(r'(\w)0(\w)', r'\1O\2', family)
-        new_fam = re.sub(r'\s+', ' ', new_fam)
-        new_fam = re.sub('%', '/', new_fam)  # Väinö Jaakkola%Jakkola
-        new_fam = re.sub(r'(\w\w\s+)(E(?:NT)?\.)\s?(\w+)', r'\1(ent. \3)', new_fam)
-        new_fam = new_fam.title().replace('(Ent.', '(ent.').replace('Von', 'von')
-        log.debug('Unifying family name "{ln}" to "{nln}"'.format(ln=family, nln=new_fam))
-        return new_fam
-
-    def unify_given_name(given: str):
-        new_giv = str(given).title()
-        new_giv = re.sub('%', '/', new_giv)
-        log.debug('Unifying given names "{orig}" to "{new}"'.format(orig=given, new=new_giv))
-        return new_giv
+    family_names = list(casualties[:SCHEMA_WARSA.family_name:])
+    given_names = {person: casualties.value(person, SCHEMA_WARSA.given_names) for (person, family) in family_names}
 
     # Unify previous last names to same format as WARSA actors: LASTNAME (ent PREVIOUS)
-    for (person, lname) in list(casualties[:SCHEMA_WARSA.family_name:]):
-        new_fam_lit = Literal(unify_family_name(lname))
-        casualties.remove((person, SCHEMA_WARSA.family_name, lname))
+    unified = normalize_names([family for (person, family) in family_names],
+                              [str(given_names.get(person)) for (person, family) in family_names])
+
+    casualties.remove((None, SCHEMA_WARSA.family_name, None))
+
+    for ((person, family), name) in zip(family_names, unified):
+        new_fam_lit = Literal(name.family)
         casualties.add((person, SCHEMA_WARSA.family_name, new_fam_lit))
 
-        given = casualties.value(person, SCHEMA_WARSA.given_names)
-        new_giv_lit = Literal(unify_given_name(given))
-        casualties.remove((person, SCHEMA_WARSA.given_names, given))
+        new_giv_lit = Literal(name.given)
+        casualties.remove((person, SCHEMA_WARSA.given_names, given_names.get(person)))
         casualties.add((person, SCHEMA_WARSA.given_names, new_giv_lit))
 
         full_name = '{family}, {given}'.format(family=new_fam_lit, given=new_giv_lit)
@@ -111,13 +107,111 @@ def unify_names(casualties: Graph):
     return casualties
 
 
+class StreamProcessor:
+    """
+    Apply the direct URI mappings and name unification in one pass over a stream of triples, writing the
+    processed triples as N-Triples. Only the name triples are held in memory until the end of the stream.
+
+    Can be used as a sink for an N-Triples parser.
+    """
+
+    def __init__(self, writer: NTriplesWriter, buffer_size=10000):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.family_names = {}
+        self.given_names = {}
+        self.mapped = {map_from: 0 for map_from in URI_MAPPINGS}
+
+    def _write(self, triple):
+        self.buffer.append(triple)
+        if len(self.buffer) >= self.buffer_size:
+            self.writer.write(self.buffer)
+            self.buffer = []
+
+    def triple(self, s, p, o):
+        map_to = URI_MAPPINGS.get(o)
+        if map_to is not None:
+            self.mapped[o] += 1
+            o = map_to
+
+        if p == SCHEMA_WARSA.family_name:
+            self.family_names.setdefault(s, []).append(o)
+        elif p == SCHEMA_WARSA.given_names:
+            self.given_names.setdefault(s, []).append(o)
+        else:
+            self._write((s, p, o))
+
+    def close(self):
+        """
+        Write the unified names and flush the output
+        """
+        for map_from, map_to in URI_MAPPINGS.items():
+            log.info('Applied mapping %s  -->  %s to %s triples' % (map_from, map_to, self.mapped[map_from]))
+
+        family_names = [(person, family) for (person, families) in self.family_names.items() for family in families]
+        given_names = [str(self.given_names.get(person, [None])[0]) for (person, family) in family_names]
+        unified = normalize_names([family for (person, family) in family_names], given_names)
+
+        previous_person = None
+        for ((person, family), name) in zip(family_names, unified):
+            new_fam_lit = Literal(name.family)
+            new_giv_lit = Literal(name.given)
+            self._write((person, SCHEMA_WARSA.family_name, new_fam_lit))
+            if person != previous_person:
+                self._write((person, SCHEMA_WARSA.given_names, new_giv_lit))
+                previous_person = person
+            full_name = '{family}, {given}'.format(family=new_fam_lit, given=new_giv_lit)
+            self._write((person, SKOS.prefLabel, Literal(full_name)))
+
+        # Only the first given names of a person with a family name are unified, like in unify_names
+        for (person, given_names) in self.given_names.items():
+            for given in (given_names[1:] if person in self.family_names else given_names):
+                self._write((person, SCHEMA_WARSA.given_names, given))
+
+        self.writer.write(self.buffer)
+        self.buffer = []
+
+
+def process_stream(input_file, output_file):
+    """
+    Process the death records without reading them into a graph. N-Triples input is read line by line, other
+    formats are parsed into a graph first. The output is written as N-Triples (which is also valid Turtle).
+    """
+    with NTriplesWriter(output_file) as writer:
+        processor = StreamProcessor(writer)
+
+        if is_ntriples(input_file):
+            parse_ntriples(input_file, processor)
+        else:
+            for triple in Graph().parse(input_file, format=guess_format(input_file)):
+                processor.triple(*triple)
+
+        processor.close()
+
+
 #######
 # MAIN
 
 
 def main(args):
 
-    surma = rdflib.Graph()
+    stage = Stage(args.output, [args.input], [args.output], args)
+    if args.incremental and stage.up_to_date():
+        print('Processed death records are up to date, skipping')
+        return
+
+    if args.stream:
+        print('Processing death records as a stream...')
+        process_stream(args.input, args.output)
+    else:
+        process_graph(args)
+
+    if args.incremental:
+        stage.record()
+
+
+def process_graph(args):
 
     ##################
     # READ IN RDF DATA
@@ -125,7 +219,7 @@ def main(args):
     # Read RDF graph from TTL files
     print('Processing death records...')
 
-    surma.parse(args.input, format='turtle')
+    surma = load_graph(args.input, snapshot=args.snapshot)
 
     print('Parsed {len} data triples.'.format(len=len(surma)))
 
@@ -148,11 +242,19 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Casualties of war')
-    parser.add_argument("input", help="Input turtle file")
+    parser.add_argument("input", help="Input turtle file, or N-Triples file (.nt or .nt.gz) with --stream")
     parser.add_argument("output", help="Output data file")
     parser.add_argument("--endpoint", default='http://ldf.fi/warsa/sparql', type=str, help="WarSampo SPARQL endpoint")
     parser.add_argument("--arpa_pnr", default='http://demo.seco.tkk.fi/arpa/pnr_municipality', type=str,
                            help="ARPA instance URL PNR linking")
+    parser.add_argument("--stream", action='store_true',
+                        help="Apply the fixes in one pass over the triples and write N-Triples directly, "
+                             "without reading the data into a graph")
+    parser.add_argument("--incremental", action='store_true',
+                        help="Skip processing if input, code and arguments have not changed since the last run")
+    parser.add_argument("--snapshot", action='store_true',
+                        help="Load the input from its binary snapshot if it is up to date, otherwise write one. "
+                             "Not used with --stream.")
     parser.add_argument("--loglevel", default='INFO',
                         choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
                         help="Logging level, default is INFO.")
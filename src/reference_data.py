@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Compiled reference data (cemeteries, municipality crosswalk and ranks) with hash-based lookups.
+
+The bundle is built once from the reference graphs, and loaded by the conversion and linking stages.
+"""
+
+import argparse
+import json
+import logging
+import os
+
+from rdflib import Graph, URIRef, Literal
+from rdflib.util import guess_format
+
+import http_cache
+import reference_graphs
+from namespaces import SCHEMA_CAS, SCHEMA_ACTORS, SKOS
+
+log = logging.getLogger(__name__)
+
+MUNICIPALITY_PROPERTIES = [SCHEMA_CAS.current_municipality, SCHEMA_CAS.wartime_municipality,
+                           SCHEMA_CAS.preferred_municipality]
+
+
+def _single_value(graph: Graph, subject, predicate):
+    values = sorted(graph.objects(subject, predicate))
+    if len(values) > 1:
+        log.warning('Multiple values for {p} of {s}, using {v}'.format(p=predicate, s=subject, v=values[0]))
+    return str(values[0]) if values else None
+
+
+class ReferenceData:
+    """
+    Lookups for cemeteries, municipality crosswalk (current, wartime and preferred municipalities) and rank levels
+    and labels. Keys are URI strings.
+    """
+
+    def __init__(self, cemeteries=(), municipalities=None, ranks=None):
+        """
+        :param cemeteries: cemetery URIs
+        :param municipalities: dict of casualty municipality URI -> [current, wartime, preferred] municipality URI
+        :param ranks: dict of rank URI -> {'level': level, 'labels': [[label, language], ...]}
+        """
+        self.cemeteries = set(URIRef(cemetery) for cemetery in cemeteries)
+        self.municipalities = municipalities or {}
+        self.ranks = ranks or {}
+
+    @classmethod
+    def from_graphs(cls, cemeteries: Graph = None, municipalities: Graph = None, ranks: Graph = None):
+        """
+        Compile reference data from RDF graphs
+        """
+        cemetery_uris = list(cemeteries.subjects()) if cemeteries is not None else []
+
+        munics = {}
+        if municipalities is not None:
+            for munic in set(municipalities.subjects()):
+                values = [_single_value(municipalities, munic, prop) for prop in MUNICIPALITY_PROPERTIES]
+                if any(values):
+                    munics[str(munic)] = values
+
+        rank_data = {}
+        if ranks is not None:
+            for rank in set(ranks.subjects()):
+                levels = list(ranks.objects(rank, SCHEMA_ACTORS.level))
+                labels = [[str(label), label.language] for label in ranks.objects(rank, SKOS.prefLabel)]
+                if levels or labels:
+                    # Rank level is left out if it is ambiguous
+                    rank_data[str(rank)] = {'level': int(levels[0]) if len(levels) == 1 else None, 'labels': labels}
+
+        return cls(cemeteries=cemetery_uris, municipalities=munics, ranks=rank_data)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, encoding='UTF-8') as f:
+            bundle = json.load(f)
+
+        log.info('Loaded reference data from {file}'.format(file=filename))
+        return cls(cemeteries=bundle['cemeteries'], municipalities=bundle['municipalities'], ranks=bundle['ranks'])
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='UTF-8') as f:
+            json.dump({'cemeteries': sorted(str(cemetery) for cemetery in self.cemeteries),
+                       'municipalities': self.municipalities,
+                       'ranks': self.ranks}, f, ensure_ascii=False, sort_keys=True)
+
+        log.info('Saved reference data to {file}'.format(file=filename))
+
+    def update(self, other):
+        """
+        Update with the non-empty parts of other reference data
+        """
+        if other.cemeteries:
+            self.cemeteries = other.cemeteries
+        if other.municipalities:
+            self.municipalities = other.municipalities
+        if other.ranks:
+            self.ranks = other.ranks
+
+    def _municipality(self, munic, index):
+        values = self.municipalities.get(str(munic))
+        value = values[index] if values else None
+        return URIRef(value) if value else None
+
+    def current_municipality(self, munic):
+        return self._municipality(munic, 0)
+
+    def wartime_municipality(self, munic):
+        return self._municipality(munic, 1)
+
+    def preferred_municipality(self, munic):
+        return self._municipality(munic, 2)
+
+    def rank_level(self, rank):
+        return self.ranks.get(str(rank), {}).get('level')
+
+    def rank_labels(self, rank):
+        return [Literal(label, lang=lang) for (label, lang) in self.ranks.get(str(rank), {}).get('labels', [])]
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Compile reference data bundle", fromfile_prefix_chars='@')
+
+    argparser.add_argument("output", help="Output bundle file (.json). An existing bundle is updated.")
+    argparser.add_argument("--cemeteries", help="Cemeteries RDF file")
+    argparser.add_argument("--municipalities", help="Municipalities RDF file (output of linking municipalities)")
+    argparser.add_argument("--endpoint", help="SPARQL endpoint to get ranks graph from")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+    http_cache.add_arguments(argparser)
+    reference_graphs.add_arguments(argparser)
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(filename=args.logfile,
+                        filemode='a',
+                        level=getattr(logging, args.loglevel),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    http_cache.install_from_args(args)
+    reference_graphs.install_from_args(args)
+
+    def parse(filename):
+        return Graph().parse(filename, format=guess_format(filename)) if filename else None
+
+    reference = ReferenceData.load(args.output) if os.path.exists(args.output) else ReferenceData()
+    reference.update(ReferenceData.from_graphs(
+        cemeteries=parse(args.cemeteries),
+        municipalities=parse(args.municipalities),
+        ranks=reference_graphs.read_graph(args.endpoint, "http://ldf.fi/warsa/ranks") if args.endpoint else None))
+
+    reference.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Local store of reference graphs (ranks, municipalities) read from the Warsa SPARQL endpoint.
+
+Each named graph is fetched once and stored as N-Triples with a binary snapshot for fast loading. A stored graph is
+used until it is older than the maximum age, and then fetched again. Graphs are also kept in memory, so stages
+running in the same process share them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from rdf_dm import read_graph_from_sparql as fetch_graph
+from rdflib import Graph
+
+import http_cache
+from snapshot import load_graph, save_graph
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+_store = None
+
+
+class ReferenceGraphStore:
+    """
+    Directory of stored reference graphs
+    """
+
+    def __init__(self, directory, max_age=DEFAULT_MAX_AGE):
+        """
+        :param directory: directory to store the graphs in
+        :param max_age: seconds to use a stored graph before fetching it again, None to use it until removed
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.graphs = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _filename(self, endpoint, graph_name):
+        name = hashlib.sha1('{endpoint} {graph}'.format(endpoint=endpoint, graph=graph_name).encode('utf-8'))
+        return os.path.join(self.directory, name.hexdigest()[:16])
+
+    def _read_info(self, filename):
+        try:
+            with open(filename + '.json', encoding='UTF-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_info(self, filename, info):
+        with open(filename + '.json', 'w', encoding='UTF-8') as f:
+            json.dump(info, f, indent=2)
+
+    def is_fresh(self, filename, info):
+        """
+        Check that a graph is stored and younger than the maximum age
+        """
+        if not os.path.exists(filename + '.nt'):
+            return False
+
+        if http_cache.is_replaying() or self.max_age is None:
+            return True
+
+        return time.time() - info.get('fetched', 0) < self.max_age
+
+    def checksum(self, endpoint, graph_name):
+        """
+        Get the checksum of a stored graph without loading it
+
+        :return: SHA-1 of the stored N-Triples file, or None if the graph is not stored or is too old
+        """
+        filename = self._filename(endpoint, graph_name)
+        info = self._read_info(filename)
+        if not info or not self.is_fresh(filename, info):
+            return None
+
+        return info.get('sha1')
+
+    def graph(self, endpoint, graph_name) -> Graph:
+        """
+        Get a named graph from the store, fetching it from the endpoint if it is not stored or is too old
+        """
+        key = (endpoint, graph_name)
+        if key in self.graphs:
+            return self.graphs[key]
+
+        filename = self._filename(endpoint, graph_name)
+        info = self._read_info(filename)
+
+        if info and self.is_fresh(filename, info):
+            graph = load_graph(filename + '.nt', snapshot=True)
+            log.info('Loaded {num} triples of {graph} from {file}'.format(num=len(graph), graph=graph_name,
+                                                                        file=filename))
+        else:
+            log.info('Fetching {graph} from {endpoint}'.format(graph=graph_name, endpoint=endpoint))
+            if http_cache.is_replaying():
+                graph = http_cache.read_graph_from_sparql(endpoint, graph_name)
+            else:
+                graph = fetch_graph(endpoint, graph_name=graph_name)
+
+            self.save(endpoint, graph_name, graph)
+
+        self.graphs[key] = graph
+        return graph
+
+    def save(self, endpoint, graph_name, graph: Graph):
+        """
+        Store a named graph read from the endpoint
+        """
+        filename = self._filename(endpoint, graph_name)
+        save_graph(graph, filename + '.nt', snapshot=True)
+        with open(filename + '.nt', 'rb') as f:
+            sha1 = hashlib.sha1(f.read()).hexdigest()
+
+        self._write_info(filename, {'endpoint': endpoint, 'graph': graph_name, 'sha1': sha1, 'fetched': time.time()})
+
+
+def install(directory, max_age=DEFAULT_MAX_AGE):
+    """
+    Start serving reference graphs from a local store
+    """
+    global _store
+
+    _store = ReferenceGraphStore(directory, max_age=max_age)
+    log.info('Using reference graph store {dir}'.format(dir=directory))
+    return _store
+
+
+def uninstall():
+    global _store
+
+    _store = None
+
+
+def read_graph(endpoint, graph_name) -> Graph:
+    """
+    Read a named graph from the reference graph store if it is installed, otherwise from the endpoint
+    """
+    if _store is None:
+        return http_cache.read_graph_from_sparql(endpoint, graph_name)
+
+    return _store.graph(endpoint, graph_name)
+
+
+def graph_checksum(endpoint, graph_name):
+    """
+    Get the checksum of a graph in the reference graph store, which changes whenever the graph is fetched with
+    different contents
+
+    :return: checksum, or None if the store is not installed or the graph is not stored or is too old
+    """
+    if _store is None:
+        return None
+
+    return _store.checksum(endpoint, graph_name)
+
+
+def add_arguments(argparser):
+    """
+    Add reference graph store options to an argument parser
+    """
+    argparser.add_argument("--reference_graphs", help="Directory to store reference graphs read from the endpoint in")
+    argparser.add_argument("--reference_graphs_max_age", type=float, default=DEFAULT_MAX_AGE,
+                           help="Seconds to use a stored reference graph before fetching it again, "
+                                "default is {age}".format(age=DEFAULT_MAX_AGE))
+
+
+def install_from_args(args):
+    if args.reference_graphs:
+        return install(args.reference_graphs, max_age=args.reference_graphs_max_age)
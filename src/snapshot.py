@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Binary snapshots of RDF graphs for fast loading of intermediate files.
+
+A snapshot of file <name> is stored in directory <name>.snapshot as a dictionary of encoded RDF terms
+(terms.json), an integer array of triples referring to the terms (triples.npy) and the size, modification time and
+hash of the file it was made from (source.json). A snapshot is only used if the file has not changed since.
+
+Loading a snapshot skips parsing, but the triples are still added to an in-memory rdflib graph one by one, which takes
+most of the load time.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.util import guess_format
+
+from incremental import file_hash
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100000
+
+
+def snapshot_dir(filename):
+    return '{file}.snapshot'.format(file=filename)
+
+
+def encode_term(term):
+    if isinstance(term, Literal):
+        return ['l', str(term), term.language, str(term.datatype) if term.datatype else None]
+    elif isinstance(term, BNode):
+        return ['b', str(term)]
+
+    return ['u', str(term)]
+
+
+def decode_term(encoded):
+    if encoded[0] == 'l':
+        return Literal(encoded[1], lang=encoded[2], datatype=URIRef(encoded[3]) if encoded[3] else None)
+    elif encoded[0] == 'b':
+        return BNode(encoded[1])
+
+    return URIRef(encoded[1])
+
+
+def _source_info(filename):
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def save_snapshot(graph: Graph, filename):
+    """
+    Write a snapshot of a graph serialized (or parsed) from a file
+    """
+    directory = snapshot_dir(filename)
+    os.makedirs(directory, exist_ok=True)
+
+    term_ids = {}
+    terms = []
+    triples = np.empty((len(graph), 3), dtype=np.int32)
+
+    for (index, triple) in enumerate(graph):
+        for (position, term) in enumerate(triple):
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(terms)
+                terms.append(encode_term(term))
+            triples[index, position] = term_id
+
+    # Remove the source information first, so that an interrupted write leaves no valid snapshot
+    source_file = os.path.join(directory, 'source.json')
+    if os.path.exists(source_file):
+        os.remove(source_file)
+
+    with open(os.path.join(directory, 'terms.json'), 'w', encoding='UTF-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+
+    np.save(os.path.join(directory, 'triples.npy'), triples)
+
+    source = _source_info(filename)
+    source['sha256'] = file_hash(filename)
+    with open(source_file, 'w', encoding='UTF-8') as f:
+        json.dump(source, f)
+
+    log.info('Wrote snapshot of {num} triples and {terms} terms to {dir}'.
+             format(num=len(triples), terms=len(terms), dir=directory))
+
+
+def snapshot_is_valid(filename):
+    """
+    Check that a snapshot exists and the file has not changed since it was made. If only the modification time
+    has changed, the file contents are compared by hash.
+    """
+    try:
+        with open(os.path.join(snapshot_dir(filename), 'source.json'), encoding='UTF-8') as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    current = _source_info(filename)
+    if current['size'] != recorded['size']:
+        return False
+
+    return current['mtime'] == recorded['mtime'] or file_hash(filename) == recorded['sha256']
+
+
+def load_snapshot(filename):
+    """
+    Load a graph from the snapshot of a file
+
+    :return: Graph, or None if there is no valid snapshot
+    """
+    if not snapshot_is_valid(filename):
+        return None
+
+    directory = snapshot_dir(filename)
+    with open(os.path.join(directory, 'terms.json'), encoding='UTF-8') as f:
+        terms = [decode_term(term) for term in json.load(f)]
+
+    triples = np.load(os.path.join(directory, 'triples.npy'))
+
+    graph = Graph()
+    for start in range(0, len(triples), CHUNK_SIZE):
+        graph.addN((terms[s], terms[p], terms[o], graph) for (s, p, o) in triples[start:start + CHUNK_SIZE].tolist())
+
+    log.info('Loaded {num} triples from snapshot {dir}'.format(num=len(graph), dir=directory))
+    return graph
+
+
+def load_graph(filename, snapshot=False):
+    """
+    Load a graph from an RDF file. With snapshot, use the snapshot of the file if it is up to date, or parse
+    the file and write a snapshot for the next load.
+    """
+    if snapshot:
+        graph = load_snapshot(filename)
+        if graph is not None:
+            return graph
+
+    graph = Graph().parse(filename, format=guess_format(filename))
+
+    if snapshot:
+        save_snapshot(graph, filename)
+
+    return graph
+
+
+def save_graph(graph: Graph, filename, snapshot=False):
+    """
+    Serialize a graph to an RDF file, and write a snapshot of it alongside
+    """
+    graph.serialize(filename, format=guess_format(filename))
+
+    if snapshot:
+        save_snapshot(graph, filename)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Write binary snapshots of RDF files", fromfile_prefix_chars='@')
+
+    argparser.add_argument("input", nargs='+', help="Input RDF files")
+    argparser.add_argument("--timing", action='store_true',
+                           help="Print the time of parsing each file and of loading it from its snapshot")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(filename=args.logfile,
+                        filemode='a',
+                        level=getattr(logging, args.loglevel),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.timing:
+        print('{:>40} {:>10} {:>10} {:>10} {:>8}'.format('file', 'triples', 'parse', 'snapshot', 'speedup'))
+
+    for filename in args.input:
+        start = time.time()
+        graph = Graph().parse(filename, format=guess_format(filename))
+        parse_seconds = time.time() - start
+
+        if not snapshot_is_valid(filename):
+            save_snapshot(graph, filename)
+
+        if args.timing:
+            start = time.time()
+            load_snapshot(filename)
+            snapshot_seconds = time.time() - start
+            print('{:>40} {:>10} {:>10.2f} {:>10.2f} {:>8.1f}'.format(filename[-40:], len(graph), parse_seconds,
+                                                                     snapshot_seconds,
+                                                                     parse_seconds / snapshot_seconds))
+
+
+if __name__ == '__main__':
+    main()
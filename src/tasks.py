@@ -9,6 +9,7 @@ from io import StringIO
 
 from rdflib import *
 
+import http_cache
 from namespaces import SCHEMA_WARSA, CRM, bind_namespaces
 
 log = logging.getLogger(__name__)
@@ -68,6 +69,7 @@ if __name__ == '__main__':
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
                            help="Logging level, default is INFO.")
     argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
+    http_cache.add_arguments(argparser)
 
     args = argparser.parse_args()
 
@@ -76,6 +78,8 @@ if __name__ == '__main__':
 
     log.info('Starting to run tasks with arguments: {args}'.format(args=args))
 
+    http_cache.install_from_args(args)
+
     if args.task == 'documents_links':
         log.info('Loading input file...')
         death_records = load_input_file(args.input, args.format)
@@ -5,14 +5,55 @@ Tests for data conversion
 
 To run all tests (including doctests) you can use for example nose: nosetests --with-doctest
 """
+import argparse
+import csv
 import datetime
+import os
+import pickle
+import re
+import tempfile
 import unittest
+from io import BytesIO, StringIO
 from pprint import pprint, pformat
 
-from rdflib import Graph, URIRef, Literal, RDF
+import openpyxl
+import requests
+from rdflib import Graph, URIRef, Literal, RDF, BNode
 
-from linker import _generate_casualties_dict
-from namespaces import RANKS_NS, SKOS, SCHEMA_ACTORS, MUNICIPALITIES, SCHEMA_CAS, SCHEMA_WARSA
+from casualty_records import CasualtyRecord
+from converters import MemoizedConverter
+from csv_to_rdf import RDFMapper
+import http_cache
+from incremental import Stage
+from local_services import LocalServices
+import dedupe
+import link_decisions
+from link_decisions import LinkDecisionStore, greedy_links, record_fingerprint
+from linkage_model import model_key, scoring_cores
+from linker import _generate_casualties_dict, _group_by_unit_literal
+from mapping import CASUALTY_MAPPING
+from municipality_index import MunicipalityIndex
+from pipeline import Pipeline
+from pnr_gazetteer import PNRGazetteer
+from process import fix_by_direct_uri_mappings, process_graph, process_stream, unify_names
+from namespaces import RANKS_NS, SKOS, SCHEMA_ACTORS, MUNICIPALITIES, SCHEMA_CAS, SCHEMA_WARSA, DATA_CAS, CEMETERIES, \
+    GEORSS, SCHEMA_PNR
+from reference_data import ReferenceData
+import reference_graphs
+from reference_graphs import ReferenceGraphStore
+from snapshot import load_graph, snapshot_is_valid
+from unit_index import UnitIndex
+
+CSV_HEADER = 'ID,SNIMI,ENIMET,SSAATY,SPUOLI,KANSALAISUUS,KANSALLISUUS,AIDINKIELI,LASTENLKM,AMMATTI,SOTARVO,' \
+             'JOSKOODI,JOSNIMI,SAIKA,SKUNTA,KIRJKUNTA,ASKUNTA,HAAVAIKA,HAAVKUNTA,HAAVPAIKKA,KATOAIKA,KATOKUNTA,' \
+             'KATOPAIKKA,KUOLINAIKA,KUOLINKUNTA,KUOLINPAIKKA,MENEHTLUOKKA,HKUNTA,HMAA,HPAIKKA,VAPAA_PAIKKATIETO\n'
+
+CSV_ROWS = [
+    '1,HEINO,EINO ILMARI,N,M,SU,SU,su,2,Maanviljelijä,Korpraali,1234,1./JR 8,23.12.1906,1903,1903,x,'
+    '12.O3.1940,0004,,,,,23.12.1941,0004,Taipale,A,0004,1,12,ammuttu\n',
+    '2,VIRTANEN,MATTI,Q,,,,,x,,,,,xx.xx.1915,,,,31.02.1941,,,..,,,16.12.0199,,,,0004,A,,\n',
+    '3,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,\n',
+]
 
 
 class TestPersonLinking(unittest.TestCase):
@@ -40,7 +81,7 @@ class TestPersonLinking(unittest.TestCase):
                     'family': 'Heino',
                     'given': 'Eino Ilmari',
                     'person': None,
-                    'rank': 'http://ldf.fi/schema/warsa/actors/ranks/Korpraali',
+                    'rank': ['http://ldf.fi/schema/warsa/actors/ranks/Korpraali'],
                     'rank_level': 3,
                     'unit': None}
         }
@@ -57,3 +98,571 @@ class TestPersonLinking(unittest.TestCase):
         pd = _generate_casualties_dict(g, self.ranks, self.munics)
 
         self.assertEqual(expected, pd, pformat(pd))
+
+    def test_casualty_record(self):
+        record = CasualtyRecord(given='Eino Ilmari', family='Heino', rank_level=3)
+
+        self.assertEqual(record, dict(record))
+        self.assertEqual(record['rank_level'], 3)
+        self.assertIsNone(record['unit'])
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+        with self.assertRaises(KeyError):
+            record['foo'] = 'bar'
+
+    def test_municipality_index(self):
+        warsa_munics = Graph()
+        warsa_munics.add((URIRef('http://ldf.fi/warsa/places/municipalities/m_place_1'), SKOS.prefLabel,
+                          Literal('Pietarsaaren mlk', lang='fi')))
+        warsa_munics.add((URIRef('http://ldf.fi/warsa/places/municipalities/m_place_1'), SKOS.altLabel,
+                          Literal('Pedersöre', lang='sv')))
+        warsa_munics.add((URIRef('http://ldf.fi/warsa/places/municipalities/m_place_2'), SKOS.prefLabel,
+                          Literal('Pietarsaari', lang='fi')))
+        warsa_munics.add((URIRef('http://ldf.fi/warsa/places/municipalities/m_place_3'), SKOS.altLabel,
+                          Literal('Pietarsaari')))
+
+        index = MunicipalityIndex.from_graph(warsa_munics)
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(os.path.join(directory, 'index.json'))
+            index = MunicipalityIndex.load(os.path.join(directory, 'index.json'))
+
+        self.assertEqual(index.match([Literal('PIETARSAAREN  MLK'), Literal('Foo')]),
+                         URIRef('http://ldf.fi/warsa/places/municipalities/m_place_1'))
+        self.assertEqual(index.match(['Pedersöre']), URIRef('http://ldf.fi/warsa/places/municipalities/m_place_1'))
+        self.assertIsNone(index.match(['Pietarsaari']))
+        self.assertIsNone(index.match(['Foo']))
+
+    def test_municipality_index_source(self):
+        warsa_munics = Graph()
+        warsa_munics.add((URIRef('http://ldf.fi/warsa/places/municipalities/m_place_2'), SKOS.prefLabel,
+                          Literal('Pietarsaari', lang='fi')))
+
+        (endpoint, graph_name) = ('http://ldf.fi/warsa/sparql', 'http://ldf.fi/warsa/places/municipalities')
+        with tempfile.TemporaryDirectory() as directory:
+            store = ReferenceGraphStore(directory)
+            self.assertIsNone(store.checksum(endpoint, graph_name))
+
+            store.save(endpoint, graph_name, warsa_munics)
+            source = store.checksum(endpoint, graph_name)
+            MunicipalityIndex.from_graph(warsa_munics, source=source).save(os.path.join(directory, 'index.json'))
+            self.assertEqual(MunicipalityIndex.load(os.path.join(directory, 'index.json')).source, source)
+
+            warsa_munics.set((URIRef('http://ldf.fi/warsa/places/municipalities/m_place_2'), SKOS.prefLabel,
+                              Literal('Jakobstad', lang='sv')))
+            store.save(endpoint, graph_name, warsa_munics)
+            self.assertNotEqual(store.checksum(endpoint, graph_name), source)
+
+            store = ReferenceGraphStore(directory, max_age=0)
+            self.assertIsNone(store.checksum(endpoint, graph_name))
+
+    def test_group_by_unit_literal(self):
+        graph = Graph()
+        for (person, unit, death) in [('p1', 'JR 8', '1940-01-01'), ('p2', 'JR 8', '1940-02-01'),
+                                      ('p3', 'JR 8', '1942-01-01'), ('p4', 'JR 9', '1940-01-01')]:
+            graph.add((DATA_CAS[person], SCHEMA_CAS.unit_literal, Literal(unit)))
+            graph.add((DATA_CAS[person], SCHEMA_WARSA.date_of_death, Literal(death)))
+
+        groups = _group_by_unit_literal(graph, [DATA_CAS.p1, DATA_CAS.p2, DATA_CAS.p3, DATA_CAS.p4])
+        self.assertEqual(list(groups.values()), [[DATA_CAS.p1, DATA_CAS.p2], [DATA_CAS.p3], [DATA_CAS.p4]])
+        self.assertEqual([winter_war for (unit, winter_war) in groups], [True, False, True])
+
+    def test_reference_data(self):
+        reference = ReferenceData.from_graphs(ranks=self.ranks, municipalities=self.munics)
+
+        self.assertEqual(reference.rank_level(RANKS_NS.Korpraali), 3)
+        self.assertIsNone(reference.rank_level(RANKS_NS.Sotamies))
+        self.assertEqual(reference.rank_labels(RANKS_NS.Kapteeni), [Literal('Kapteeni', lang='fi')])
+        self.assertEqual(reference.current_municipality(MUNICIPALITIES.k1903),
+                         URIRef('http://ldf.fi/pnr/P_10746999'))
+        self.assertIsNone(reference.wartime_municipality(MUNICIPALITIES.k1903))
+        self.assertEqual(reference.preferred_municipality(MUNICIPALITIES.k1903),
+                         URIRef('http://ldf.fi/warsa/places/municipalities/m_place_21'))
+
+
+class TestCSVConversion(unittest.TestCase):
+    maxDiff = None
+
+    def _mapper(self):
+        mapper = RDFMapper(CASUALTY_MAPPING, SCHEMA_WARSA.DeathRecord, cemeteries=[CEMETERIES.h0004_1],
+                           errors=StringIO())
+        mapper.read_csv(StringIO(CSV_HEADER + ''.join(CSV_ROWS)))
+        return mapper
+
+    def _map_rows(self, mapper):
+        graph = Graph()
+        for index in mapper.table.index:
+            person_id = mapper.table.ix[index][0]
+            graph += mapper.map_row_to_rdf(DATA_CAS['p' + str(person_id)], mapper.table.ix[index][1:],
+                                           person_id=person_id)
+        return graph
+
+    def test_map_row_to_rdf(self):
+        mapper = self._mapper()
+        graph = self._map_rows(mapper)
+
+        self.assertEqual(graph.value(DATA_CAS.p1, SCHEMA_WARSA.date_of_birth), Literal(datetime.date(1906, 12, 23)))
+        self.assertEqual(graph.value(DATA_CAS.p1, SCHEMA_WARSA.buried_in), CEMETERIES.h0004_1)
+        self.assertIsNone(graph.value(DATA_CAS.p1, SCHEMA_CAS.graveyard_number))
+        self.assertEqual(graph.value(DATA_CAS.p2, SCHEMA_WARSA.date_of_death), Literal(datetime.date(1939, 12, 16)))
+        self.assertEqual(graph.value(DATA_CAS.p2, SCHEMA_CAS.graveyard_number), Literal('A'))
+        self.assertEqual(graph.value(DATA_CAS.p3, SCHEMA_WARSA.gender),
+                         URIRef('http://ldf.fi/warsa/genders/Tuntematon'))
+        mapper.errors.close()
+        self.assertEqual(mapper.errors.summary(), [['HAAVAIKA', 'Päivämäärä ei ole kelvollinen', 1]])
+        self.assertTrue(mapper.errors.destination.getvalue().startswith('nro,nimi,sarake,virhe,arvo\n2,'))
+
+    def test_map_table_to_rdf(self):
+        row_mapper = self._mapper()
+        row_graph = self._map_rows(row_mapper)
+
+        column_mapper = self._mapper()
+        column_graph = Graph()
+        for row_triples in column_mapper.map_table_to_rdf(column_mapper.table):
+            for triple in row_triples:
+                column_graph.add(triple)
+
+        self.assertEqual(sorted(row_graph), sorted(column_graph))
+        self.assertEqual(row_mapper.errors.destination.getvalue(), column_mapper.errors.destination.getvalue())
+
+        cache_stats = {column: (converter.hits, converter.misses)
+                       for (column, converter) in column_mapper.cell_converters.items()}
+        self.assertEqual(cache_stats, {column: (converter.hits, converter.misses)
+                                       for (column, converter) in row_mapper.cell_converters.items()})
+        self.assertEqual(cache_stats['HKUNTA'], (1, 2))
+
+    def test_process_parallel(self):
+        serial_mapper = self._mapper()
+        serial_mapper.process_rows()
+
+        for batch in [False, True]:
+            parallel_mapper = self._mapper()
+            parallel_mapper.process_parallel(2, batch=batch, chunk_size=1)
+
+            self.assertEqual(sorted(parallel_mapper.data), sorted(serial_mapper.data))
+            self.assertEqual(parallel_mapper.errors.destination.getvalue(), serial_mapper.errors.destination.getvalue())
+
+            # Each worker has its own caches, so only the number of lookups is the same as in a serial run
+            for (column, converter) in parallel_mapper.cell_converters.items():
+                serial_converter = serial_mapper.cell_converters[column]
+                self.assertEqual(converter.hits + converter.misses, serial_converter.hits + serial_converter.misses)
+                self.assertGreaterEqual(converter.misses, serial_converter.misses)
+
+    def test_read_xlsx(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        for (row_number, line) in enumerate([CSV_HEADER] + CSV_ROWS, start=1):
+            for (column_number, value) in enumerate(next(csv.reader([line])), start=1):
+                cell = sheet.cell(row=row_number, column=column_number)
+                if row_number == 1 or not value:
+                    cell.value = value or None
+                elif re.fullmatch(r'\d\d\.\d\d\.\d{4}', value) and int(value[:2]) <= 28:
+                    cell.value = datetime.datetime.strptime(value, '%d.%m.%Y')
+                    cell.number_format = 'dd.mm.yyyy'
+                elif value.isdigit():
+                    cell.value = int(value)
+                    cell.number_format = '0' * len(value)
+                else:
+                    cell.value = value
+        xlsx = BytesIO()
+        workbook.save(xlsx)
+        xlsx.seek(0)
+
+        xlsx_mapper = RDFMapper(CASUALTY_MAPPING, SCHEMA_WARSA.DeathRecord, errors=StringIO())
+        xlsx_mapper.read_xlsx(xlsx)
+
+        csv_mapper = self._mapper()
+        self.assertEqual(xlsx_mapper.table.values.tolist(), csv_mapper.table.values.tolist())
+        self.assertEqual(list(xlsx_mapper.table.columns), list(csv_mapper.table.columns))
+
+        xlsx.seek(0)
+        xlsx_mapper.read_xlsx(xlsx, limit=1)
+        self.assertEqual(xlsx_mapper.table.values.tolist(), csv_mapper.table.values.tolist()[:1])
+
+    def test_memoized_converter(self):
+        calls = []
+        converter = MemoizedConverter(lambda value: calls.append(value) or value.upper(), cache_size=2)
+
+        self.assertEqual([converter(value) for value in ['a', 'b', 'a', 'c', 'b', 'a']],
+                         ['A', 'B', 'A', 'C', 'B', 'A'])
+        self.assertEqual(calls, ['a', 'b', 'c', 'b', 'a'])
+        self.assertEqual((converter.hits, converter.misses), (1, 5))
+
+
+class TestIncremental(unittest.TestCase):
+
+    def test_stage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            (input_file, output_file) = (os.path.join(directory, 'input.csv'), os.path.join(directory, 'output.ttl'))
+            for (filename, content) in [(input_file, 'a,b\n'), (output_file, 'output\n')]:
+                with open(filename, 'w') as f:
+                    f.write(content)
+
+            args = argparse.Namespace(batch=False, loglevel='INFO')
+            self.assertFalse(Stage(output_file, [input_file], [output_file], args).up_to_date())
+            Stage(output_file, [input_file], [output_file], args).record()
+            self.assertTrue(Stage(output_file, [input_file], [output_file], args).up_to_date())
+
+            with open(input_file, 'a') as f:
+                f.write('c,d\n')
+            self.assertFalse(Stage(output_file, [input_file], [output_file], args).up_to_date())
+            Stage(output_file, [input_file], [output_file], args).record()
+
+            self.assertTrue(Stage(output_file, [input_file], [output_file],
+                                  argparse.Namespace(batch=False, loglevel='DEBUG')).up_to_date())
+            self.assertFalse(Stage(output_file, [input_file], [output_file],
+                                   argparse.Namespace(batch=True, loglevel='INFO')).up_to_date())
+
+            with open(output_file, 'a') as f:
+                f.write('edited\n')
+            self.assertFalse(Stage(output_file, [input_file], [output_file], args).up_to_date())
+
+
+class TestPipeline(unittest.TestCase):
+
+    def _write_graph(self, filename, *triples):
+        graph = Graph()
+        for triple in triples:
+            graph.add(triple)
+        graph.serialize(filename, format='turtle')
+        return filename
+
+    def test_convert_and_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            casualties_file = os.path.join(directory, 'casualties.csv')
+            with open(casualties_file, 'w') as f:
+                f.write(CSV_HEADER + ''.join(CSV_ROWS))
+            cemeteries_file = self._write_graph(os.path.join(directory, 'cemeteries.ttl'),
+                                                (CEMETERIES.h0004_1, SKOS.prefLabel, Literal('Taipale')))
+            schema_base_file = self._write_graph(os.path.join(directory, 'schema_base.ttl'),
+                                                 (SCHEMA_WARSA.DeathRecord, SKOS.prefLabel, Literal('Kuolinasiakirja')))
+            additions_file = self._write_graph(os.path.join(directory, 'additions.ttl'),
+                                               (DATA_CAS.p3, SCHEMA_WARSA.family_name, Literal('LAHTINEN')))
+
+            # Stages run like in convert.sh and process.sh
+            mapper = RDFMapper(CASUALTY_MAPPING, SCHEMA_WARSA.DeathRecord, cemeteries=[CEMETERIES.h0004_1],
+                               errors=StringIO())
+            mapper.read_csv(casualties_file)
+            mapper.process_rows()
+            mapper.serialize(os.path.join(directory, 'initial.ttl'), os.path.join(directory, 'schema.ttl'))
+            process_graph(argparse.Namespace(input=os.path.join(directory, 'initial.ttl'),
+                                             output=os.path.join(directory, 'processed.ttl'), snapshot=False))
+
+            pipeline = Pipeline(output_dir=directory)
+            converted = pipeline.convert(casualties_file, cemeteries_file, schema_base_file)
+            self.assertEqual(sorted(converted), sorted(Graph().parse(os.path.join(directory, 'initial.ttl'),
+                                                                     format='turtle')))
+            with open(os.path.join(directory, 'errors.csv'), encoding='UTF-8') as f:
+                self.assertEqual(f.read(), mapper.errors.destination.getvalue())
+
+            schema = Graph().parse(os.path.join(directory, 'casualties_schema.ttl'), format='turtle')
+            expected_schema = Graph().parse(os.path.join(directory, 'schema.ttl'), format='turtle')
+            expected_schema.parse(schema_base_file, format='turtle')
+            self.assertEqual(sorted(schema), sorted(expected_schema))
+
+            processed = pipeline.process(converted, additions_file)
+            expected = Graph().parse(os.path.join(directory, 'processed.ttl'), format='turtle')
+            expected.parse(additions_file, format='turtle')
+            self.assertEqual(sorted(processed), sorted(expected))
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_snapshot_roundtrip(self):
+        graph = Graph()
+        graph.add((DATA_CAS.p1, SCHEMA_WARSA.date_of_birth, Literal(datetime.date(1906, 12, 23))))
+        graph.add((DATA_CAS.p1, SKOS.prefLabel, Literal('Heino, Eino', lang='fi')))
+        graph.add((DATA_CAS.p1, SCHEMA_CAS.unit, BNode('unit1')))
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'graph.ttl')
+            graph.serialize(filename, format='turtle')
+
+            self.assertFalse(snapshot_is_valid(filename))
+            parsed = load_graph(filename, snapshot=True)
+            self.assertTrue(snapshot_is_valid(filename))
+            self.assertEqual(set(load_graph(filename, snapshot=True)), set(parsed))
+            self.assertEqual(len(parsed), len(graph))
+
+            with open(filename, 'a') as f:
+                f.write('<http://example.com/a> <http://example.com/b> <http://example.com/c> .\n')
+            self.assertFalse(snapshot_is_valid(filename))
+
+
+class TestProcessing(unittest.TestCase):
+
+    def test_process_stream(self):
+        graph = Graph()
+        graph.add((DATA_CAS.p1, SCHEMA_WARSA.family_name, Literal('VIRTANEN (ent. LAHTINEN)')))
+        graph.add((DATA_CAS.p1, SCHEMA_WARSA.given_names, Literal('Matti Johannes')))
+        graph.add((DATA_CAS.p1, SCHEMA_CAS.rank_literal, Literal('Alikers')))
+        graph.add((DATA_CAS.p2, SCHEMA_WARSA.family_name, Literal('HEINO')))
+        graph.add((DATA_CAS.p2, SCHEMA_WARSA.given_names, Literal('Eino')))
+        graph.add((DATA_CAS.p2, SCHEMA_WARSA.buried_in, CEMETERIES.x))
+        graph.add((DATA_CAS.p3, SCHEMA_WARSA.given_names, Literal('Toivo')))
+
+        with tempfile.TemporaryDirectory() as directory:
+            graph.serialize(os.path.join(directory, 'input.nt'), format='nt')
+            process_stream(os.path.join(directory, 'input.nt'), os.path.join(directory, 'output.nt'))
+            streamed = Graph().parse(os.path.join(directory, 'output.nt'), format='nt')
+
+        expected = unify_names(fix_by_direct_uri_mappings(graph))
+        self.assertEqual(sorted(streamed), sorted(expected))
+        self.assertEqual(streamed.value(DATA_CAS.p3, SCHEMA_WARSA.given_names), Literal('Toivo'))
+        self.assertEqual(streamed.value(DATA_CAS.p2, SCHEMA_WARSA.buried_in), CEMETERIES.hx_0)
+
+
+class TestHTTPCache(unittest.TestCase):
+
+    def test_response_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = http_cache.ResponseCache(os.path.join(directory, 'cache.sqlite'), max_size=10)
+            key = http_cache.cache_key('POST', 'http://example.com/sparql', data={'query': 'SELECT *\n WHERE { ?s ?p ?o }'})
+
+            self.assertEqual(key, http_cache.cache_key('POST', 'http://example.com/sparql',
+                                                       data={'query': 'SELECT * WHERE {  ?s ?p ?o }'}))
+            self.assertIsNone(cache.get(key))
+
+            cache.put(key, 'http://example.com/sparql', 200, {'Content-Type': 'application/json'}, b'{}')
+            self.assertEqual(cache.get(key), (200, {'Content-Type': 'application/json'}, b'{}'))
+
+            cache.put('other', 'http://example.com/sparql', 200, {}, b'0123456789')
+            self.assertIsNone(cache.get(key))
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            cache.close()
+
+    def test_cache_key_literals(self):
+        def key(data):
+            return http_cache.cache_key('POST', 'http://example.com/sparql', data=data)
+
+        self.assertNotEqual(key({'query': 'SELECT * { ?s ?p "JR  8" }'}), key({'query': 'SELECT * { ?s ?p "JR 8" }'}))
+        self.assertEqual(key({'query': 'SELECT *  {\n ?s ?p "JR  8" }'}), key({'query': 'SELECT * { ?s ?p "JR  8" }'}))
+        self.assertNotEqual(key({'text': 'JR  8'}), key({'text': 'JR 8'}))
+
+    def test_replay_miss(self):
+        with tempfile.TemporaryDirectory() as directory:
+            http_cache.install(os.path.join(directory, 'cache.sqlite'), mode='replay')
+            try:
+                with self.assertRaises(http_cache.CacheMissError):
+                    requests.post('http://example.com/sparql', {'query': 'ASK {}'})
+            finally:
+                http_cache.uninstall()
+
+
+class TestLinkageModel(unittest.TestCase):
+
+    def test_model_key(self):
+        fields = [{'field': 'given', 'type': 'String'},
+                  {'field': 'rank', 'type': 'Custom', 'comparator': model_key, 'has missing': True}]
+        links = {'match': [[{'given': 'Eino'}, {'given': 'Eino'}]], 'distinct': []}
+
+        self.assertEqual(model_key(links, fields), model_key(dict(links), [dict(field) for field in fields]))
+        self.assertNotEqual(model_key(links, fields), model_key(links, fields[:1]))
+        self.assertNotEqual(model_key(links, fields), model_key({'match': [], 'distinct': []}, fields))
+
+    def test_scoring_cores(self):
+        fields = [{'field': 'given', 'type': 'String'}]
+        with scoring_cores(3):
+            self.assertEqual(dedupe.RecordLink(fields, num_cores=1).num_cores, 3)
+        self.assertEqual(dedupe.RecordLink(fields, num_cores=1).num_cores, 1)
+
+
+class TestLinkDecisions(unittest.TestCase):
+
+    def test_record_fingerprint(self):
+        record = CasualtyRecord(given='Eino Ilmari', family='Heino', unit=['b', 'a'], rank_level=3)
+
+        self.assertEqual(record_fingerprint(record), record_fingerprint(dict(record, unit=['a', 'b'])))
+        self.assertNotEqual(record_fingerprint(record), record_fingerprint(dict(record, rank_level=4)))
+
+    def test_greedy_links(self):
+        pairs = [(('c1', 'w1'), 0.9), (('c2', 'w1'), 0.95), (('c1', 'w2'), 0.7), (('c3', 'w2'), 0.6)]
+        self.assertEqual(greedy_links(pairs), [(('c2', 'w1'), 0.95), (('c1', 'w2'), 0.7)])
+
+    class FakeBlocker:
+        def __init__(self, index_fields):
+            self.index_fields = index_fields
+
+        def resetIndices(self):
+            pass
+
+    class FakeLinker:
+        """
+        Blocks records by the initial of the family name and scores pairs by the similarity of given names
+        """
+
+        def __init__(self, index_fields=None):
+            self.blocker = TestLinkDecisions.FakeBlocker(index_fields or {})
+            self.data_model = self.classifier = None
+            self.num_cores = 1
+            self.scored = 0
+
+        def _blockData(self, data_1, data_2):
+            for (id_1, record_1) in sorted(data_1.items()):
+                yield (id_1, record_1), [(id_2, record_2) for (id_2, record_2) in sorted(data_2.items())
+                                         if record_2['family'][0] == record_1['family'][0]]
+
+        def _blockedPairs(self, blocks):
+            for (record_1, records_2) in blocks:
+                yield [(record_1, record_2) for record_2 in records_2]
+
+    def _score_duplicates(self, linker):
+        def score_duplicates(candidates, data_model, classifier, num_cores):
+            scored = []
+            for ((id_1, record_1), (id_2, record_2)) in candidates:
+                linker.scored += 1
+                same = sum(a == b for (a, b) in zip(record_1['given'], record_2['given']))
+                scored.append(((id_1, id_2), same / max(len(record_1['given']), len(record_2['given']))))
+            return scored
+
+        return score_duplicates
+
+    def _links(self, filename, linker, data_1, data_2):
+        original = link_decisions.scoreDuplicates
+        link_decisions.scoreDuplicates = self._score_duplicates(linker)
+        try:
+            return LinkDecisionStore(filename, 'key').match(linker, data_1, data_2, threshold=0.5)
+        finally:
+            link_decisions.scoreDuplicates = original
+
+    def test_incremental_match(self):
+        data_1 = {'c1': {'given': 'Eino', 'family': 'Heino'}, 'c2': {'given': 'Matti', 'family': 'Virtanen'},
+                  'c3': {'given': 'Eini', 'family': 'Hakala'}}
+        data_2 = {'w1': {'given': 'Eino', 'family': 'Heino'}, 'w2': {'given': 'Matt', 'family': 'Virta'},
+                  'w3': {'given': 'Einar', 'family': 'Heikkinen'}}
+
+        with tempfile.TemporaryDirectory() as directory:
+            store_file = os.path.join(directory, 'decisions.json')
+            self._links(store_file, self.FakeLinker(), data_1, data_2)
+
+            data_1['c2'] = {'given': 'Mattias', 'family': 'Virtanen'}
+            data_2['w3'] = {'given': 'Eini', 'family': 'Heikkinen'}
+            linker = self.FakeLinker()
+            incremental = self._links(store_file, linker, data_1, data_2)
+            full_linker = self.FakeLinker()
+            full = self._links(os.path.join(directory, 'full.json'), full_linker, data_1, data_2)
+
+            self.assertEqual(incremental, full)
+            self.assertEqual(dict(incremental)[('c3', 'w3')], 1.0)
+            self.assertLess(linker.scored, full_linker.scored)
+
+            data_2['w1'] = {'given': 'Eino', 'family': 'Hietala'}
+            linker = self.FakeLinker(index_fields={'given': {'TfidfTextSearchPredicate': []}})
+            self.assertEqual(self._links(store_file, linker, data_1, data_2),
+                             self._links(os.path.join(directory, 'full_2.json'), self.FakeLinker(), data_1, data_2))
+            self.assertEqual(linker.scored, full_linker.scored)
+
+
+class TestUnitIndex(unittest.TestCase):
+
+    def test_candidates(self):
+        units = Graph()
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_1'), SKOS.prefLabel, Literal('JR 8', lang='fi')))
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_1'), SKOS.altLabel, Literal('Jalkaväkirykmentti 8')))
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_1'), SCHEMA_ACTORS.covernumber, Literal('1234')))
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_2'), SKOS.prefLabel, Literal('1./JR 8', lang='fi')))
+
+        index = UnitIndex.from_graph(units)
+        self.assertEqual(index.get_candidates('1./JR 8 Esikunta'), {'results': ['1./JR 8']})
+        self.assertEqual(index.get_candidates('Esikunta JR 8'), {'results': ['JR 8']})
+        self.assertEqual(index.get_candidates('KTR 1234'), {'results': []})
+        self.assertEqual(index.units('1 / jr 8'), ['http://ldf.fi/warsa/actors/actor_2'])
+        self.assertEqual(index.get_candidates('Esikunta'), {'results': []})
+
+
+class TestPNRGazetteer(unittest.TestCase):
+
+    def test_link(self):
+        pnr = Graph()
+        for (place, label, point) in [('P_1', 'Koski', '60.65 23.14'), ('P_2', 'Koski', '61.10 25.75'),
+                                      ('P_3', 'Pietarsaaren mlk', '63.70 22.70')]:
+            pnr.add((URIRef('http://ldf.fi/pnr/' + place), RDF.type, SCHEMA_PNR.place_type_540))
+            pnr.add((URIRef('http://ldf.fi/pnr/' + place), SKOS.prefLabel, Literal(label, lang='fi')))
+            pnr.add((URIRef('http://ldf.fi/pnr/' + place), GEORSS.point, Literal(point)))
+
+        munics = Graph()
+        for (munic, label, point) in [('k1', 'Koski Hl.', '61.09 25.70'), ('k2', 'Pietarsaaren-mlk', None),
+                                      ('k3', 'Koski', None), ('k4', 'Foo', None)]:
+            munics.add((MUNICIPALITIES[munic], RDF.type, SCHEMA_CAS.Municipality))
+            munics.add((MUNICIPALITIES[munic], SKOS.prefLabel, Literal(label, lang='fi')))
+            if point:
+                munics.add((MUNICIPALITIES[munic], GEORSS.point, Literal(point)))
+
+        munics = PNRGazetteer.from_graph(pnr).link(munics, SCHEMA_CAS.current_municipality)
+
+        def links(munic):
+            return sorted(str(uri) for uri in munics.objects(MUNICIPALITIES[munic], SCHEMA_CAS.current_municipality))
+
+        self.assertEqual(links('k1'), ['http://ldf.fi/pnr/P_2'])
+        self.assertEqual(links('k2'), ['http://ldf.fi/pnr/P_3'])
+        self.assertEqual(links('k3'), ['http://ldf.fi/pnr/P_1', 'http://ldf.fi/pnr/P_2'])
+        self.assertEqual(links('k4'), [])
+
+
+class TestLocalServices(unittest.TestCase):
+
+    def setUp(self):
+        units = Graph()
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_1'), RDF.type, URIRef('http://ldf.fi/schema/warsa/Group')))
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_1'), SKOS.prefLabel, Literal('JR 8', lang='fi')))
+        units.add((URIRef('http://ldf.fi/warsa/actors/actor_1'), SCHEMA_ACTORS.covernumber, Literal('1234')))
+        self.services = LocalServices({'http://ldf.fi/warsa/units': units}).start()
+
+    def tearDown(self):
+        self.services.stop()
+
+    def test_units_query(self):
+        with open('SPARQL/units.sparql') as f:
+            query = f.read().replace('<VALUES>', '"JR 8" "8"')
+
+        results = requests.post(self.services.sparql_url, {'query': query}).json()['results']['bindings']
+        self.assertEqual([(r['id']['value'], r['ngram']['value']) for r in results],
+                         [('http://ldf.fi/warsa/actors/actor_1', 'JR 8')])
+
+    def test_arpa(self):
+        url = self.services.arpa_url + '/warsa_casualties_actor_units'
+        self.assertEqual(requests.post(url + '?cgen', {'text': 'JR 8'}).json(), {'results': ['JR 8', 'JR', '8']})
+
+        results = requests.post(url, {'text': '1234'}).json()['results']
+        self.assertEqual([r['id'] for r in results], ['http://ldf.fi/warsa/actors/actor_1'])
+        self.assertEqual(self.services.requests['/arpa/warsa_casualties_actor_units'], 2)
+
+
+class TestReferenceGraphs(unittest.TestCase):
+
+    def setUp(self):
+        self.ranks = Graph()
+        self.ranks.add((RANKS_NS.Korpraali, SKOS.prefLabel, Literal('Korpraali', lang='fi')))
+        self.services = LocalServices({'http://ldf.fi/warsa/ranks': self.ranks}).start()
+
+    def tearDown(self):
+        self.services.stop()
+
+    def _fetch_graph(self, endpoint, graph_name=None):
+        query = 'CONSTRUCT {{ ?s ?p ?o }} WHERE {{ GRAPH <{graph}> {{ ?s ?p ?o }} }}'.format(graph=graph_name)
+        response = requests.post(endpoint, {'query': query}, headers={'Accept': 'application/n-triples'})
+        return Graph().parse(data=response.text, format='nt')
+
+    def test_stored_graph(self):
+        original_fetch = reference_graphs.fetch_graph
+        reference_graphs.fetch_graph = self._fetch_graph
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                endpoint = self.services.sparql_url
+                ReferenceGraphStore(directory).save(endpoint, 'http://ldf.fi/warsa/ranks', self.ranks)
+
+                # Edit a label at the endpoint without changing the number of triples
+                endpoint_ranks = self.services.dataset.get_context(URIRef('http://ldf.fi/warsa/ranks'))
+                endpoint_ranks.set((RANKS_NS.Korpraali, SKOS.prefLabel, Literal('Korpr.', lang='fi')))
+
+                store = ReferenceGraphStore(directory, max_age=3600)
+                graph = store.graph(endpoint, 'http://ldf.fi/warsa/ranks')
+                self.assertEqual(graph.value(RANKS_NS.Korpraali, SKOS.prefLabel), Literal('Korpraali', lang='fi'))
+                self.assertIs(store.graph(endpoint, 'http://ldf.fi/warsa/ranks'), graph)
+                self.assertEqual(self.services.requests['/warsa/sparql'], 0)
+
+                store = ReferenceGraphStore(directory, max_age=0)
+                graph = store.graph(endpoint, 'http://ldf.fi/warsa/ranks')
+                self.assertEqual(graph.value(RANKS_NS.Korpraali, SKOS.prefLabel), Literal('Korpr.', lang='fi'))
+                self.assertEqual(len(graph), 1)
+                self.assertEqual(self.services.requests['/warsa/sparql'], 1)
+        finally:
+            reference_graphs.fetch_graph = original_fetch
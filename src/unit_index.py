@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+In-process candidate generation for unit linking.
+
+The preferred and alternative labels of the Warsa units graph are read once into an inverted index of normalized
+labels. Candidates of a unit literal are its word n-grams that match an indexed label, normalized the same way as the
+unit query (SPARQL/units.sparql) compares labels. Cover numbers are not indexed, as the unit query only matches
+labels, and cover numbers are linked with their own query. Unlike the ARPA service, no LAS base forms are generated.
+"""
+
+import logging
+import re
+
+from rdflib import Graph
+
+import reference_graphs
+from local_services import ngrams
+from namespaces import SKOS
+
+log = logging.getLogger(__name__)
+
+UNITS_GRAPH = 'http://ldf.fi/warsa/units'
+
+# Same as maxNGrams of the ARPA service
+MAX_NGRAMS = 10
+
+LABEL_PROPERTIES = [SKOS.prefLabel, SKOS.altLabel]
+
+RE_IGNORED = re.compile(r'[,./\s]')
+
+
+def normalize_unit_label(label):
+    """
+    Normalize a unit label like the unit query does when comparing labels
+
+    >>> normalize_unit_label('1./JR 8')
+    '1jr8'
+    """
+    return RE_IGNORED.sub('', str(label)).lower()
+
+
+class UnitIndex:
+    """
+    Inverted index of normalized unit labels, with the same candidate interface as ARPA
+    """
+
+    def __init__(self, labels=None, max_ngrams=MAX_NGRAMS):
+        """
+        :param labels: dict of normalized label -> list of unit URIs
+        :param max_ngrams: maximum number of words in a candidate
+        """
+        self.labels = labels or {}
+        self.max_ngrams = max_ngrams
+
+    @classmethod
+    def from_graph(cls, units: Graph, max_ngrams=MAX_NGRAMS):
+        """
+        Build the index from the labels of a units graph
+        """
+        labels = {}
+        for prop in LABEL_PROPERTIES:
+            for (unit, label) in units.subject_objects(prop):
+                uris = labels.setdefault(normalize_unit_label(label), [])
+                if str(unit) not in uris:
+                    uris.append(str(unit))
+
+        labels.pop('', None)
+        for uris in labels.values():
+            uris.sort()
+
+        log.info('Indexed {num} unit labels'.format(num=len(labels)))
+        return cls(labels, max_ngrams=max_ngrams)
+
+    @classmethod
+    def from_endpoint(cls, endpoint, max_ngrams=MAX_NGRAMS):
+        """
+        Build the index from the units graph of a Warsa endpoint
+        """
+        return cls.from_graph(reference_graphs.read_graph(endpoint, UNITS_GRAPH), max_ngrams=max_ngrams)
+
+    def units(self, label):
+        """
+        :return: URIs of the units with the label
+        """
+        return self.labels.get(normalize_unit_label(label), [])
+
+    def get_candidates(self, text):
+        """
+        Get the n-grams of a text that match a unit label, longest first
+
+        :return: dict like the ARPA candidate response
+        """
+        return {'results': [ngram for ngram in ngrams(text, self.max_ngrams) if self.units(ngram)]}